@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Conversation retention (utilities/conversation_archive.py)
+  python archive_conversations.py status      archived months, oldest live row, partitions
+  python archive_conversations.py archive     archive and purge whole months past the retention age
+  python archive_conversations.py partition   range-partition conversations by month (MySQL, off-peak)
+Run archive from a daily cron job; on a partitioned table it also adds the
+upcoming monthly partitions.
+"""
+import argparse
+import json
+import logging
+
+from flask import Flask
+
+from model.config import DB_CONFIG, RETENTION_CONFIG
+from model.models import db
+from utilities.conversation_archive import (
+    add_future_partitions, archive_conversations, archive_status, partition_conversations, partition_names
+)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archive old conversations to monthly gzip JSONL files")
+    parser.add_argument("command", choices=["status", "archive", "partition"], nargs="?", default="status")
+    parser.add_argument("--days", type=int, default=RETENTION_CONFIG['archive_after_days'],
+                        help="Archive whole months that ended more than this many days ago")
+    parser.add_argument("--archive-dir", default=RETENTION_CONFIG['archive_dir'])
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    app = Flask(__name__)
+    app.config.update(DB_CONFIG)
+    db.init_app(app)
+
+    with app.app_context():
+        if args.command == "archive":
+            summary = archive_conversations(
+                db.engine, args.archive_dir, args.days,
+                RETENTION_CONFIG['purge_batch_size'], RETENTION_CONFIG['purge_pause']
+            )
+            for month, counts in summary.items():
+                print(f"  {month}  archived {counts['archived']:>9}  purged {counts['purged']:>9}")
+            print(f"✅ Archived {len(summary)} months" if summary else "✅ Nothing to archive")
+            if partition_names(db.engine):
+                add_future_partitions(db.engine, RETENTION_CONFIG['partitions_ahead'])
+        elif args.command == "partition":
+            added = partition_conversations(db.engine, RETENTION_CONFIG['partitions_ahead'])
+            print(f"✅ Partitions added: {added}" if added else "✅ Partitions up to date")
+        print(json.dumps(archive_status(db.engine, args.archive_dir), indent=2))
+
+
+if __name__ == "__main__":
+    main()
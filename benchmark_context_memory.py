@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""
+Memory footprint of in-memory conversation contexts
+Fills a ContextStore with N active users, each with a few exchanges, using the
+original dict/list/ISO-string layout and the slotted ConversationContext records,
+and reports bytes per context measured with tracemalloc
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from datetime import datetime
+from typing import Callable, Dict
+
+from model.config import CONTEXT_CONFIG
+from utilities.context_backends import MemoryContextBackend
+from utilities.context_manager import ContextManager
+from utilities.context_store import ContextStore
+
+MESSAGE = "hola quiero cotizar gps para mi camioneta"
+RESPONSE = "¡Excelente! Te puedo ayudar con una cotización de GPS."
+INTENT = "cotizacion_gps"
+
+
+def fill_original(users: int, exchanges: int) -> ContextStore:
+    """The original layout: one dict per context, a re-sliced list of history dicts"""
+    contexts = ContextStore(max_entries=users)
+    for i in range(users):
+        user_id, channel = f"52155{i:08d}", "whatsapp"
+        key = f"{user_id}_{channel}"
+        context = {
+            "user_id": user_id,
+            "channel": channel,
+            "current_intent": None,
+            "conversation_history": [],
+            "quote_data": {},
+            "last_activity": datetime.now(),
+            "step": 0
+        }
+        contexts[key] = context
+        for _ in range(exchanges):
+            context["current_intent"] = INTENT
+            context["last_activity"] = datetime.now()
+            context["conversation_history"].append({
+                "timestamp": datetime.now().isoformat(),
+                "message": MESSAGE,
+                "intent": INTENT,
+                "response": RESPONSE
+            })
+            if len(context["conversation_history"]) > 10:
+                context["conversation_history"] = context["conversation_history"][-10:]
+    return contexts
+
+
+def fill_slotted(users: int, exchanges: int) -> ContextManager:
+    """The current layout, through ContextManager.update_context"""
+    manager = ContextManager(MemoryContextBackend(max_entries=users))
+    for i in range(users):
+        for _ in range(exchanges):
+            manager.update_context(f"52155{i:08d}", "whatsapp", MESSAGE, INTENT, RESPONSE)
+    return manager
+
+
+def measure(fill: Callable, users: int, exchanges: int) -> Dict:
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    holder = fill(users, exchanges)
+    seconds = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del holder
+    return {"bytes_per_context": current // users, "total_mb": round(current / 1024 / 1024, 1),
+            "fill_seconds": round(seconds, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes per in-memory conversation context")
+    parser.add_argument("--users", type=int, default=100_000, help="Active users to simulate")
+    parser.add_argument("--exchanges", type=int, nargs="+", default=[1, 3, CONTEXT_CONFIG['max_context_length']],
+                        help="Messages per user")
+    args = parser.parse_args()
+
+    print(f"{args.users} active users")
+    for exchanges in args.exchanges:
+        original = measure(fill_original, args.users, exchanges)
+        slotted = measure(fill_slotted, args.users, exchanges)
+        saved = 1 - slotted["bytes_per_context"] / original["bytes_per_context"]
+        print(f"  {exchanges:>2} exchanges: {original['bytes_per_context']} -> {slotted['bytes_per_context']} "
+              f"bytes/context ({original['total_mb']} -> {slotted['total_mb']} MB, {saved:.0%} saved)")
+
+
+if __name__ == "__main__":
+    main()
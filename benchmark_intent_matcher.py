@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for ContextManager.get_intent
+Checks that the compiled IntentMatcher returns exactly the same (intent, confidence)
+as the original per-intent re.findall loop on dataset text, perturbed variants and
+synthetic keyword-heavy messages, and compares per-message latency
+"""
+import argparse
+import json
+import random
+import re
+import sys
+import time
+from typing import Callable, List, Tuple
+
+from benchmark_system import perturb
+from utilities.classifier import DATASET_PATH
+from utilities.context_manager import GPS_CONTROL_KEYWORDS, INTENT_PATTERNS, INTENT_MATCHER
+
+
+def reference_get_intent(message: str) -> Tuple[str, float]:
+    """The original get_intent: every pattern and every keyword rescanned per intent"""
+    message_lower = message.lower()
+    best_intent = "general"
+    best_score = 0.0
+
+    for intent, patterns in INTENT_PATTERNS.items():
+        score = 0
+        pattern_matches = 0
+
+        for pattern in patterns:
+            matches = len(re.findall(pattern, message_lower))
+            if matches > 0:
+                pattern_matches += 1
+                score += matches
+
+        keyword_matches = sum(1 for keyword in GPS_CONTROL_KEYWORDS
+                              if keyword in message_lower)
+
+        if pattern_matches > 0:
+            confidence = min(0.9, (score + keyword_matches * 0.1) / len(patterns))
+            if confidence > best_score:
+                best_score = confidence
+                best_intent = intent
+
+    return best_intent, best_score
+
+
+def compiled_get_intent(message: str) -> Tuple[str, float]:
+    return INTENT_MATCHER.get_intent(message.lower())
+
+
+def build_corpus(synthetic: int, seed: int) -> List[str]:
+    """Dataset inputs, answers and suggestions, their perturbations and synthetic mixes"""
+    rng = random.Random(seed)
+    with open(DATASET_PATH, encoding="utf-8") as f:
+        dataset = json.load(f)
+
+    texts = []
+    for item in dataset:
+        texts.append(item.get("input", ""))
+        texts.append(item.get("answer", ""))
+        texts.extend(item.get("suggested_responses", []))
+    texts += [perturb(text, rng) for text in texts if text]
+
+    # Overlapping triggers, repeated keywords and line breaks stress the match counting
+    fragments = GPS_CONTROL_KEYWORDS + [
+        pattern.replace(".*", " ").replace("[ar|ación]", rng.choice(["ar", "a", "|"]))
+        for patterns in INTENT_PATTERNS.values() for pattern in patterns
+    ]
+    for _ in range(synthetic):
+        words = rng.choices(fragments, k=rng.randint(1, 8))
+        texts.append(rng.choice([" ", "\n", " y ", ""]).join(words))
+    return texts
+
+
+def time_per_message(get_intent: Callable, corpus: List[str], repeat: int) -> float:
+    """Best-of-repeat mean microseconds per message"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for message in corpus:
+            get_intent(message)
+        best = min(best, time.perf_counter() - start)
+    return best / len(corpus) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parity and speed of the compiled intent matcher")
+    parser.add_argument("--synthetic", type=int, default=5000, help="Synthetic messages to add")
+    parser.add_argument("--repeat", type=int, default=5, help="Timed passes (best is reported)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    corpus = build_corpus(args.synthetic, args.seed)
+
+    mismatches = [
+        (message, expected, actual) for message in corpus
+        for expected, actual in [(reference_get_intent(message), compiled_get_intent(message))]
+        if expected != actual
+    ]
+    matched = sum(1 for message in corpus if reference_get_intent(message)[0] != "general")
+    print(f"Messages: {len(corpus)} ({matched} with an intent)")
+    print(f"Identical (intent, confidence): {len(corpus) - len(mismatches)}/{len(corpus)}")
+    for message, expected, actual in mismatches[:10]:
+        print(f"  ❌ {message[:60]!r}: {expected} != {actual}")
+
+    reference_us = time_per_message(reference_get_intent, corpus, args.repeat)
+    compiled_us = time_per_message(compiled_get_intent, corpus, args.repeat)
+    print(f"Original loop:    {reference_us:.2f} µs/message")
+    print(f"Compiled matcher: {compiled_us:.2f} µs/message ({reference_us / compiled_us:.1f}x)")
+
+    if mismatches:
+        sys.exit(1)
+    print("\n✅ Confidences identical")
+
+
+if __name__ == "__main__":
+    main()
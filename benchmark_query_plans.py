@@ -0,0 +1,184 @@
+#!/usr/bin/env python3
+"""
+EXPLAIN check for dashboard and hot-path queries
+Seeds conversations with a few million rows, applies the schema migrations
+(including the rollup rebuild) and checks that every query below is answered
+from an index (no full table scan or filesort) on SQLite or MySQL, reporting
+each plan and its latency
+"""
+import argparse
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List
+
+from flask import Flask
+from sqlalchemy import and_, func, insert, or_, select, text
+
+from model.config import DB_CONFIG
+from model.migrations import apply_migrations
+from model.models import db, Conversation, ConversationRollup, IntentRollup, UserContext
+from model.rollups import ALL_CHANNELS, EPOCH, bucket_start, rebuild_rollups
+
+CHANNELS = ["whatsapp", "messenger", "web"]
+INTENTS = ["cotizacion_gps", "informacion_camaras", "soporte_tecnico", "precios", "saludo", "contacto",
+           "chatgpt_fallback", "general"] + [f"dataset_{i}" for i in range(40)]
+
+
+# Queries whose ORDER BY sorts a handful of rollup rows (one per intent), not table rows
+SORTS_GROUPS = {"rollup intents (dashboard, /api/stats)"}
+# Queries that must read every row, so a full scan of a covering index is the best plan
+READS_ALL = set()
+TABLES = ("conversations", "user_context", "conversation_rollups", "intent_rollups")
+
+
+def hot_queries(sample_user: str) -> Dict[str, Callable]:
+    """The statements main.py issues, built the same way"""
+    deep_page = datetime.now() - timedelta(days=150)  # A cursor far back in history
+
+    def keyset(created_at):
+        return and_(Conversation.created_at <= created_at,
+                    or_(Conversation.created_at < created_at, Conversation.id < 1))
+
+    return {
+        "recent history (get_recent_conversations)": lambda: Conversation.query.filter_by(
+            user_id=sample_user, channel="whatsapp"
+        ).order_by(Conversation.created_at.desc()).limit(5).statement,
+        "recent conversations (dashboard)": lambda: Conversation.query.order_by(
+            Conversation.created_at.desc()
+        ).limit(10).statement,
+        "conversation page (/api/conversations)": lambda: Conversation.query.filter(
+            Conversation.created_at.isnot(None), keyset(deep_page)
+        ).order_by(Conversation.created_at.desc(), Conversation.id.desc()).limit(51).statement,
+        "channel page (/api/conversations)": lambda: Conversation.query.filter(
+            Conversation.created_at.isnot(None), Conversation.channel == "web", keyset(deep_page)
+        ).order_by(Conversation.created_at.desc(), Conversation.id.desc()).limit(51).statement,
+        "intent page (/api/conversations)": lambda: Conversation.query.filter(
+            Conversation.created_at.isnot(None), Conversation.intent == "precios", keyset(deep_page)
+        ).order_by(Conversation.created_at.desc(), Conversation.id.desc()).limit(51).statement,
+        "rollup totals (dashboard, /api/stats)": lambda: ConversationRollup.query.filter(
+            ConversationRollup.period == 'all', ConversationRollup.bucket == EPOCH
+        ).statement,
+        "rollup today (dashboard, /api/stats)": lambda: ConversationRollup.query.filter_by(
+            period='day', bucket=bucket_start('day', datetime.now()), channel=ALL_CHANNELS
+        ).limit(1).statement,
+        "rollup hourly series (/api/stats)": lambda: ConversationRollup.query.filter(
+            ConversationRollup.period == 'hour', ConversationRollup.channel == ALL_CHANNELS,
+            ConversationRollup.bucket >= datetime.now() - timedelta(hours=24)
+        ).order_by(ConversationRollup.bucket).statement,
+        "rollup intents (dashboard, /api/stats)": lambda: IntentRollup.query.filter_by(
+            period='all', bucket=EPOCH, channel=ALL_CHANNELS
+        ).order_by(IntentRollup.count.desc()).statement,
+        "persisted context lookup": lambda: UserContext.query.filter(
+            UserContext.user_id == sample_user, UserContext.channel == "whatsapp",
+            UserContext.expires_at >= datetime.now()
+        ).order_by(UserContext.id.desc()).limit(1).statement,
+        "expired contexts (bulk delete)": lambda: select(UserContext.id).where(
+            UserContext.expires_at < datetime.now()
+        ),
+    }
+
+
+def seed(rows: int, users: int, batch: int = 50000):
+    """Fill conversations (and a slice of user_context) with synthetic traffic"""
+    have = db.session.query(func.count(Conversation.id)).scalar()
+    if have >= rows:
+        print(f"conversations already has {have} rows")
+        return
+    rng = random.Random(42)
+    start_at = datetime.now() - timedelta(days=180)
+    print(f"Seeding {rows - have} conversations...")
+    for offset in range(have, rows, batch):
+        chunk = [{
+            "user_id": f"52155{rng.randrange(users):08d}",
+            "channel": rng.choice(CHANNELS),
+            "message": "hola quiero cotizar gps",
+            "response": "¡Excelente! Te puedo ayudar con una cotización de GPS.",
+            "intent": rng.choice(INTENTS),
+            "confidence": 0.8,
+            "created_at": start_at + timedelta(seconds=(offset + i) * 180 * 86400 // rows)
+        } for i in range(min(batch, rows - offset))]
+        db.session.execute(insert(Conversation), chunk)
+        db.session.commit()
+    contexts = [{
+        "user_id": f"52155{i:08d}", "channel": "whatsapp", "context_data": {},
+        "expires_at": datetime.now() + timedelta(minutes=rng.randint(-60, 60))
+    } for i in range(min(users, 100000))]
+    db.session.execute(insert(UserContext), contexts)
+    db.session.commit()
+    with db.engine.begin() as conn:
+        rebuild_rollups(conn)
+    db.session.execute(text("ANALYZE" if db.engine.dialect.name == "sqlite" else "ANALYZE TABLE conversations"))
+    db.session.commit()
+
+
+def explain(statement) -> List[str]:
+    """Plan lines for a statement, with literal parameters inlined"""
+    dialect = db.engine.dialect
+    sql = str(statement.compile(dialect=dialect, compile_kwargs={"literal_binds": True}))
+    if dialect.name == "sqlite":
+        return [row[-1] for row in db.session.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    rows = db.session.execute(text(f"EXPLAIN {sql}")).mappings().all()
+    return [f"{row['table']}: type={row['type']} key={row['key']} extra={row['Extra']}" for row in rows]
+
+
+def uses_index(plan: List[str], dialect: str, sorts_groups: bool = False, reads_all: bool = False) -> bool:
+    """
+    Every table read goes through an index, rows are never sorted outside one, and
+    only whole-table aggregates walk an entire index
+    """
+    if dialect == "sqlite":
+        table_reads = [line for line in plan if line.split(" ")[0] in ("SCAN", "SEARCH")
+                       and line.split(" ")[1] in TABLES]
+        sorts = [line for line in plan if line.startswith("USE TEMP B-TREE")
+                 and not (sorts_groups and line.endswith("ORDER BY"))]
+        full_scans = [line for line in table_reads if line.startswith("SCAN") and "COVERING INDEX" in line]
+        return (all("INDEX" in line or "PRIMARY KEY" in line for line in table_reads) and not sorts
+                and (reads_all or not full_scans))
+    table_reads = [line for line in plan if line.split(":")[0] in TABLES]
+    return all("type=ALL" not in line and "key=None" not in line
+               and (reads_all or "type=index " not in line)
+               and (sorts_groups or ("filesort" not in line and "temporary" not in line))
+               for line in table_reads)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check that hot queries use indexes")
+    parser.add_argument("--database-url", default="sqlite:////tmp/gps_query_plans.db",
+                        help="Database to seed and check (use a scratch database)")
+    parser.add_argument("--rows", type=int, default=2_000_000, help="Conversations to seed")
+    parser.add_argument("--users", type=int, default=200_000, help="Distinct senders")
+    args = parser.parse_args()
+
+    app = Flask(__name__)
+    app.config.update({**DB_CONFIG, "SQLALCHEMY_DATABASE_URI": args.database_url})
+    db.init_app(app)
+
+    failures = 0
+    with app.app_context():
+        db.create_all()
+        apply_migrations(db.engine)
+        seed(args.rows, args.users)
+        dialect = db.engine.dialect.name
+
+        for name, build in hot_queries("5215500000042").items():
+            statement = build()
+            plan = explain(statement)
+            start = time.perf_counter()
+            db.session.execute(statement).all()
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            ok = uses_index(plan, dialect, name in SORTS_GROUPS, name in READS_ALL)
+            failures += not ok
+            print(f"{'✅' if ok else '❌'} {name}: {elapsed_ms:.1f} ms")
+            for line in plan:
+                print(f"     {line}")
+
+    if failures:
+        print(f"\n❌ {failures} queries without an index")
+        sys.exit(1)
+    print("\n✅ Every query uses an index")
+
+
+if __name__ == "__main__":
+    main()
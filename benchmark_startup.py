@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""
+Startup time report for main.py
+Imports the app under `python -X importtime` in eager and lazy startup modes and
+reports total import time, the heaviest top-level imports and the latency of the
+first classification, saved as JSON next to the benchmark_system.py results
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List
+
+from benchmark_system import RESULTS_DIR, git_commit
+
+ROOT = Path(__file__).parent
+
+MODES = {
+    "eager": {"LAZY_STARTUP": "false"},
+    "lazy": {"LAZY_STARTUP": "true"}
+}
+
+HEAVY_MODULES = ("sklearn", "scipy.sparse", "numpy", "openai", "aiohttp", "uvicorn", "asgiref.wsgi", "eventlet")
+
+# Imports main, then times the first message; printed as JSON on stdout
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+loaded = [name for name in {HEAVY_MODULES!r} if name in sys.modules]
+main.classify_message("hola quiero cotizar gps")
+print(json.dumps({{"import_s": imported - start, "first_classification_s": time.perf_counter() - imported,
+                  "loaded": loaded}}))
+"""
+
+
+def parse_importtime(stderr: str) -> List[Dict]:
+    """Every import in completion order, with its nesting depth and self/cumulative microseconds"""
+    modules = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        head, cumulative_us, name = line.split("|")
+        indent = len(name) - len(name.lstrip())
+        modules.append({
+            "module": name.strip(),
+            "depth": (indent - 1) // 2,
+            "self_us": int(head.split(":")[1]),
+            "cumulative_us": int(cumulative_us.strip())
+        })
+    return modules
+
+
+def run_mode(env_overrides: Dict[str, str], runs: int) -> Dict:
+    """Median timings over several fresh interpreters"""
+    env = {**os.environ, "DATABASE_URL": os.environ.get("DATABASE_URL", "sqlite:////tmp/gps_benchmark.db"),
+           **env_overrides}
+    samples, breakdown = [], None
+    for _ in range(runs):
+        proc = subprocess.run([sys.executable, "-X", "importtime", "-c", PROBE], cwd=ROOT, env=env,
+                              capture_output=True, text=True, check=True)
+        samples.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        breakdown = parse_importtime(proc.stderr)
+
+    # importtime lists children before their parent: main's imports are the nested lines above it
+    main_pos = next(pos for pos, m in enumerate(breakdown) if m["module"] == "main")
+    main_children = []
+    for m in reversed(breakdown[:main_pos]):
+        if m["depth"] == 0:
+            break
+        if m["depth"] == 1:
+            main_children.append(m)
+    heaviest = sorted(main_children, key=lambda m: -m["cumulative_us"])
+    return {
+        "import_ms": round(statistics.median(s["import_s"] for s in samples) * 1000, 1),
+        "first_classification_ms": round(
+            statistics.median(s["first_classification_s"] for s in samples) * 1000, 1),
+        "main_importtime_ms": round(breakdown[main_pos]["cumulative_us"] / 1000, 1),
+        "heaviest_imports": [
+            {"module": m["module"], "cumulative_ms": round(m["cumulative_us"] / 1000, 1)} for m in heaviest[:10]
+        ],
+        "heavy_modules_loaded": {name: name in samples[-1]["loaded"] for name in HEAVY_MODULES}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare eager and lazy startup import times")
+    parser.add_argument("--runs", type=int, default=5, help="Fresh interpreters per mode")
+    parser.add_argument("--output", help="Results file (default benchmark_results/startup-<commit>.json)")
+    args = parser.parse_args()
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": sys.version.split()[0],
+        "runs": args.runs,
+        "modes": {mode: run_mode(env, args.runs) for mode, env in MODES.items()}
+    }
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"startup-{results['commit'] or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    for mode, result in results["modes"].items():
+        print(f"{mode:>5}: import {result['import_ms']} ms, first classification "
+              f"{result['first_classification_ms']} ms")
+        for module in result["heaviest_imports"][:5]:
+            print(f"         {module['module']:<28} {module['cumulative_ms']} ms")
+        skipped = [name for name, loaded in result["heavy_modules_loaded"].items() if not loaded]
+        print(f"         not imported at startup: {', '.join(skipped) or 'none'}")
+    print(f"\n✅ Results saved to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,312 @@
+#!/usr/bin/env python3
+"""
+Benchmark the GPS Control message pipeline
+Replays dataset inputs, perturbed variants and exported conversations through
+classify_message, analyze_intent and the get_enhanced_chatbot_response routing
+decision (OpenAI and database writes stubbed), and saves latency percentiles,
+throughput, memory, accuracy and tier shares as JSON so runs can be compared
+across commits
+"""
+import argparse
+import asyncio
+import csv
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import time
+import tracemalloc
+import unicodedata
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+# main.py creates its tables on import; default to a throwaway SQLite database
+os.environ.setdefault("DATABASE_URL", "sqlite:////tmp/gps_benchmark.db")
+
+RESULTS_DIR = Path(__file__).parent / "benchmark_results"
+TIERS = ("classifier", "context", "openai")
+STUB_OPENAI_RESPONSE = "Respuesta simulada de ChatGPT"
+
+# Filler words users wrap around the same question
+FILLERS = ["hola", "oye", "por favor", "una pregunta", "buenas"]
+
+
+def perturb(text: str, rng: random.Random) -> str:
+    """Realistic variant of a dataset input: typo, accents, casing or filler words"""
+    kind = rng.choice(["typo_swap", "typo_drop", "strip_accents", "upper", "filler", "punctuation"])
+    if kind in ("typo_swap", "typo_drop") and len(text) > 4:
+        pos = rng.randrange(1, len(text) - 2)
+        if kind == "typo_swap":
+            return text[:pos] + text[pos + 1] + text[pos] + text[pos + 2:]
+        return text[:pos] + text[pos + 1:]
+    if kind == "strip_accents":
+        return "".join(c for c in unicodedata.normalize("NFD", text) if unicodedata.category(c) != "Mn")
+    if kind == "upper":
+        return text.upper()
+    if kind == "filler":
+        return f"{rng.choice(FILLERS)} {text}"
+    return f"¿{text}?"
+
+
+def load_conversations(path: str) -> List[str]:
+    """
+    User messages from an exported conversations file: the /api/conversations JSON,
+    a JSON list of rows, NDJSON, or CSV with a `message` column
+    """
+    path = Path(path)
+    if path.suffix == ".csv":
+        with open(path, newline="", encoding="utf-8") as f:
+            return [row["message"] for row in csv.DictReader(f) if row.get("message")]
+
+    with open(path, encoding="utf-8") as f:
+        raw = f.read()
+    try:
+        data = json.loads(raw)
+        rows = data.get("conversations", []) if isinstance(data, dict) else data
+    except json.JSONDecodeError:
+        rows = [json.loads(line) for line in raw.splitlines() if line.strip()]
+    return [row["message"] for row in rows if row.get("message")]
+
+
+def build_corpora(dataset: List[Dict], perturbations: int, conversations_path: Optional[str],
+                  seed: int) -> Dict[str, List[Dict]]:
+    """Messages to replay, grouped by source, each with its expected intent when known"""
+    rng = random.Random(seed)
+    corpora = {
+        "dataset": [{"message": item["input"], "expected": item.get("intention", "general")}
+                    for item in dataset],
+        "perturbed": [{"message": perturb(item["input"], rng), "expected": item.get("intention", "general")}
+                      for item in dataset for _ in range(perturbations)]
+    }
+    if conversations_path:
+        corpora["conversations"] = [{"message": message, "expected": None}
+                                    for message in load_conversations(conversations_path)]
+    return corpora
+
+
+def latency_summary(samples_ns: List[int]) -> Dict:
+    """Latency percentiles in milliseconds and messages per second"""
+    if not samples_ns:
+        return {"count": 0}
+    samples_ms = np.asarray(samples_ns, dtype=np.float64) / 1e6
+    total_s = samples_ms.sum() / 1e3
+    return {
+        "count": len(samples_ms),
+        "mean_ms": round(float(samples_ms.mean()), 4),
+        "p50_ms": round(float(np.percentile(samples_ms, 50)), 4),
+        "p95_ms": round(float(np.percentile(samples_ms, 95)), 4),
+        "p99_ms": round(float(np.percentile(samples_ms, 99)), 4),
+        "max_ms": round(float(samples_ms.max()), 4),
+        "msgs_per_sec": round(len(samples_ms) / total_s, 1) if total_s else None
+    }
+
+
+def replay(stage: Callable, messages: List[Dict], repeat: int) -> Dict:
+    """Time stage(message) for every message, repeat times; returns summary and last outputs"""
+    samples, outputs = [], []
+    for _ in range(repeat):
+        outputs = []
+        for item in messages:
+            start = time.perf_counter_ns()
+            outputs.append(stage(item["message"]))
+            samples.append(time.perf_counter_ns() - start)
+    return {"latency": latency_summary(samples), "outputs": outputs}
+
+
+def accuracy(messages: List[Dict], intents: List[str]) -> Optional[float]:
+    """Share of messages with a known expected intent that were classified to it"""
+    scored = [(item["expected"], intent) for item, intent in zip(messages, intents) if item["expected"]]
+    if not scored:
+        return None
+    return round(sum(expected == intent for expected, intent in scored) / len(scored), 4)
+
+
+class RoutingProbe:
+    """Runs get_enhanced_chatbot_response with OpenAI and database writes stubbed, recording the tier"""
+
+    def __init__(self, app_module):
+        self.app = app_module
+        self.tier = None
+        self.loop = asyncio.new_event_loop()
+
+        classify = app_module.classify_message
+        contextual = app_module.get_contextual_response
+
+        def classify_message(*args, **kwargs):
+            self.tier = "classifier"
+            return classify(*args, **kwargs)
+
+        def get_contextual_response(*args, **kwargs):
+            self.tier = "context"
+            return contextual(*args, **kwargs)
+
+        async def get_chatgpt_with_gps_context(user_message, user_id, channel):
+            self.tier = "openai"
+            return STUB_OPENAI_RESPONSE
+
+        async def save_conversation(*args, **kwargs):
+            return None
+
+        app_module.classify_message = classify_message
+        app_module.get_contextual_response = get_contextual_response
+        app_module.get_chatgpt_with_gps_context = get_chatgpt_with_gps_context
+        app_module.save_conversation = save_conversation
+
+    def route(self, message: str, user_id: str = "benchmark_user") -> str:
+        self.tier = None
+        self.loop.run_until_complete(self.app.get_enhanced_chatbot_response(message, user_id, "web"))
+        return self.tier
+
+
+def peak_memory(stage: Callable, messages: List[Dict]) -> float:
+    """Peak Python heap allocated while replaying messages once, in MB (untimed pass)"""
+    tracemalloc.start()
+    for item in messages:
+        stage(item["message"])
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return round(peak / 1024 / 1024, 3)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True, cwd=Path(__file__).parent).stdout.strip()
+    except Exception:
+        return None
+
+
+def max_rss_mb() -> float:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / 1024 / 1024 if platform.system() == "Darwin" else rss / 1024, 1)
+
+
+def compare(current: Dict, baseline_path: str):
+    """Print p50/p95 and throughput deltas against a previous results file"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    for stage, corpora in current["stages"].items():
+        for corpus, result in corpora.items():
+            before = baseline.get("stages", {}).get(stage, {}).get(corpus, {}).get("latency")
+            after = result["latency"]
+            if not before or not before.get("count"):
+                continue
+            print(f"  {stage:<16} {corpus:<13} "
+                  f"p50 {before['p50_ms']:.3f} -> {after['p50_ms']:.3f} ms, "
+                  f"p95 {before['p95_ms']:.3f} -> {after['p95_ms']:.3f} ms, "
+                  f"{before['msgs_per_sec']} -> {after['msgs_per_sec']} msg/s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark classifier, intent analysis and routing")
+    parser.add_argument("--conversations", help="Exported conversations (JSON, NDJSON or CSV)")
+    parser.add_argument("--perturbations", type=int, default=3, help="Perturbed variants per dataset input")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes over each corpus")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for perturbations")
+    parser.add_argument("--with-cache", action="store_true",
+                        help="Keep response caches enabled (default measures uncached work)")
+    parser.add_argument("--output", help="Results file (default benchmark_results/<commit>.json)")
+    parser.add_argument("--compare", help="Previous results file to diff against")
+    args = parser.parse_args()
+
+    rss_start = max_rss_mb()
+    start = time.perf_counter()
+    import main as app_module
+    from utilities.classifier import gps_classifier, classify_message
+    from utilities.context_manager import context_manager, analyze_intent
+    import_seconds = time.perf_counter() - start
+
+    # Per-message logging would dominate the timings
+    logging.disable(logging.INFO)
+
+    if not args.with_cache:
+        gps_classifier.response_cache.max_entries = 0
+        context_manager.response_cache.max_entries = 0
+
+    corpora = build_corpora(gps_classifier.dataset, args.perturbations, args.conversations, args.seed)
+    probe = RoutingProbe(app_module)
+
+    stages = {
+        "classify_message": classify_message,
+        "analyze_intent": analyze_intent,
+        "routing": probe.route
+    }
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(),
+        "python": platform.python_version(),
+        "dataset_version": gps_classifier.dataset_version,
+        "config": {
+            "perturbations": args.perturbations,
+            "repeat": args.repeat,
+            "seed": args.seed,
+            "with_cache": args.with_cache,
+            "retrieval": gps_classifier.retrieval,
+            "typo_tolerance": gps_classifier.typo_tolerance
+        },
+        "corpora": {name: len(messages) for name, messages in corpora.items()},
+        "stages": {},
+        "accuracy": {},
+        "routing": {},
+        "memory": {}
+    }
+
+    for stage_name, stage in stages.items():
+        # Warm up code paths and lazily built structures before timing
+        for item in corpora["dataset"][:20]:
+            stage(item["message"])
+
+        results["stages"][stage_name] = {}
+        for corpus, messages in corpora.items():
+            run = replay(stage, messages, args.repeat)
+            results["stages"][stage_name][corpus] = {"latency": run["latency"]}
+
+            if stage_name == "classify_message":
+                results["accuracy"][corpus] = accuracy(messages, [intent for _, intent, _ in run["outputs"]])
+            elif stage_name == "routing":
+                tiers = run["outputs"]
+                results["routing"][corpus] = {
+                    tier: round(tiers.count(tier) / len(tiers), 4) if tiers else 0.0 for tier in TIERS
+                }
+
+        all_messages = [item for messages in corpora.values() for item in messages]
+        results["memory"][f"{stage_name}_peak_mb"] = peak_memory(stage, all_messages)
+
+    results["memory"].update({
+        "import_seconds": round(import_seconds, 3),
+        "rss_at_start_mb": rss_start,
+        "max_rss_mb": max_rss_mb(),
+        "classifier_index": gps_classifier.snapshot.size_stats()
+    })
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{results['commit'] or 'local'}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, ensure_ascii=False)
+
+    print(f"Corpora: {results['corpora']}")
+    for stage_name, corpora_results in results["stages"].items():
+        for corpus, result in corpora_results.items():
+            latency = result["latency"]
+            print(f"  {stage_name:<16} {corpus:<13} p50 {latency['p50_ms']:.3f} ms  "
+                  f"p95 {latency['p95_ms']:.3f} ms  p99 {latency['p99_ms']:.3f} ms  "
+                  f"{latency['msgs_per_sec']} msg/s")
+    print(f"Accuracy: {results['accuracy']}")
+    print(f"Routing tiers: {results['routing']}")
+    print(f"Max RSS: {results['memory']['max_rss_mb']} MB")
+    print(f"\n✅ Results saved to {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+"""
+Compile the GPS Control dataset into the prebuilt classifier index
+Run at deploy time (or after editing utilities/dataset_gpscontrol.json) so workers
+memory-map the artifact on startup instead of refitting TF-IDF
+"""
+import argparse
+import time
+
+from utilities.classifier import GPSControlClassifier, DATASET_PATH
+from utilities.index_artifact import DEFAULT_INDEX_DIR, artifact_path
+
+parser = argparse.ArgumentParser(description="Build the classifier index artifact")
+parser.add_argument("--dataset", default=str(DATASET_PATH), help="Dataset JSON file")
+parser.add_argument("--index-dir", default=str(DEFAULT_INDEX_DIR), help="Artifact output directory")
+args = parser.parse_args()
+
+start = time.perf_counter()
+# Importing utilities.classifier does not build its global classifier: only this dataset is indexed
+classifier = GPSControlClassifier(dataset_path=args.dataset, index_dir=args.index_dir)
+index = classifier.index
+if index is None:
+    raise SystemExit("❌ No dataset entries to index")
+
+print(f"Dataset: {args.dataset} ({len(classifier.dataset)} entries)")
+print(f"Index version: {index.version}")
+print(f"Vocabulary: {index.n_features} terms, matrix nnz: {index.matrix.nnz}")
+print(f"Artifact: {artifact_path(args.index_dir, index.fingerprint, classifier.index_prefix)}")
+print(f"\n✅ Classifier index ready in {time.perf_counter() - start:.2f}s")
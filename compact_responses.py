@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Canned-reply compaction of conversations (utilities/response_templates.py)
+  python compact_responses.py report                 reply storage and how much is canned text
+  python compact_responses.py backfill [--optimize]  store existing canned replies as template references
+New conversations are written compacted already; backfill converts history
+written before migration 4. --optimize then rebuilds the table (OPTIMIZE TABLE on
+MySQL, VACUUM on SQLite) so the freed pages are returned: run it off-peak.
+"""
+import argparse
+import json
+import logging
+
+from flask import Flask
+from sqlalchemy import text
+
+from model.config import DB_CONFIG
+from model.models import db
+from utilities.classifier import warmup_classifier
+from utilities.response_templates import backfill_response_templates, response_storage_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Store canned bot replies as template references")
+    parser.add_argument("command", choices=["report", "backfill"], nargs="?", default="report")
+    parser.add_argument("--batch-size", type=int, default=1000, help="Rows per UPDATE transaction")
+    parser.add_argument("--optimize", action="store_true", help="Rebuild the table after the backfill")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    app = Flask(__name__)
+    app.config.update(DB_CONFIG)
+    db.init_app(app)
+    warmup_classifier()
+
+    with app.app_context():
+        before = response_storage_report(db.engine)
+        print(json.dumps(before, indent=2))
+        if args.command == "backfill":
+            counts = backfill_response_templates(db.engine, args.batch_size)
+            print(f"✅ Compacted {counts['compacted']} of {counts['scanned']} replies "
+                  f"({counts['bytes_freed'] / 1e6:.1f} MB of text)")
+            if args.optimize:
+                with db.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+                    conn.execute(text("OPTIMIZE TABLE conversations" if db.engine.dialect.name == "mysql"
+                                      else "VACUUM"))
+            after = response_storage_report(db.engine)
+            print(json.dumps(after, indent=2))
+            if before["table_bytes"] and after["table_bytes"]:
+                print(f"Table size: {before['table_bytes'] / 1e6:.1f} MB -> {after['table_bytes'] / 1e6:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
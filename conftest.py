@@ -0,0 +1,48 @@
+"""
+Shared pytest fixtures
+Every test runs against a throwaway SQLite database with all migrations applied,
+never the database configured in .env
+"""
+import pytest
+from flask import Flask
+
+from model.config import CONTEXT_CONFIG, DB_CONFIG, RETENTION_CONFIG, STARTUP_CONFIG, WRITER_CONFIG
+from model.migrations import apply_migrations
+from model.models import db
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Flask app bound to a fresh SQLite database, inside an app context"""
+    app = Flask(__name__)
+    app.config.update(DB_CONFIG)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{tmp_path / 'chatbot.db'}"
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        apply_migrations(db.engine)
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture(scope="session")
+def main_module(tmp_path_factory):
+    """
+    The application module (main) imported on a SQLite database, with the classifier
+    loaded lazily, no context persistence and spill/archive dirs under tmp
+    """
+    tmp = tmp_path_factory.mktemp("main")
+    mp = pytest.MonkeyPatch()
+    mp.setitem(DB_CONFIG, 'SQLALCHEMY_DATABASE_URI', f"sqlite:///{tmp / 'chatbot.db'}")
+    mp.setitem(CONTEXT_CONFIG, 'backend', 'memory')
+    mp.setitem(CONTEXT_CONFIG, 'persist', False)
+    mp.setitem(WRITER_CONFIG, 'spill_dir', str(tmp / 'spill'))
+    mp.setitem(RETENTION_CONFIG, 'archive_dir', str(tmp / 'archive'))
+    mp.setitem(STARTUP_CONFIG, 'lazy_load', True)
+    mp.setitem(STARTUP_CONFIG, 'create_schema', True)
+    mp.setitem(STARTUP_CONFIG, 'migrations', 'upgrade')
+    import main
+    yield main
+    main.conversation_writer.stop()
+    mp.undo()
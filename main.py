@@ -20,29 +20,43 @@ Features:
 Author: Enhanced for GPS Control by Armaddia
 """
 
-import asyncio
+import atexit
+import base64
+import hmac
 import os
 import json
 import logging
+import threading
 from datetime import datetime, timedelta
-from flask import Flask, request, jsonify, render_template, redirect, url_for, session
+from typing import Dict, List
+from flask import Flask, Response, request, jsonify, render_template, redirect, url_for, session
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload
 from flask_socketio import SocketIO, emit
 from dotenv import load_dotenv
-import aiohttp
-import openai
-from asgiref.wsgi import WsgiToAsgi
-import uvicorn
-import eventlet
 
 # Import our enhanced modules
-from model.config import DB_CONFIG, OPENAI_CONFIG, CONTEXT_CONFIG, GPSCONTROL_CONFIG
-from model.models import (
-    db, User, Seller, Conversation, ChatReport, UserContext, 
-    QuoteService, get_or_create_chat_report, get_or_create_user_context
+# (aiohttp, openai and asgiref are imported on first use: only the transports in use are loaded)
+from model.config import DB_CONFIG, OPENAI_CONFIG, CONTEXT_CONFIG, GPSCONTROL_CONFIG, STARTUP_CONFIG, WRITER_CONFIG, RETENTION_CONFIG, EVENT_LOOP_CONFIG
+from model.models import db, Conversation
+from model.migrations import check_migrations, migration_lock
+from model.rollups import approximate_conversation_count, get_rollup_stats
+from utilities.context_manager import (
+    get_contextual_response, analyze_intent, get_context_store_stats, start_context_sweeper,
+    enable_context_persistence,
+    get_response_cache_stats as get_context_cache_stats
+)
+from utilities.context_backends import HistoryEntry
+from utilities.conversation_writer import ConversationWriter
+from utilities.event_loop import EventLoopWorker
+from utilities.history_cache import create_history_cache
+from utilities.conversation_export import FORMATS as EXPORT_FORMATS, export_stream
+from utilities.conversation_archive import archived_page
+from utilities.classifier import (
+    gps_classifier, classify_message, get_suggested_responses, reload_classifier,
+    warmup_classifier, get_classifier_status, get_response_cache_stats as get_classifier_cache_stats
 )
-from utilities.context_manager import get_contextual_response, analyze_intent
-from utilities.classifier import classify_message, get_suggested_responses
 
 # Load environment variables
 load_dotenv()
@@ -65,8 +79,15 @@ def get_env_var(key, default=None):
 
 # Initialize Flask app with Socket.IO
 app = Flask(__name__)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode='eventlet')
-asgi_app = WsgiToAsgi(app)
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=os.environ.get("SOCKETIO_ASYNC_MODE", "eventlet"))
+
+def __getattr__(name):
+    """Build the ASGI adapter only when a server asks for it (uvicorn main:asgi_app)"""
+    if name == "asgi_app":
+        from asgiref.wsgi import WsgiToAsgi
+        globals()["asgi_app"] = WsgiToAsgi(app)
+        return globals()["asgi_app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Configure Flask app with database settings
 app.config.update(DB_CONFIG)
@@ -75,10 +96,23 @@ app.config['SECRET_KEY'] = get_env_var('SECRET_KEY', 'gps_control_secret_key_202
 # Initialize database
 db.init_app(app)
 
-# Create tables if they don't exist
-with app.app_context():
-    db.create_all()
-    logger.info("Database tables created successfully")
+# Create tables if they don't exist (skipped in lazy startup unless DB_CREATE_ALL is set)
+new_database = False
+if STARTUP_CONFIG['create_schema']:
+    with app.app_context(), migration_lock(db.engine):
+        new_database = not inspect(db.engine).has_table('conversations')
+        db.create_all()
+        logger.info("Database tables created successfully")
+
+# Check versioned schema migrations; they are only applied with DB_MIGRATIONS=upgrade or on a
+# database create_all just built (nothing to rebuild), under a cross-process lock. Existing
+# databases are upgraded with python migrate.py upgrade, not by every worker at import
+schema_status = {"version": None, "pending": None}
+if STARTUP_CONFIG['migrations'] != 'off':
+    with app.app_context():
+        schema_status = check_migrations(
+            db.engine, apply=STARTUP_CONFIG['migrations'] == 'upgrade' or new_database
+        )
 
 # =============================================================================
 # CONFIGURATION
@@ -92,7 +126,49 @@ WHATSAPP_PHONE_NUMBER_ID = get_env_var("WHATSAPP_PHONE_NUMBER_ID")
 
 # OpenAI Configuration
 OPENAI_API_KEY = get_env_var("OPENAI_API_KEY")
-openai.api_key = OPENAI_API_KEY
+
+def get_openai():
+    """Import the OpenAI SDK on first use; only the ChatGPT fallback needs it"""
+    import openai
+    if openai.api_key is None:
+        openai.api_key = OPENAI_API_KEY
+    return openai
+
+def warmup():
+    """Load the classifier index and OpenAI SDK ahead of the first message"""
+    warmup_classifier()
+    get_openai()
+
+# Eager startup: the classifier index is loaded at import (lazy startup warms up in the background from main())
+if not STARTUP_CONFIG['lazy_load']:
+    warmup_classifier()
+
+# Classifier hot reload: shared secret for /api/classifier/reload (disabled without one), optional file watcher
+RELOAD_TOKEN = get_env_var("RELOAD_TOKEN")
+CLASSIFIER_WATCH_INTERVAL = float(get_env_var("CLASSIFIER_WATCH_INTERVAL", "0") or 0)
+if CLASSIFIER_WATCH_INTERVAL > 0:
+    gps_classifier.start_watcher(CLASSIFIER_WATCH_INTERVAL)
+
+# Expire inactive conversation contexts in the background (CONTEXT_SWEEP_INTERVAL seconds)
+start_context_sweeper()
+
+# Latest exchanges per user for the OpenAI prompt, next to the contexts (CONTEXT_BACKEND)
+history_cache = create_history_cache(CONTEXT_CONFIG)
+history_cache.start_sweeper(CONTEXT_CONFIG['sweep_interval'])
+
+# Persist memory-backend contexts to user_context in batches off the reply path (CONTEXT_PERSIST)
+enable_context_persistence(app)
+
+# Conversations are inserted in batches by a background writer, flushed on shutdown
+conversation_writer = ConversationWriter(app, **WRITER_CONFIG)
+conversation_writer.start()
+atexit.register(conversation_writer.stop)
+
+# Coroutines from Flask and Socket.IO handlers run on one long-lived event loop thread
+# (registered after the writer so in-flight replies are queued before it flushes)
+event_loop = EventLoopWorker(app, **EVENT_LOOP_CONFIG)
+event_loop.start()
+atexit.register(event_loop.stop)
 
 # Server Configuration  
 PORT = int(os.environ.get("PORT", 5001))  # Changed to avoid conflict with existing server
@@ -112,9 +188,10 @@ Server: {HOST}:{PORT}
 # OPENAI CHATGPT INTEGRATION
 # =============================================================================
 
-async def get_enhanced_chatbot_response(user_message: str, user_id: str, channel: str = "web") -> str:
+def get_enhanced_chatbot_response(user_message: str, user_id: str, channel: str = "web") -> str:
     """
     Enhanced chatbot response using context management and GPS Control classification
+    Runs in the calling (request or Socket.IO) thread; only the OpenAI request goes to the event loop
     """
     try:
         logger.info(f"Processing message from user {user_id} via {channel}: {user_message}")
@@ -126,7 +203,7 @@ async def get_enhanced_chatbot_response(user_message: str, user_id: str, channel
             logger.info(f"Using GPS Control response (confidence: {gps_confidence:.2f})")
             
             # Save conversation to database
-            await save_conversation(user_id, channel, user_message, gps_response, gps_intent, gps_confidence)
+            save_conversation(user_id, channel, user_message, gps_response, gps_intent, gps_confidence)
             
             return gps_response
         
@@ -139,15 +216,16 @@ async def get_enhanced_chatbot_response(user_message: str, user_id: str, channel
             logger.info(f"Using context response (confidence: {context_confidence:.2f})")
             
             # Save conversation to database
-            await save_conversation(user_id, channel, user_message, context_response, context_intent, context_confidence)
+            save_conversation(user_id, channel, user_message, context_response, context_intent, context_confidence)
             
             return context_response
         
-        # Fallback to enhanced ChatGPT with GPS Control context
-        chatgpt_response = await get_chatgpt_with_gps_context(user_message, user_id, channel)
+        # Fallback to enhanced ChatGPT with GPS Control context (history read here, request on the loop)
+        recent_conversations = get_recent_conversations(user_id, channel)
+        chatgpt_response = event_loop.run(get_chatgpt_with_gps_context(user_message, user_id, recent_conversations))
         
         # Save conversation to database
-        await save_conversation(user_id, channel, user_message, chatgpt_response, "chatgpt_fallback", 0.8)
+        save_conversation(user_id, channel, user_message, chatgpt_response, "chatgpt_fallback", 0.8)
         
         return chatgpt_response
         
@@ -155,14 +233,12 @@ async def get_enhanced_chatbot_response(user_message: str, user_id: str, channel
         logger.error(f"Error in enhanced chatbot response: {e}")
         return "Disculpa, tuve un problema técnico. ¿Podrías repetir tu mensaje? 🤔"
 
-async def get_chatgpt_with_gps_context(user_message: str, user_id: str, channel: str) -> str:
+async def get_chatgpt_with_gps_context(user_message: str, user_id: str, recent_conversations: List[Dict]) -> str:
     """
-    Send user message to ChatGPT with GPS Control context
+    Send user message to ChatGPT with GPS Control context and the user's recent exchanges
     """
+    openai = get_openai()
     try:
-        # Get conversation context
-        recent_conversations = await get_recent_conversations(user_id, channel)
-        
         # Build context-aware prompt
         system_prompt = f"""Eres Machín, el asistente virtual de GPS Control, una empresa mexicana líder en rastreo satelital y seguridad vehicular.
 
@@ -198,14 +274,15 @@ INSTRUCCIONES:
         messages = [{"role": "system", "content": system_prompt}]
         
         if recent_conversations:
-            for conv in recent_conversations[-3:]:  # Last 3 conversations
+            for conv in recent_conversations:  # Latest exchanges, oldest first
                 messages.append({"role": "user", "content": conv['message']})
                 messages.append({"role": "assistant", "content": conv['response']})
         
         messages.append({"role": "user", "content": user_message})
         
-        # Create the chat completion request
-        response = openai.ChatCompletion.create(
+        # Create the chat completion request (async, over the loop's shared HTTP session)
+        openai.aiosession.set(await event_loop.http_session())
+        response = await openai.ChatCompletion.acreate(
             model=OPENAI_CONFIG['model'],
             messages=messages,
             max_tokens=OPENAI_CONFIG['max_tokens'],
@@ -233,54 +310,32 @@ INSTRUCCIONES:
 # DATABASE HELPER FUNCTIONS
 # =============================================================================
 
-async def save_conversation(user_id: str, channel: str, message: str, response: str, intent: str, confidence: float):
-    """Save conversation to database"""
+def save_conversation(user_id: str, channel: str, message: str, response: str, intent: str, confidence: float):
+    """Queue conversation for the background writer and the history ring (no database round trip)"""
     try:
-        # Create new conversation record
-        conversation = Conversation(
-            user_id=user_id,
-            channel=channel,
-            message=message,
-            response=response,
-            intent=intent,
-            confidence=confidence,
-            session_id=f"{user_id}_{channel}_{datetime.now().strftime('%Y%m%d')}"
-        )
-        
-        db.session.add(conversation)
-        
-        # Update or create chat report
-        chat_report = get_or_create_chat_report(user_id, channel)
-        chat_report.message_count += 1
-        chat_report.last_interaction = datetime.now()
-        
-        # Update intent summary
-        if chat_report.intent_summary is None:
-            chat_report.intent_summary = {}
-        
-        if intent in chat_report.intent_summary:
-            chat_report.intent_summary[intent] += 1
-        else:
-            chat_report.intent_summary[intent] = 1
-        
-        db.session.commit()
-        logger.info(f"Conversation saved for user {user_id}")
-        
+        created_at = conversation_writer.submit(user_id, channel, message, response, intent, confidence)
+        history_cache.append(user_id, channel, HistoryEntry(created_at.timestamp(), message, intent, response))
     except Exception as e:
         logger.error(f"Error saving conversation: {e}")
-        db.session.rollback()
 
-async def get_recent_conversations(user_id: str, channel: str, limit: int = 5):
-    """Get recent conversations for context"""
+def load_history(user_id: str, channel: str, before, limit: int):
+    """Latest stored exchanges at or before `before` (epoch seconds, None for the latest), oldest first"""
+    query = Conversation.query.filter_by(user_id=user_id, channel=channel)
+    if before is not None:
+        query = query.filter(Conversation.created_at <= datetime.fromtimestamp(before))
+    conversations = query.order_by(Conversation.created_at.desc()).limit(limit).all()
+    return [HistoryEntry(conv.created_at.timestamp() if conv.created_at else 0.0, conv.message, conv.intent,
+                         conv.to_dict()['response']) for conv in reversed(conversations)]
+
+def get_recent_conversations(user_id: str, channel: str):
+    """Latest exchanges for the prompt, oldest first, from the history ring (database only to fill it)"""
     try:
-        conversations = Conversation.query.filter_by(
-            user_id=user_id,
-            channel=channel
-        ).order_by(
-            Conversation.created_at.desc()
-        ).limit(limit).all()
-        
-        return [conv.to_dict() for conv in conversations]
+        return [{
+            "message": entry.message,
+            "response": entry.response,
+            "intent": entry.intent,
+            "created_at": datetime.fromtimestamp(entry.timestamp).isoformat()
+        } for entry in history_cache.recent(user_id, channel, load_history)]
         
     except Exception as e:
         logger.error(f"Error getting recent conversations: {e}")
@@ -290,15 +345,16 @@ async def get_recent_conversations(user_id: str, channel: str, limit: int = 5):
 # UNIFIED MESSAGE PROCESSING
 # =============================================================================
 
-async def process_message_unified(message_text: str, sender_id: str, channel: str):
+def process_message_unified(message_text: str, sender_id: str, channel: str):
     """
     Unified message processor for all channels (WhatsApp, Messenger, Web)
+    The reply is built in the calling thread; only sending it goes to the event loop
     """
     try:
         logger.info(f"Processing message from {channel} user {sender_id}: '{message_text}'")
         
         # Get enhanced chatbot response with GPS Control context
-        bot_response = await get_enhanced_chatbot_response(message_text, sender_id, channel)
+        bot_response = get_enhanced_chatbot_response(message_text, sender_id, channel)
         
         # Send response based on channel
         if channel == 'web':
@@ -311,12 +367,12 @@ async def process_message_unified(message_text: str, sender_id: str, channel: st
             return True
         else:
             # Try to send to WhatsApp or Messenger
-            success = await send_message_async(channel, sender_id, bot_response)
+            success = event_loop.run(send_message_async(channel, sender_id, bot_response))
             
             # If WhatsApp fails, try template message for re-engagement
             if not success and channel == 'whatsapp':
                 logger.info(f"Attempting template message for WhatsApp re-engagement to {sender_id}")
-                template_success = await send_whatsapp_template_message(sender_id)
+                template_success = event_loop.run(send_whatsapp_template_message(sender_id))
                 if template_success:
                     logger.info(f"Template message sent successfully to {sender_id}")
                     return True
@@ -374,17 +430,17 @@ async def send_whatsapp_template_message(recipient_id: str, template_name: str =
     }
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=payload, timeout=15) as response:
-                if response.status == 200:
-                    response_json = await response.json()
-                    logger.info(f"WhatsApp template sent to {recipient_id}: {response_json}")
-                    return True
-                else:
-                    error_text = await response.text()
-                    logger.error(f"WhatsApp template error {response.status}: {error_text}")
-                    return False
-                    
+        session = await event_loop.http_session()
+        async with session.post(url, headers=headers, json=payload, timeout=15) as response:
+            if response.status == 200:
+                response_json = await response.json()
+                logger.info(f"WhatsApp template sent to {recipient_id}: {response_json}")
+                return True
+            else:
+                error_text = await response.text()
+                logger.error(f"WhatsApp template error {response.status}: {error_text}")
+                return False
+                
     except Exception as e:
         logger.error(f"WhatsApp template send error: {e}")
         return False
@@ -411,33 +467,33 @@ async def send_whatsapp_message(recipient_id: str, message: str) -> bool:
     }
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, headers=headers, json=payload, timeout=15) as response:
-                if response.status == 200:
-                    response_json = await response.json()
-                    logger.info(f"WhatsApp message sent to {recipient_id}: {response_json}")
-                    return True
-                else:
-                    error_text = await response.text()
-                    logger.error(f"WhatsApp API error {response.status}: {error_text}")
+        session = await event_loop.http_session()
+        async with session.post(url, headers=headers, json=payload, timeout=15) as response:
+            if response.status == 200:
+                response_json = await response.json()
+                logger.info(f"WhatsApp message sent to {recipient_id}: {response_json}")
+                return True
+            else:
+                error_text = await response.text()
+                logger.error(f"WhatsApp API error {response.status}: {error_text}")
+                
+                # Parse error and provide specific solutions
+                try:
+                    error_data = json.loads(error_text)
+                    error_code = error_data.get('error', {}).get('code')
                     
-                    # Parse error and provide specific solutions
-                    try:
-                        error_data = json.loads(error_text)
-                        error_code = error_data.get('error', {}).get('code')
+                    if error_code == 131030:
+                        logger.error(f"⚠️  SOLUTION: Add {recipient_id} to WhatsApp Business allowed recipients list in Meta Developer Console")
+                    elif error_code == 131047:
+                        logger.error(f"⚠️  SOLUTION: Use a template message to re-engage {recipient_id} (24hr+ window)")
+                    elif error_code == 100:
+                        logger.error(f"⚠️  SOLUTION: Check WhatsApp access token or phone number ID")
                         
-                        if error_code == 131030:
-                            logger.error(f"⚠️  SOLUTION: Add {recipient_id} to WhatsApp Business allowed recipients list in Meta Developer Console")
-                        elif error_code == 131047:
-                            logger.error(f"⚠️  SOLUTION: Use a template message to re-engage {recipient_id} (24hr+ window)")
-                        elif error_code == 100:
-                            logger.error(f"⚠️  SOLUTION: Check WhatsApp access token or phone number ID")
-                            
-                    except json.JSONDecodeError:
-                        pass
-                    
-                    return False
-                    
+                except json.JSONDecodeError:
+                    pass
+                
+                return False
+                
     except Exception as e:
         logger.error(f"WhatsApp send error: {e}")
         return False
@@ -456,17 +512,17 @@ async def send_messenger_message(recipient_id: str, message: str) -> bool:
     }
     
     try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, params=params, json=payload, timeout=15) as response:
-                if response.status == 200:
-                    response_json = await response.json()
-                    logger.info(f"Messenger message sent to {recipient_id}: {response_json}")
-                    return True
-                else:
-                    error_text = await response.text()
-                    logger.error(f"Messenger API error {response.status}: {error_text}")
-                    return False
-                    
+        session = await event_loop.http_session()
+        async with session.post(url, params=params, json=payload, timeout=15) as response:
+            if response.status == 200:
+                response_json = await response.json()
+                logger.info(f"Messenger message sent to {recipient_id}: {response_json}")
+                return True
+            else:
+                error_text = await response.text()
+                logger.error(f"Messenger API error {response.status}: {error_text}")
+                return False
+                
     except Exception as e:
         logger.error(f"Messenger send error: {e}")
         return False
@@ -505,8 +561,8 @@ def handle_user_message(data):
         channel = data.get('channel', 'web')
         
         if message_text:
-            # Process message asynchronously
-            eventlet.spawn(asyncio_wrapper, process_message_unified, message_text, session_id, channel)
+            # Process message in the background; the reply is emitted from this Socket.IO task
+            socketio.start_background_task(respond_web_message, message_text, session_id, channel)
         else:
             emit('error_response', {'error': 'Empty message'})
             
@@ -514,24 +570,17 @@ def handle_user_message(data):
         logger.error(f"Error handling web message: {e}", exc_info=True)
         emit('error_response', {'error': 'Failed to process message'})
 
-def asyncio_wrapper(func, *args, **kwargs):
-    """Wrapper to run async functions in eventlet"""
-    try:
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        result = loop.run_until_complete(func(*args, **kwargs))
-        loop.close()
-        return result
-    except Exception as e:
-        logger.error(f"Error in asyncio wrapper: {e}")
-        return None
+def respond_web_message(message_text: str, session_id: str, channel: str):
+    """Socket.IO background task: build and emit the reply inside an app context"""
+    with app.app_context():
+        process_message_unified(message_text, session_id, channel)
 
 # =============================================================================
 # WEBHOOK ENDPOINTS
 # =============================================================================
 
 @app.route("/webhook-messenger", methods=["GET", "POST"])
-async def webhook_messenger():
+def webhook_messenger():
     """Handle webhook requests from Facebook Messenger"""
     
     if request.method == "GET":
@@ -565,7 +614,7 @@ async def webhook_messenger():
                     
                     if message_text:
                         # Use unified message processor
-                        await process_message_unified(message_text, sender_id, "messenger")
+                        process_message_unified(message_text, sender_id, "messenger")
                     
                     else:
                         logger.info(f"Received non-text message from {sender_id}, ignoring")
@@ -577,7 +626,7 @@ async def webhook_messenger():
             return jsonify({"status": "error", "message": "Internal Server Error"}), 500
 
 @app.route("/webhook-whatsapp", methods=["GET", "POST"])  
-async def webhook_whatsapp():
+def webhook_whatsapp():
     """Handle webhook requests from WhatsApp Cloud API"""
     
     if request.method == "GET":
@@ -611,7 +660,7 @@ async def webhook_whatsapp():
                             
                             if message_text:
                                 # Use unified message processor
-                                await process_message_unified(message_text, sender_id, "whatsapp")
+                                process_message_unified(message_text, sender_id, "whatsapp")
                             
                             else:
                                 logger.info(f"Received non-text WhatsApp message from {sender_id}, ignoring")
@@ -630,92 +679,186 @@ async def webhook_whatsapp():
 def dashboard():
     """Admin dashboard for conversation monitoring"""
     try:
-        # Get conversation statistics
-        total_conversations = Conversation.query.count()
-        total_users = db.session.query(Conversation.user_id).distinct().count()
+        # Get conversation statistics (from the rollups, independent of history size)
+        stats = get_rollup_stats()
         
         # Get recent conversations
         recent_conversations = Conversation.query.order_by(
             Conversation.created_at.desc()
         ).limit(10).all()
         
-        # Get intent statistics
-        intent_stats = {}
-        conversations_with_intent = Conversation.query.filter(
-            Conversation.intent.isnot(None)
-        ).all()
-        
-        for conv in conversations_with_intent:
-            intent = conv.intent
-            if intent in intent_stats:
-                intent_stats[intent] += 1
-            else:
-                intent_stats[intent] = 1
-        
         return render_template('dashboard.html', 
-                             total_conversations=total_conversations,
-                             total_users=total_users,
+                             total_conversations=stats['total_conversations'],
+                             total_users=stats['total_users'],
                              recent_conversations=recent_conversations,
-                             intent_stats=intent_stats)
+                             intent_stats=stats['intent_stats'])
     except Exception as e:
         logger.error(f"Error loading dashboard: {e}")
         return f"Error loading dashboard: {e}", 500
 
+# Keyset pagination for /api/conversations (newest first on (created_at, id))
+CONVERSATIONS_PER_PAGE = 50
+CONVERSATIONS_MAX_PER_PAGE = int(get_env_var("CONVERSATIONS_MAX_PER_PAGE", "200"))
+
+def encode_cursor(created_at: datetime, conversation_id: int) -> str:
+    """Opaque cursor pointing just past a conversation"""
+    raw = json.dumps([created_at.isoformat(), conversation_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def decode_cursor(cursor: str):
+    """(created_at, id) from a cursor; raises ValueError if malformed"""
+    try:
+        created_at, conversation_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(created_at), int(conversation_id)
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def parse_date_arg(name: str):
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid {name} date, expected ISO format (YYYY-MM-DD[THH:MM:SS])")
+
+def conversation_filters():
+    """
+    SQL filters from the request: channel, intent, user_id, since (inclusive) and
+    until (exclusive). Returns (filters, values); raises ValueError on bad dates.
+    """
+    values = {
+        "channel": request.args.get('channel'),
+        "intent": request.args.get('intent'),
+        "user_id": request.args.get('user_id'),
+        "since": parse_date_arg('since'),
+        "until": parse_date_arg('until')
+    }
+    filters = [Conversation.created_at.isnot(None)]
+    for name in ("channel", "intent", "user_id"):
+        if values[name]:
+            filters.append(getattr(Conversation, name) == values[name])
+    if values["since"]:
+        filters.append(Conversation.created_at >= values["since"])
+    if values["until"]:
+        filters.append(Conversation.created_at < values["until"])
+    return filters, values
+
 @app.route("/api/conversations")
 def api_conversations():
-    """API endpoint for conversation data"""
+    """
+    API endpoint for conversation data, newest first with keyset pagination:
+    pass next_cursor back as ?cursor= for the following page. ?total=exact
+    counts matching rows, ?total=approx estimates them from the rollups.
+    ?archive=1 pages through archived months instead (audit; no totals).
+    """
     try:
-        page = request.args.get('page', 1, type=int)
-        per_page = request.args.get('per_page', 50, type=int)
-        
-        conversations = Conversation.query.order_by(
-            Conversation.created_at.desc()
-        ).paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
-        
-        return jsonify({
-            'conversations': [conv.to_dict() for conv in conversations.items],
-            'total': conversations.total,
-            'pages': conversations.pages,
-            'current_page': page
-        })
+        per_page = min(max(request.args.get('per_page', CONVERSATIONS_PER_PAGE, type=int), 1),
+                       CONVERSATIONS_MAX_PER_PAGE)
+        try:
+            filters, values = conversation_filters()
+            cursor = request.args.get('cursor')
+            if cursor:
+                created_at, conversation_id = decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        if request.args.get('archive', '0') in ('1', 'true', 'yes'):
+            conversations, has_more = archived_page(
+                RETENTION_CONFIG['archive_dir'], values, (created_at, conversation_id) if cursor else None, per_page
+            )
+            last = conversations[-1] if conversations else None
+            return jsonify({
+                'conversations': conversations,
+                'per_page': per_page,
+                'next_cursor': encode_cursor(datetime.fromisoformat(last['created_at']), last['id'])
+                if has_more else None
+            })
+
+        query = Conversation.query.options(joinedload(Conversation.seller)).filter(*filters)
+        if cursor:
+            # (created_at, id) < cursor, spelled with a plain range bound so the index range is used
+            query = query.filter(Conversation.created_at <= created_at, db.or_(
+                Conversation.created_at < created_at, Conversation.id < conversation_id
+            ))
+        # One extra row tells whether another page follows, without counting
+        conversations = query.order_by(
+            Conversation.created_at.desc(), Conversation.id.desc()
+        ).limit(per_page + 1).all()
+        has_more = len(conversations) > per_page
+        conversations = conversations[:per_page]
+
+        result = {
+            'conversations': [conv.to_dict() for conv in conversations],
+            'per_page': per_page,
+            'next_cursor': encode_cursor(conversations[-1].created_at, conversations[-1].id) if has_more else None
+        }
+        total = request.args.get('total')
+        if total == 'exact':
+            result['total'] = Conversation.query.filter(*filters).count()
+        elif total == 'approx':
+            result['total'] = approximate_conversation_count(
+                values['channel'], values['intent'], values['since'], values['until']
+            ) if not values['user_id'] else Conversation.query.filter(*filters).count()
+            result['total_is_approximate'] = not values['user_id']
+        return jsonify(result)
     except Exception as e:
         logger.error(f"Error getting conversations: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route("/api/conversations/export")
+def api_conversations_export():
+    """
+    Stream every matching conversation as NDJSON (default) or CSV, oldest first.
+    Same filters as /api/conversations; ?gzip=1 compresses on the fly.
+    """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"Unknown format, expected one of {sorted(EXPORT_FORMATS)}"}), 400
+    try:
+        filters, _ = conversation_filters()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    compress = request.args.get('gzip', '0') in ('1', 'true', 'yes')
+    filename = f"conversations-{datetime.now().strftime('%Y%m%d-%H%M%S')}.{export_format}"
+    if compress:
+        filename += ".gz"
+    body = export_stream(db.engine, filters, export_format, compress)
+    return Response(body, mimetype='application/gzip' if compress else EXPORT_FORMATS[export_format],
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @app.route("/api/stats")
 def api_stats():
     """API endpoint for statistics"""
     try:
-        stats = {
-            'total_conversations': Conversation.query.count(),
-            'total_users': db.session.query(Conversation.user_id).distinct().count(),
-            'conversations_today': Conversation.query.filter(
-                Conversation.created_at >= datetime.now().replace(hour=0, minute=0, second=0)
-            ).count(),
-            'top_intents': {}
-        }
-        
-        # Get top intents
-        intents = db.session.query(
-            Conversation.intent, 
-            db.func.count(Conversation.intent)
-        ).filter(
-            Conversation.intent.isnot(None)
-        ).group_by(Conversation.intent).order_by(
-            db.func.count(Conversation.intent).desc()
-        ).limit(10).all()
-        
-        stats['top_intents'] = {intent: count for intent, count in intents}
+        stats = get_rollup_stats()
+        stats.pop('intent_stats')  # Full intent list is for the dashboard; top_intents is enough here
         
         return jsonify(stats)
     except Exception as e:
         logger.error(f"Error getting stats: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route("/api/classifier/reload", methods=["POST"])
+def api_classifier_reload():
+    """
+    Rebuild the classifier from the dataset file and swap it in without a restart.
+    Only the worker process that receives the request reloads; with several workers
+    set CLASSIFIER_WATCH_INTERVAL so each one picks up dataset changes itself.
+    A rebuild is CPU-heavy, so the endpoint only exists when RELOAD_TOKEN is set.
+    """
+    if not RELOAD_TOKEN:
+        return jsonify({'error': 'Not found'}), 404
+    if not hmac.compare_digest(request.headers.get("X-Reload-Token", ""), RELOAD_TOKEN):
+        return jsonify({'error': 'Unauthorized'}), 403
+    
+    wait = request.args.get('wait', '0') in ('1', 'true', 'yes')
+    result = {**(reload_classifier(wait=wait) or {}), 'scope': 'this worker only', 'pid': os.getpid()}
+    if result.get('status') == 'error':
+        return jsonify(result), 500
+    return jsonify(result), 200 if wait else 202
+
 # =============================================================================
 # WEB CHAT ENDPOINT
 # =============================================================================
@@ -735,21 +878,12 @@ def chat():
         # Use chat_id as session_id if available, otherwise generate one
         session_id = chat_id if chat_id else f"web_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
         
-        # Process message asynchronously using our unified processor
-        def process_and_respond():
-            try:
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                result = loop.run_until_complete(
-                    get_enhanced_chatbot_response(message_text, session_id, "web")
-                )
-                loop.close()
-                return result
-            except Exception as e:
-                logger.error(f"Error in chat processing: {e}")
-                return "¡Ups! Lo siento, algo salió mal. Por favor, intenta nuevamente más tarde o contacta a uno de nuestros asesores para obtener ayuda. ¡Gracias por tu paciencia!"
-        
-        bot_response = process_and_respond()
+        # Reply built in this thread; an OpenAI fallback waits at most EVENT_LOOP_TIMEOUT seconds on the loop
+        try:
+            bot_response = get_enhanced_chatbot_response(message_text, session_id, "web")
+        except Exception as e:
+            logger.error(f"Error in chat processing: {e}")
+            bot_response = "¡Ups! Lo siento, algo salió mal. Por favor, intenta nuevamente más tarde o contacta a uno de nuestros asesores para obtener ayuda. ¡Gracias por tu paciencia!"
         
         # Return response in the format expected by the frontend
         return jsonify({
@@ -789,7 +923,17 @@ def status():
             "status": "/status",
             "health": "/health"
         },
-        "channels": ["web", "whatsapp", "messenger"]
+        "channels": ["web", "whatsapp", "messenger"],
+        "classifier": get_classifier_status(),
+        "contexts": get_context_store_stats(),
+        "conversation_writer": conversation_writer.stats(),
+        "event_loop": event_loop.stats(),
+        "history_cache": history_cache.stats(),
+        "schema": schema_status,
+        "response_cache": {
+            "classifier": get_classifier_cache_stats(),
+            "context": get_context_cache_stats()
+        }
     })
 
 @app.route("/health")
@@ -813,6 +957,10 @@ def main():
     print("✨ All channels (Web, WhatsApp, Messenger) use the same ChatGPT bot!")
     print("=" * 70)
     
+    # Lazy startup: serve right away and load the classifier in the background
+    if STARTUP_CONFIG['lazy_load']:
+        threading.Thread(target=warmup, name="warmup", daemon=True).start()
+    
     # Use SocketIO server instead of uvicorn for WebSocket support
     socketio.run(
         app,
@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Database schema migrations
+  python migrate.py status    show the current version and pending migrations
+  python migrate.py upgrade   apply pending migrations (model/migrations.py)
+"""
+import argparse
+import logging
+
+from flask import Flask
+
+from model.config import DB_CONFIG
+from model.migrations import MIGRATIONS, apply_migrations, schema_status
+from model.models import db
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Versioned schema migrations")
+    parser.add_argument("command", choices=["status", "upgrade"], nargs="?", default="status")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    app = Flask(__name__)
+    app.config.update(DB_CONFIG)
+    db.init_app(app)
+
+    with app.app_context():
+        if args.command == "upgrade":
+            applied = apply_migrations(db.engine)
+            print(f"✅ Applied migrations: {applied}" if applied else "✅ Nothing to apply")
+        status = schema_status(db.engine)
+
+    print(f"Schema version: {status['version']} (latest {status['latest']})")
+    for migration in MIGRATIONS:
+        state = "pending" if migration.version in status["pending"] else "applied"
+        print(f"  {migration.version:>3}  {state:<8} {migration.name}")
+
+
+if __name__ == "__main__":
+    main()
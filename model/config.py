@@ -27,9 +27,66 @@ OPENAI_CONFIG = {
 CONTEXT_CONFIG = {
     'max_context_length': 10,  # Number of previous messages to keep in context
     'context_timeout': 1800,   # Context timeout in seconds (30 minutes)
+    'max_active_contexts': int(os.getenv('MAX_ACTIVE_CONTEXTS', 10000)),  # Least recently active evicted beyond this
+    'sweep_interval': int(os.getenv('CONTEXT_SWEEP_INTERVAL', 60)),  # Seconds between expired-context sweeps (0 disables)
+    'backend': os.getenv('CONTEXT_BACKEND', 'memory'),  # memory (per process), sqlite or redis (shared by workers)
+    'sqlite_path': os.getenv('CONTEXT_SQLITE_PATH', '/dev/shm/gps_contexts.db'),
+    'redis_url': os.getenv('REDIS_URL', 'redis://localhost:6379/0'),
+    # Write-behind persistence of memory-backend contexts into user_context
+    'persist': os.getenv('CONTEXT_PERSIST', 'true').lower() in ('1', 'true', 'yes'),
+    'flush_interval': float(os.getenv('CONTEXT_FLUSH_INTERVAL', 5)),  # Seconds between batched flushes
+    'flush_batch_size': int(os.getenv('CONTEXT_FLUSH_BATCH_SIZE', 200)),  # Dirty contexts that trigger an early flush
+    'cleanup_interval': int(os.getenv('CONTEXT_CLEANUP_INTERVAL', 300)),  # Seconds between bulk deletes of expired rows
+    'history_cache_size': int(os.getenv('HISTORY_CACHE_SIZE', 3)),  # Latest exchanges per user kept for the OpenAI prompt
+    # Seconds a memory-backend ring is trusted after a database fill (other workers' exchanges show up after it)
+    'history_cache_refresh': float(os.getenv('HISTORY_CACHE_REFRESH', 60)),
     'intent_confidence_threshold': 0.6
 }
 
+# Response Cache Configuration (stateless classifier / template responses)
+CACHE_CONFIG = {
+    'max_entries': int(os.getenv('RESPONSE_CACHE_SIZE', 2048)),
+    'ttl': int(os.getenv('RESPONSE_CACHE_TTL', 600))  # Seconds before a cached response is recomputed
+}
+
+# Conversation Writer Configuration
+# Conversations are queued and inserted in batches by a background thread
+WRITER_CONFIG = {
+    'max_queue': int(os.getenv('CONVERSATION_QUEUE_SIZE', 10000)),  # Beyond this rows spill straight to disk
+    'batch_size': int(os.getenv('CONVERSATION_BATCH_SIZE', 100)),  # Rows per multi-row INSERT
+    'flush_interval': int(os.getenv('CONVERSATION_FLUSH_MS', 200)) / 1000,  # Max wait before a partial batch is written
+    'spill_dir': os.getenv('CONVERSATION_SPILL_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'conversation_spill'))
+}
+
+# Event Loop Configuration
+# Coroutines from Flask and Socket.IO handlers run on one long-lived asyncio loop per process
+EVENT_LOOP_CONFIG = {
+    'request_timeout': float(os.getenv('EVENT_LOOP_TIMEOUT', 30)),  # Max seconds a handler waits for its coroutine
+    'shutdown_timeout': float(os.getenv('EVENT_LOOP_SHUTDOWN_TIMEOUT', 5))  # Grace for in-flight coroutines on exit
+}
+
+# Conversation Retention Configuration
+# Whole months older than archive_after_days are archived to gzip JSONL files and purged
+# (python archive_conversations.py archive, typically from a daily cron job)
+RETENTION_CONFIG = {
+    'archive_after_days': int(os.getenv('CONVERSATION_RETENTION_DAYS', 365)),
+    'archive_dir': os.getenv('CONVERSATION_ARCHIVE_DIR', os.path.join(os.path.dirname(os.path.dirname(__file__)), 'conversation_archive')),
+    'purge_batch_size': int(os.getenv('CONVERSATION_PURGE_BATCH', 1000)),  # Rows per short DELETE transaction
+    'purge_pause': int(os.getenv('CONVERSATION_PURGE_PAUSE_MS', 50)) / 1000,  # Pause between DELETE batches
+    'partitions_ahead': int(os.getenv('CONVERSATION_PARTITIONS_AHEAD', 3))  # Future monthly MySQL partitions kept
+}
+
+# Startup Configuration
+# Lazy startup defers the classifier index until the first message (or warmup) and
+# skips db.create_all() unless DB_CREATE_ALL is set; schema is then managed by init_database.py
+LAZY_STARTUP = os.getenv('LAZY_STARTUP', 'false').lower() in ('1', 'true', 'yes')
+STARTUP_CONFIG = {
+    'lazy_load': LAZY_STARTUP,
+    'create_schema': os.getenv('DB_CREATE_ALL', 'false' if LAZY_STARTUP else 'true').lower() in ('1', 'true', 'yes'),
+    # Pending schema migrations at startup: check (log them), upgrade (apply them) or off
+    'migrations': os.getenv('DB_MIGRATIONS', 'check')
+}
+
 # GPS Control Specific Configuration
 GPSCONTROL_CONFIG = {
     'company_name': 'GPScontrol by Machín',
@@ -0,0 +1,236 @@
+"""
+Versioned schema migrations for chatbot_armaddia
+Each migration has an integer version and an upgrade function that skips
+whatever already exists, so it can be re-run (MySQL commits DDL implicitly);
+applied versions are recorded in schema_migrations. The app checks (or applies)
+pending migrations at startup, and migrate.py runs them by hand.
+"""
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, List, NamedTuple
+import logging
+
+from sqlalchemy import Column, DateTime, Index, Integer, MetaData, String, Table, inspect, select, text
+
+from model.models import (
+    ChatReport, Conversation, ConversationRollup, IntentRollup, ResponseTemplate, RollupUser, UserContext
+)
+from model.rollups import rebuild_rollups
+
+logger = logging.getLogger(__name__)
+
+schema_migrations = Table(
+    'schema_migrations', MetaData(),
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('name', String(200), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+
+class Migration(NamedTuple):
+    version: int
+    name: str
+    upgrade: Callable
+
+
+def _create_indexes(conn, table, indexes: List[Index]):
+    """Create each index unless the table already has one with that name"""
+    existing = {index['name'] for index in inspect(conn).get_indexes(table.name)}
+    for index in indexes:
+        if index.name in existing:
+            logger.info(f"Index {index.name} already exists")
+            continue
+        index.create(conn)
+        logger.info(f"Created index {index.name}")
+
+
+def _detached_index(name: str, table, *columns: str, **kwargs) -> Index:
+    """Index on a copy of table, so it never joins the model metadata (and db.create_all)"""
+    copy = table.to_metadata(MetaData())
+    return Index(name, *[copy.c[column] for column in columns], **kwargs)
+
+
+def _model_indexes(model, *names) -> List[Index]:
+    return [index for index in model.__table__.indexes if index.name in names]
+
+
+def add_conversation_indexes(conn):
+    """
+    Indexes for recent history and distinct users, date counts and paging, and
+    (channel, created_at) / (intent, created_at) for filtered pages and intent counts
+    """
+    _create_indexes(conn, Conversation.__table__, _model_indexes(
+        Conversation, 'idx_conversations_user_channel_created', 'idx_conversations_created_at',
+        'idx_conversations_channel_created', 'idx_conversations_intent_created'
+    ))
+
+
+def add_context_and_report_keys(conn):
+    """user_context lookup/expiry indexes and the unique chat_reports(user_id, channel) key"""
+    UserContext.__table__.create(conn, checkfirst=True)  # Not in setup_database.sql
+    _create_indexes(conn, UserContext.__table__, _model_indexes(
+        UserContext, 'idx_user_context_user_channel', 'idx_user_context_expires_at'
+    ))
+
+    # Fold duplicate reports left by the old read-modify-write before adding the key
+    reports = ChatReport.__table__
+    rows = conn.execute(select(reports).order_by(reports.c.id)).mappings().all()
+    keepers, duplicates = {}, []
+    for row in rows:
+        key = (row['user_id'], row['channel'])
+        if key not in keepers:
+            keepers[key] = dict(row)
+            continue
+        keeper = keepers[key]
+        keeper['message_count'] = (keeper['message_count'] or 0) + (row['message_count'] or 0)
+        keeper['last_interaction'] = max(filter(None, [keeper['last_interaction'], row['last_interaction']]),
+                                         default=None)
+        summary = dict(keeper['intent_summary'] or {})
+        for intent, count in (row['intent_summary'] or {}).items():
+            summary[intent] = summary.get(intent, 0) + count
+        keeper['intent_summary'] = summary
+        keeper['merged'] = True
+        duplicates.append(row['id'])
+    for keeper in keepers.values():
+        if keeper.get('merged'):
+            conn.execute(reports.update().where(reports.c.id == keeper['id']).values(
+                message_count=keeper['message_count'],
+                last_interaction=keeper['last_interaction'],
+                intent_summary=keeper['intent_summary']
+            ))
+    if duplicates:
+        conn.execute(reports.delete().where(reports.c.id.in_(duplicates)))
+        logger.info(f"Merged {len(duplicates)} duplicate chat reports")
+
+    existing = {index['name'] for index in inspect(conn).get_indexes(reports.name)}
+    existing |= {constraint['name'] for constraint in inspect(conn).get_unique_constraints(reports.name)}
+    if 'uq_chat_reports_user_channel' not in existing:
+        _detached_index('uq_chat_reports_user_channel', reports, 'user_id', 'channel', unique=True).create(conn)
+        logger.info("Created unique key uq_chat_reports_user_channel")
+
+
+def add_conversation_rollups(conn):
+    """Hourly/daily/all-time rollup tables, filled from the existing conversations"""
+    for model in (ConversationRollup, IntentRollup, RollupUser):
+        model.__table__.create(conn, checkfirst=True)
+    rebuild_rollups(conn)
+
+
+def add_response_templates(conn):
+    """
+    response_templates plus conversations.response_template_id (existing rows:
+    compact_responses.py). The ALTER commits at once on MySQL, so it goes last
+    and both steps are skipped when already done.
+    """
+    ResponseTemplate.__table__.create(conn, checkfirst=True)
+    if 'response_template_id' not in {column['name'] for column in inspect(conn).get_columns('conversations')}:
+        conn.execute(text("ALTER TABLE conversations ADD COLUMN response_template_id INTEGER NULL"))
+        logger.info("Added conversations.response_template_id")
+
+
+MIGRATIONS = [
+    Migration(1, "conversation query indexes", add_conversation_indexes),
+    Migration(2, "user_context indexes and unique chat report key", add_context_and_report_keys),
+    Migration(3, "conversation rollups", add_conversation_rollups),
+    Migration(4, "response templates", add_response_templates),
+]
+
+
+def applied_versions(engine) -> List[int]:
+    """Versions recorded in schema_migrations (creating the table if needed)"""
+    schema_migrations.create(engine, checkfirst=True)
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(select(schema_migrations.c.version))]
+
+
+def pending_migrations(engine) -> List[Migration]:
+    applied = set(applied_versions(engine))
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+# Name of the MySQL advisory lock held while migrations are applied
+MIGRATION_LOCK = "chatbot_armaddia_migrations"
+
+
+@contextmanager
+def migration_lock(engine, timeout: int = 600):
+    """
+    Hold a cross-process lock while applying migrations: GET_LOCK on MySQL, a
+    lock file next to a SQLite database. A process that waited finds the
+    migrations already applied.
+    """
+    if engine.dialect.name == "mysql":
+        with engine.connect() as conn:
+            if not conn.execute(text("SELECT GET_LOCK(:name, :timeout)"),
+                                {"name": MIGRATION_LOCK, "timeout": timeout}).scalar():
+                raise RuntimeError(f"Timed out after {timeout}s waiting for the migration lock")
+            try:
+                yield
+            finally:
+                conn.execute(text("SELECT RELEASE_LOCK(:name)"), {"name": MIGRATION_LOCK})
+    elif engine.dialect.name == "sqlite" and engine.url.database not in (None, "", ":memory:"):
+        import fcntl
+        with open(f"{engine.url.database}.migrate.lock", "w") as lock_file:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() >= deadline:
+                        raise RuntimeError(f"Timed out after {timeout}s waiting for the migration lock")
+                    time.sleep(0.2)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    else:
+        yield
+
+
+def apply_migrations(engine) -> List[int]:
+    """
+    Run pending migrations in version order under migration_lock. Each runs in a
+    transaction with its version row, but DDL commits implicitly on MySQL, so
+    every upgrade step checks what already exists and is safe to run again
+    after a failure.
+    """
+    applied = []
+    with migration_lock(engine):
+        for migration in pending_migrations(engine):
+            logger.info(f"Applying migration {migration.version}: {migration.name}")
+            with engine.begin() as conn:
+                migration.upgrade(conn)
+                conn.execute(schema_migrations.insert().values(
+                    version=migration.version, name=migration.name, applied_at=datetime.now()
+                ))
+            applied.append(migration.version)
+    return applied
+
+
+def schema_status(engine) -> Dict:
+    """Current and latest schema versions plus anything still pending"""
+    applied = applied_versions(engine)
+    return {
+        "version": max(applied, default=0),
+        "latest": MIGRATIONS[-1].version,
+        "pending": [migration.version for migration in MIGRATIONS if migration.version not in applied]
+    }
+
+
+def check_migrations(engine, apply: bool = False) -> Dict:
+    """Startup check: log (or apply) pending migrations; never raises"""
+    try:
+        if apply:
+            apply_migrations(engine)
+        status = schema_status(engine)
+        if status["pending"]:
+            logger.warning(f"Database schema at version {status['version']}, pending migrations "
+                           f"{status['pending']}; run python migrate.py upgrade")
+        else:
+            logger.info(f"Database schema up to date (version {status['version']})")
+        return status
+    except Exception as e:
+        logger.error(f"Error checking database migrations: {e}")
+        return {"version": None, "latest": MIGRATIONS[-1].version, "pending": None, "error": str(e)}
@@ -3,6 +3,7 @@ Database models for the enhanced chatbot system
 Based on the original elmachin.custodiayvigilancia.mx models but adapted for chatbot_armaddia
 """
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy.exc import IntegrityError
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 import json
@@ -67,6 +68,13 @@ class Seller(db.Model):
 
 class Conversation(db.Model):
     __tablename__ = 'conversations'
+    __table_args__ = (
+        # Added by migration 1 (model/migrations.py)
+        db.Index('idx_conversations_user_channel_created', 'user_id', 'channel', 'created_at'),
+        db.Index('idx_conversations_created_at', 'created_at'),
+        db.Index('idx_conversations_channel_created', 'channel', 'created_at'),
+        db.Index('idx_conversations_intent_created', 'intent', 'created_at'),
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(100), nullable=False)
     channel = db.Column(db.String(20), nullable=False)  # whatsapp, messenger, web
@@ -78,6 +86,9 @@ class Conversation(db.Model):
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
     session_id = db.Column(db.String(100), nullable=True)
     seller_id = db.Column(db.Integer, db.ForeignKey('sellers.id'), nullable=True)
+    # Dataset/template replies are stored as a response_templates id and response left NULL
+    # (no foreign key: a range-partitioned conversations table cannot have one)
+    response_template_id = db.Column(db.Integer, nullable=True)
 
     # Relationship
     seller = db.relationship('Seller', backref=db.backref('conversations', lazy=True))
@@ -88,7 +99,8 @@ class Conversation(db.Model):
             "user_id": self.user_id,
             "channel": self.channel,
             "message": self.message,
-            "response": self.response,
+            "response": self.response if self.response is not None
+                        else response_template_text(self.response_template_id),
             "intent": self.intent,
             "confidence": self.confidence,
             "context_data": self.context_data,
@@ -99,6 +111,9 @@ class Conversation(db.Model):
 
 class ChatReport(db.Model):
     __tablename__ = 'chat_reports'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'channel', name='uq_chat_reports_user_channel'),  # Upsert target
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(100), nullable=False)
     channel = db.Column(db.String(20), nullable=False)
@@ -138,6 +153,10 @@ class Process(db.Model):
 
 class UserContext(db.Model):
     __tablename__ = 'user_context'
+    __table_args__ = (
+        db.Index('idx_user_context_user_channel', 'user_id', 'channel'),
+        db.Index('idx_user_context_expires_at', 'expires_at'),  # Bulk expiry DELETE
+    )
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.String(100), nullable=False)
     channel = db.Column(db.String(20), nullable=False)
@@ -225,6 +244,52 @@ class DashboardChat(db.Model):
 
     assigned_seller = db.relationship('Seller', backref=db.backref('assigned_chats', lazy=True))
 
+# Statistics Rollups (kept current by model/rollups.py as conversations are written)
+class ConversationRollup(db.Model):
+    __tablename__ = 'conversation_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('period', 'bucket', 'channel', name='uq_conversation_rollups_bucket'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(5), nullable=False)  # hour, day, all
+    bucket = db.Column(db.DateTime, nullable=False)  # Start of the hour/day (epoch for all)
+    channel = db.Column(db.String(20), nullable=False)  # whatsapp, messenger, web or all
+    messages = db.Column(db.Integer, default=0)
+    unique_users = db.Column(db.Integer, default=0)
+
+class IntentRollup(db.Model):
+    __tablename__ = 'intent_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('period', 'bucket', 'channel', 'intent', name='uq_intent_rollups_bucket'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.String(5), nullable=False)
+    bucket = db.Column(db.DateTime, nullable=False)
+    channel = db.Column(db.String(20), nullable=False)
+    intent = db.Column(db.String(100), nullable=False)
+    count = db.Column(db.Integer, default=0)
+
+class RollupUser(db.Model):
+    """Users already counted in a rollup bucket, so unique_users can be incremented"""
+    __tablename__ = 'rollup_users'
+    period = db.Column(db.String(5), primary_key=True)
+    bucket = db.Column(db.DateTime, primary_key=True)
+    channel = db.Column(db.String(20), primary_key=True)
+    user_id = db.Column(db.String(100), primary_key=True)
+
+class ResponseTemplate(db.Model):
+    """One version of a canned reply (dataset entry or context template) referenced by conversations"""
+    __tablename__ = 'response_templates'
+    __table_args__ = (
+        db.UniqueConstraint('source', 'template_key', 'version', name='uq_response_templates_key'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    source = db.Column(db.String(20), nullable=False)  # dataset, context
+    template_key = db.Column(db.String(100), nullable=False)  # Dataset entry id or template name
+    version = db.Column(db.String(20), nullable=False)  # Dataset version, or hash of the template text
+    text = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
+
 # Helper functions
 def init_db(app):
     """Initialize database with Flask app"""
@@ -246,6 +311,76 @@ def get_or_create_chat_report(user_id, channel):
         db.session.commit()
     return chat_report
 
+def _intent_path(intent):
+    """JSON path of one intent key in intent_summary"""
+    return '$."' + str(intent).replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def upsert_chat_report_counts(counts, keyed: bool = True):
+    """
+    Add aggregated counters to chat_reports without reading the rows first.
+    counts maps (user_id, channel) to {"messages": int, "last_interaction": datetime,
+    "intents": {intent: int}}. One INSERT ... ON DUPLICATE KEY UPDATE (MySQL) or
+    ON CONFLICT DO UPDATE (SQLite) per distinct number of intents; the caller commits.
+    Without the unique (user_id, channel) key (keyed=False: migration 2 pending)
+    each report is read and updated instead.
+    """
+    dialect = db.session.get_bind().dialect.name
+    if keyed and dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert
+    elif keyed and dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert
+    else:
+        for (user_id, channel), count in counts.items():
+            chat_report = get_or_create_chat_report(user_id, channel)
+            chat_report.message_count = (chat_report.message_count or 0) + count["messages"]
+            chat_report.last_interaction = count["last_interaction"]
+            summary = dict(chat_report.intent_summary or {})
+            for intent, n in count["intents"].items():
+                summary[intent] = summary.get(intent, 0) + n
+            chat_report.intent_summary = summary
+        return
+
+    table = ChatReport.__table__
+    # Statement shape depends only on how many intents a row adds, so group by that
+    groups = {}
+    for (user_id, channel), count in counts.items():
+        intents = sorted(count["intents"].items())
+        params = {
+            "user_id": user_id,
+            "channel": channel,
+            "message_count": count["messages"],
+            "last_interaction": count["last_interaction"],
+            "intent_summary": dict(intents)
+        }
+        for i, (intent, n) in enumerate(intents):
+            params[f"intent_path_{i}"] = _intent_path(intent)
+            params[f"intent_count_{i}"] = n
+        groups.setdefault(len(intents), []).append(params)
+
+    for size, rows in groups.items():
+        stmt = insert(table)
+        summary = table.c.intent_summary
+        json_args = [db.func.coalesce(summary, db.func.json_object())]
+        for i in range(size):
+            path = db.bindparam(f"intent_path_{i}")
+            current = db.cast(db.func.json_extract(summary, path), db.Integer)  # MySQL extracts JSON, not INT
+            json_args += [path, db.func.coalesce(current, 0) + db.bindparam(f"intent_count_{i}")]
+        new = stmt.inserted if dialect == 'mysql' else stmt.excluded
+        greatest = db.func.greatest if dialect == 'mysql' else db.func.max
+        updates = {
+            "message_count": db.func.coalesce(table.c.message_count, 0) + new.message_count,
+            "last_interaction": greatest(
+                db.func.coalesce(table.c.last_interaction, new.last_interaction), new.last_interaction
+            ),
+            "intent_summary": db.func.json_set(*json_args) if size else summary,
+            "updated_at": db.func.current_timestamp()
+        }
+        if dialect == 'mysql':
+            stmt = stmt.on_duplicate_key_update(**updates)
+        else:
+            stmt = stmt.on_conflict_do_update(index_elements=["user_id", "channel"], set_=updates)
+        db.session.execute(stmt, rows)
+
 def get_or_create_user_context(user_id, channel, session_id=None):
     """Get existing user context or create new one"""
     context = UserContext.query.filter_by(
@@ -269,4 +404,45 @@ def get_or_create_user_context(user_id, channel, session_id=None):
         db.session.add(context)
         db.session.commit()
     
-    return context
\ No newline at end of file
+    return context
+
+
+# Template ids and texts never change once written, so both maps are cached for the process
+_template_ids = {}
+_template_texts = {}
+
+def get_or_create_response_template(source, template_key, version, text):
+    """Id of the response template row, inserting it on first use (own transaction, safe across workers)"""
+    key = (source, str(template_key), version)
+    template_id = _template_ids.get(key)
+    if template_id is not None:
+        return template_id
+
+    table = ResponseTemplate.__table__
+    match = db.and_(table.c.source == key[0], table.c.template_key == key[1], table.c.version == key[2])
+    with db.engine.begin() as conn:
+        template_id = conn.execute(db.select(table.c.id).where(match)).scalar()
+    if template_id is None:
+        try:
+            with db.engine.begin() as conn:
+                template_id = conn.execute(table.insert().values(
+                    source=key[0], template_key=key[1], version=key[2], text=text, created_at=datetime.now()
+                )).inserted_primary_key[0]
+        except IntegrityError:
+            # Another worker inserted it first
+            with db.engine.begin() as conn:
+                template_id = conn.execute(db.select(table.c.id).where(match)).scalar()
+    _template_ids[key] = template_id
+    _template_texts[template_id] = text
+    return template_id
+
+def response_template_text(template_id):
+    """Text of a stored response template (None for an unknown id)"""
+    if template_id is None:
+        return None
+    text = _template_texts.get(template_id)
+    if text is None:
+        template = db.session.get(ResponseTemplate, template_id)
+        if template is not None:
+            text = _template_texts[template_id] = template.text
+    return text
@@ -0,0 +1,306 @@
+"""
+Hourly, daily and all-time rollups of conversation statistics
+Messages, unique users and intent counts per channel (plus an 'all' channel) are
+added incrementally by the conversation writer in the same transaction as the
+rows they count, so the dashboard and /api/stats read a few rollup rows instead
+of scanning conversations. Hour/day unique users are deduplicated through
+rollup_users (pruned once a bucket closes); all-time unique users are users new
+to chat_reports, which already holds one row per (user_id, channel)
+"""
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+from sqlalchemy import func, insert, literal, select
+
+from model.models import db, ChatReport, Conversation, ConversationRollup, IntentRollup, RollupUser
+
+logger = logging.getLogger(__name__)
+
+PERIODS = ('hour', 'day', 'all')
+ALL_CHANNELS = 'all'
+EPOCH = datetime(1970, 1, 1)  # Bucket of the all-time rollup
+
+# Closed hour/day buckets no longer need their user lists once this old
+USER_RETENTION = timedelta(days=2)
+
+
+def bucket_start(period: str, at: datetime) -> datetime:
+    if period == 'hour':
+        return at.replace(minute=0, second=0, microsecond=0)
+    if period == 'day':
+        return at.replace(hour=0, minute=0, second=0, microsecond=0)
+    return EPOCH
+
+
+def _dialect(conn) -> str:
+    bind = conn if hasattr(conn, 'dialect') else conn.get_bind()
+    return bind.dialect.name
+
+
+def _insert_new_users(conn, dialect: str, key: Tuple, user_ids: Iterable[str]) -> int:
+    """Record users in a bucket, returning how many were not there yet"""
+    period, bucket, channel = key
+    rows = [{"period": period, "bucket": bucket, "channel": channel, "user_id": user_id} for user_id in user_ids]
+    table = RollupUser.__table__
+    if dialect == 'mysql':
+        stmt = insert(table).prefix_with('IGNORE')
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(table).on_conflict_do_nothing()
+    else:
+        existing = set(conn.execute(select(table.c.user_id).where(
+            table.c.period == period, table.c.bucket == bucket, table.c.channel == channel,
+            table.c.user_id.in_([row["user_id"] for row in rows])
+        )).scalars())
+        rows = [row for row in rows if row["user_id"] not in existing]
+        if not rows:
+            return 0
+        stmt = insert(table)
+    # executemany keeps the statement cacheable; rowcount counts only rows actually inserted
+    return conn.execute(stmt, rows).rowcount
+
+
+def _upsert_counts(conn, dialect: str, table, keys: List[str], rows: List[Dict]):
+    """Add each row's counters to the existing rollup row (or create it)"""
+    counters = [name for name in rows[0] if name not in keys]
+    if dialect == 'mysql':
+        from sqlalchemy.dialects.mysql import insert as mysql_insert
+        stmt = mysql_insert(table)
+        stmt = stmt.on_duplicate_key_update(**{
+            name: db.func.coalesce(table.c[name], 0) + stmt.inserted[name] for name in counters
+        })
+    elif dialect == 'sqlite':
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        stmt = sqlite_insert(table)
+        stmt = stmt.on_conflict_do_update(index_elements=keys, set_={
+            name: db.func.coalesce(table.c[name], 0) + stmt.excluded[name] for name in counters
+        })
+    else:
+        for row in rows:
+            match = [table.c[key] == row[key] for key in keys]
+            updated = conn.execute(table.update().where(*match).values(**{
+                name: db.func.coalesce(table.c[name], 0) + row[name] for name in counters
+            })).rowcount
+            if not updated:
+                conn.execute(insert(table).values(**row))
+        return
+    conn.execute(stmt, rows)
+
+
+def first_seen_users(rows: List[Dict], conn=None) -> Dict[str, int]:
+    """
+    Users of the rows with no chat report yet, per channel and in 'all' (no
+    report on any channel). Call before the batch's reports are upserted.
+    Approximate with concurrent writers: two batches holding a brand-new
+    user's first messages may both count it.
+    """
+    conn = conn if conn is not None else db.session
+    pairs = {(row["user_id"], row["channel"]) for row in rows}
+    if not pairs:
+        return {}
+    user_ids = {user_id for user_id, _ in pairs}
+    reports = ChatReport.__table__
+    known = set(conn.execute(select(reports.c.user_id, reports.c.channel).where(
+        reports.c.user_id.in_(user_ids)
+    )).all())
+    new_users = Counter(channel for user_id, channel in pairs if (user_id, channel) not in known)
+    new_users[ALL_CHANNELS] = len(user_ids - {user_id for user_id, _ in known})
+    return dict(new_users)
+
+
+def update_rollups(rows: List[Dict], conn=None, all_time_users: Optional[Dict[str, int]] = None):
+    """
+    Count conversation rows (user_id, channel, intent, created_at) into every
+    hour/day/all bucket and their channel plus 'all'. all_time_users (from
+    first_seen_users) adds to the all-time unique users. The caller commits.
+    """
+    conn = conn if conn is not None else db.session
+    dialect = _dialect(conn)
+    all_time_users = all_time_users or {}
+
+    messages = Counter()
+    intents = Counter()
+    users = defaultdict(set)
+    for row in rows:
+        for period in PERIODS:
+            bucket = bucket_start(period, row["created_at"])
+            for channel in (row["channel"], ALL_CHANNELS):
+                key = (period, bucket, channel)
+                messages[key] += 1
+                if period != 'all':
+                    users[key].add(row["user_id"])
+                if row.get("intent"):
+                    intents[key + (row["intent"],)] += 1
+    if not messages:
+        return
+
+    new_users = {key: _insert_new_users(conn, dialect, key, user_ids) for key, user_ids in users.items()}
+    new_users.update({('all', EPOCH, channel): count for channel, count in all_time_users.items()})
+    _upsert_counts(conn, dialect, ConversationRollup.__table__, ["period", "bucket", "channel"], [
+        {"period": period, "bucket": bucket, "channel": channel, "messages": count,
+         "unique_users": new_users.get((period, bucket, channel), 0)}
+        for (period, bucket, channel), count in messages.items()
+    ])
+    if intents:
+        _upsert_counts(conn, dialect, IntentRollup.__table__, ["period", "bucket", "channel", "intent"], [
+            {"period": period, "bucket": bucket, "channel": channel, "intent": intent, "count": count}
+            for (period, bucket, channel, intent), count in intents.items()
+        ])
+
+
+def prune_rollup_users(now: datetime = None) -> int:
+    """Drop user lists of hour/day buckets closed for USER_RETENTION"""
+    cutoff = (now or datetime.now()) - USER_RETENTION
+    table = RollupUser.__table__
+    deleted = db.session.execute(table.delete().where(table.c.bucket < cutoff)).rowcount
+    db.session.commit()
+    return deleted
+
+
+# Bucket start formatted as each dialect stores DATETIME (SQLite keeps SQLAlchemy's string format)
+BUCKET_FORMATS = {
+    'sqlite': {'hour': '%Y-%m-%d %H:00:00.000000', 'day': '%Y-%m-%d 00:00:00.000000'},
+    'mysql': {'hour': '%Y-%m-%d %H:00:00', 'day': '%Y-%m-%d 00:00:00'}
+}
+
+
+def _bucket_expr(dialect: str, period: str, column):
+    if period == 'all':
+        return literal(EPOCH.strftime(BUCKET_FORMATS[dialect]['day']))
+    if dialect == 'sqlite':
+        return func.strftime(BUCKET_FORMATS[dialect][period], column)
+    return func.date_format(column, BUCKET_FORMATS[dialect][period])
+
+
+def _rebuild_with_sql(conn, dialect: str):
+    """GROUP BY straight into the rollup tables; user lists only for buckets still open"""
+    table = Conversation.__table__
+    open_since = bucket_start('day', datetime.now() - USER_RETENTION)
+    rollups, intent_rollups, rollup_users = ConversationRollup.__table__, IntentRollup.__table__, RollupUser.__table__
+
+    for period in PERIODS:
+        bucket = _bucket_expr(dialect, period, table.c.created_at)
+        for channel in (table.c.channel, literal(ALL_CHANNELS)):
+            grouping = [bucket, table.c.channel] if channel is table.c.channel else [bucket]
+            dated = table.c.created_at.isnot(None)
+
+            conn.execute(insert(rollups).from_select(
+                ['period', 'bucket', 'channel', 'messages', 'unique_users'],
+                select(literal(period), bucket, channel, func.count(),
+                       func.count(table.c.user_id.distinct())).where(dated).group_by(*grouping)
+            ))
+            conn.execute(insert(intent_rollups).from_select(
+                ['period', 'bucket', 'channel', 'intent', 'count'],
+                select(literal(period), bucket, channel, table.c.intent, func.count()).where(
+                    dated, table.c.intent.isnot(None)
+                ).group_by(*grouping, table.c.intent)
+            ))
+            if period == 'all':
+                continue
+            conn.execute(insert(rollup_users).from_select(
+                ['period', 'bucket', 'channel', 'user_id'],
+                select(literal(period), bucket, channel, table.c.user_id).where(
+                    dated, table.c.created_at >= open_since
+                ).distinct()
+            ))
+
+
+def rebuild_rollups(conn, chunk: int = 5000) -> int:
+    """Recount every rollup from conversations (used when the tables are created)"""
+    for model in (ConversationRollup, IntentRollup, RollupUser):
+        conn.execute(model.__table__.delete())
+
+    table = Conversation.__table__
+    dialect = _dialect(conn)
+    counted = conn.execute(select(func.count()).select_from(table)).scalar()
+    if dialect in BUCKET_FORMATS:
+        _rebuild_with_sql(conn, dialect)
+        logger.info(f"Rebuilt rollups from {counted} conversations")
+        return counted
+
+    columns = [table.c.id, table.c.user_id, table.c.channel, table.c.intent, table.c.created_at]
+    last_id = 0
+    while True:
+        # Keyset chunks rather than a streaming cursor, so rollup writes can share the connection
+        rows = conn.execute(select(*columns).where(table.c.id > last_id).order_by(table.c.id).limit(chunk)
+                            ).mappings().all()
+        if not rows:
+            break
+        update_rollups([dict(row) for row in rows if row["created_at"] is not None], conn)
+        last_id = rows[-1]["id"]
+
+    # All-time unique users span chunks, so they are counted once at the end
+    rollups, dated = ConversationRollup.__table__, table.c.created_at.isnot(None)
+    distinct_users = conn.execute(select(table.c.channel, func.count(table.c.user_id.distinct())).where(
+        dated
+    ).group_by(table.c.channel)).all()
+    distinct_users.append((ALL_CHANNELS, conn.execute(select(func.count(table.c.user_id.distinct())).where(
+        dated
+    )).scalar()))
+    for channel, users in distinct_users:
+        conn.execute(rollups.update().where(rollups.c.period == 'all', rollups.c.channel == channel).values(
+            unique_users=users
+        ))
+    logger.info(f"Rebuilt rollups from {counted} conversations")
+    return counted
+
+
+def _series(period: str, since: datetime) -> List[Dict]:
+    rollups = ConversationRollup.query.filter(
+        ConversationRollup.period == period,
+        ConversationRollup.channel == ALL_CHANNELS,
+        ConversationRollup.bucket >= since
+    ).order_by(ConversationRollup.bucket).all()
+    return [{"bucket": rollup.bucket.isoformat(), "messages": rollup.messages, "unique_users": rollup.unique_users}
+            for rollup in rollups]
+
+
+def get_rollup_stats(top_intents: int = 10, hours: int = 24, days: int = 30) -> Dict:
+    """Dashboard statistics read from rollups only (cost independent of conversation count)"""
+    now = datetime.now()
+    today = bucket_start('day', now)
+
+    totals = {rollup.channel: rollup for rollup in ConversationRollup.query.filter(
+        ConversationRollup.period == 'all', ConversationRollup.bucket == EPOCH
+    )}
+    today_total = ConversationRollup.query.filter_by(period='day', bucket=today, channel=ALL_CHANNELS).first()
+    intents = IntentRollup.query.filter_by(period='all', bucket=EPOCH, channel=ALL_CHANNELS).order_by(
+        IntentRollup.count.desc()
+    ).all()
+
+    overall = totals.get(ALL_CHANNELS)
+    return {
+        'total_conversations': overall.messages if overall else 0,
+        'total_users': overall.unique_users if overall else 0,
+        'conversations_today': today_total.messages if today_total else 0,
+        'users_today': today_total.unique_users if today_total else 0,
+        'intent_stats': {rollup.intent: rollup.count for rollup in intents},
+        'top_intents': {rollup.intent: rollup.count for rollup in intents[:top_intents]},
+        'channels': {channel: {'messages': rollup.messages, 'unique_users': rollup.unique_users}
+                     for channel, rollup in totals.items() if channel != ALL_CHANNELS},
+        'hourly': _series('hour', bucket_start('hour', now) - timedelta(hours=hours - 1)),
+        'daily': _series('day', today - timedelta(days=days - 1))
+    }
+
+
+def approximate_conversation_count(channel: str = None, intent: str = None,
+                                   since: datetime = None, until: datetime = None) -> int:
+    """Conversations matching the filters, counted from rollups at day granularity"""
+    model = IntentRollup if intent else ConversationRollup
+    query = db.session.query(func.coalesce(func.sum(model.count if intent else model.messages), 0)).filter(
+        model.channel == (channel or ALL_CHANNELS)
+    )
+    if intent:
+        query = query.filter(model.intent == intent)
+    if since or until:
+        # Whole days touched by the range
+        query = query.filter(model.period == 'day')
+        if since:
+            query = query.filter(model.bucket >= bucket_start('day', since))
+        if until:
+            query = query.filter(model.bucket < until)
+    else:
+        query = query.filter(model.period == 'all', model.bucket == EPOCH)
+    return int(query.scalar())
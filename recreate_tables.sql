@@ -37,6 +37,7 @@ CREATE TABLE conversations (
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     session_id VARCHAR(100),
     seller_id INT,
+    response_template_id INT,
     FOREIGN KEY (seller_id) REFERENCES sellers(id)
 );
 
@@ -50,7 +51,8 @@ CREATE TABLE chat_reports (
     intent_summary JSON,
     satisfaction_score FLOAT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP
+    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    UNIQUE KEY uq_chat_reports_user_channel (user_id, channel)
 );
 
 -- Insert some sample data
@@ -1,4 +1,6 @@
 -- Create new database for chatbot_armaddia
+-- Base tables only (schema version 0): run python migrate.py upgrade afterwards for
+-- user_context, indexes and keys, rollups and response templates (model/migrations.py)
 CREATE DATABASE chatbot_armaddia CHARACTER SET utf8mb4 COLLATE utf8mb4_unicode_ci;
 USE chatbot_armaddia;
 
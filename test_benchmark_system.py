@@ -0,0 +1,70 @@
+"""
+Tests for the pipeline benchmark helpers (corpora, export loading, latency and accuracy summaries)
+"""
+import csv
+import json
+import random
+
+import pytest
+
+from benchmark_system import accuracy, build_corpora, latency_summary, load_conversations, perturb
+
+ROWS = [{"message": "hola", "intent": "saludo"}, {"message": "", "intent": "x"}, {"message": "precio gps"}]
+
+
+@pytest.mark.parametrize("name, content", [
+    ("export.json", json.dumps({"conversations": ROWS, "next_cursor": None})),
+    ("rows.json", json.dumps(ROWS)),
+    ("rows.ndjson", "\n".join(json.dumps(row) for row in ROWS) + "\n\n"),
+])
+def test_load_conversations_json_formats(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_text(content, encoding="utf-8")
+    assert load_conversations(str(path)) == ["hola", "precio gps"]
+
+
+def test_load_conversations_csv(tmp_path):
+    path = tmp_path / "rows.csv"
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=["message", "intent"])
+        writer.writeheader()
+        writer.writerows(ROWS)
+    assert load_conversations(str(path)) == ["hola", "precio gps"]
+
+
+def test_latency_summary():
+    summary = latency_summary([i * 1_000_000 for i in range(1, 101)])  # 1..100 ms
+    assert summary["count"] == 100
+    assert summary["mean_ms"] == 50.5
+    assert summary["p50_ms"] == 50.5
+    assert summary["p95_ms"] == 95.05
+    assert summary["max_ms"] == 100.0
+    assert summary["msgs_per_sec"] == round(100 / 5.05, 1)
+    assert latency_summary([]) == {"count": 0}
+
+
+def test_accuracy_ignores_messages_without_an_expected_intent():
+    messages = [{"expected": "saludo"}, {"expected": "precio"}, {"expected": None}]
+    assert accuracy(messages, ["saludo", "general", "otro"]) == 0.5
+    assert accuracy([{"expected": None}], ["saludo"]) is None
+
+
+def test_corpora_are_reproducible(tmp_path):
+    dataset = [{"input": "cuanto cuesta el gps", "intention": "precio"}, {"input": "hola"}]
+    conversations = tmp_path / "rows.json"
+    conversations.write_text(json.dumps(ROWS), encoding="utf-8")
+
+    corpora = build_corpora(dataset, 3, str(conversations), seed=1)
+    assert corpora == build_corpora(dataset, 3, str(conversations), seed=1)
+    assert corpora["dataset"] == [{"message": "cuanto cuesta el gps", "expected": "precio"},
+                                  {"message": "hola", "expected": "general"}]
+    assert [item["expected"] for item in corpora["perturbed"]] == ["precio"] * 3 + ["general"] * 3
+    assert corpora["conversations"] == [{"message": "hola", "expected": None},
+                                        {"message": "precio gps", "expected": None}]
+
+
+def test_perturb_keeps_the_message_recognizable():
+    rng = random.Random(5)
+    for _ in range(200):
+        variant = perturb("cotizacion de camaras", rng)
+        assert variant and abs(len(variant) - len("cotizacion de camaras")) <= len("una pregunta ")
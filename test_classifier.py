@@ -0,0 +1,203 @@
+"""
+Tests for the dataset classifier
+"""
+import json
+import random
+
+import numpy as np
+import pytest
+
+from benchmark_system import perturb
+from utilities.classifier import DATASET_PATH, FIT_CONFIG, VIDEOS_DICT, VIDEOS_INFO, GPSControlClassifier
+
+
+@pytest.fixture(scope="module")
+def index_dir(tmp_path_factory):
+    """Artifact directory shared by the module's classifiers (fitted once)"""
+    return tmp_path_factory.mktemp("classifier_index")
+
+
+@pytest.fixture(scope="module")
+def messages():
+    """Dataset inputs, a typo'd variant of each and a few messages matching nothing"""
+    with open(DATASET_PATH, encoding="utf-8") as f:
+        inputs = [item.get("input", "") for item in json.load(f)]
+    rng = random.Random(7)
+    return inputs + [perturb(text, rng) for text in inputs] + ["", "xyz", "cotisar camras"]
+
+
+def test_batch_classification_matches_single(index_dir, messages):
+    single = GPSControlClassifier(index_dir=index_dir)
+    batch = GPSControlClassifier(index_dir=index_dir)
+    assert batch.classify_intents(messages) == [single.classify_intent(message) for message in messages]
+
+
+def test_batch_best_matches_match_single(index_dir, messages):
+    classifier = GPSControlClassifier(index_dir=index_dir)
+    assert classifier.find_best_matches(messages) == [classifier.find_best_match(message) for message in messages]
+    assert classifier.classify_intents([]) == []
+
+
+def test_batch_reuses_and_fills_the_response_cache(index_dir, messages):
+    classifier = GPSControlClassifier(index_dir=index_dir)
+    first = classifier.classify_intent(messages[0])
+    results = classifier.classify_intents(messages[:5])
+    assert results[0] == first
+    assert classifier.response_cache.stats()["hits"] == 1
+    assert classifier.classify_intents(messages[:5]) == results
+    assert classifier.response_cache.stats()["hits"] == 6
+
+
+def test_rebuild_prunes_only_this_datasets_artifacts(tmp_path):
+    dataset = tmp_path / "faq.json"
+    dataset.write_text(json.dumps([{"input": "hola", "answer": "¡Hola!", "intention": "saludo"}]), encoding="utf-8")
+    other = tmp_path / "index" / "dataset_gpscontrol-v2-0123456789abcdef"
+    stale = tmp_path / "index" / "faq-v2-0123456789abcdef"
+    other.mkdir(parents=True)
+    stale.mkdir()
+
+    classifier = GPSControlClassifier(dataset_path=dataset, index_dir=tmp_path / "index")
+    assert classifier.snapshot.build_mode == "refit"
+    assert sorted(path.name for path in (tmp_path / "index").iterdir()) == [
+        other.name, f"faq-v2-{classifier.index.fingerprint[:16]}"
+    ]
+    assert GPSControlClassifier(dataset_path=dataset, index_dir=tmp_path / "index").snapshot.build_mode == "artifact"
+
+
+def test_artifact_classifies_like_a_refit(tmp_path, messages):
+    refit = GPSControlClassifier(index_dir=tmp_path)
+    loaded = GPSControlClassifier(index_dir=tmp_path)
+    assert (refit.snapshot.build_mode, loaded.snapshot.build_mode) == ("refit", "artifact")
+    assert loaded.index.fingerprint == refit.index.fingerprint
+    assert loaded.classify_intents(messages) == refit.classify_intents(messages)
+
+
+def test_query_vectors_match_sklearn(index_dir, messages):
+    from sklearn.feature_extraction.text import TfidfVectorizer
+
+    classifier = GPSControlClassifier(index_dir=index_dir)
+    index = classifier.index
+    vectorizer = TfidfVectorizer(lowercase=True, max_features=FIT_CONFIG["max_features"],
+                                 ngram_range=tuple(FIT_CONFIG["ngram_range"]))
+    vectorizer.fit([classifier.normalize_text(item.get("input", "")) for item in classifier.dataset])
+    assert [vectorizer.get_feature_names_out()[col] for col in range(index.n_features)] == index.terms
+
+    queries = [classifier.normalize_text(message) for message in messages]
+    expected = vectorizer.transform(queries).toarray()
+    assert np.allclose(index.transform_batch(queries).toarray(), expected)
+    assert np.allclose(index.matrix.toarray(), vectorizer.transform(
+        [classifier.normalize_text(item.get("input", "")) for item in classifier.dataset]
+    ).toarray())
+
+
+def test_unreadable_artifact_is_refit(tmp_path):
+    GPSControlClassifier(index_dir=tmp_path).warmup()
+    artifact = next(tmp_path.iterdir())
+    (artifact / "matrix_data.npy").write_bytes(b"truncated")
+
+    classifier = GPSControlClassifier(index_dir=tmp_path)
+    assert classifier.snapshot.build_mode == "refit"
+    assert classifier.classify_intent("hola")[1] != "error"
+    assert GPSControlClassifier(index_dir=tmp_path).snapshot.build_mode == "artifact"
+
+
+def shout(text: str) -> str:
+    """Same message as typed differently: upper case, extra spaces and punctuation"""
+    return f"¡¡ {text.upper()}  ?!"
+
+
+def test_dataset_inputs_take_the_exact_match_path(index_dir):
+    classifier = GPSControlClassifier(index_dir=index_dir)
+    snapshot = classifier.snapshot
+    first_rows = {}
+    for row, item in enumerate(classifier.dataset):
+        first_rows.setdefault(classifier.normalize_text(item.get("input", "")), row)
+    first_rows.pop("", None)
+
+    inputs = [classifier.dataset[row]["input"] for row in first_rows.values()]
+    results = [classifier.classify_intent(shout(text)) for text in inputs]
+    assert results == [(snapshot.responses[row], snapshot.intents[row], 1.0) for row in first_rows.values()]
+    assert classifier.match_stats["exact_hits"] == len(inputs)
+    assert classifier.match_stats["exact_misses"] == 0
+
+
+def test_other_messages_fall_through_to_similarity(index_dir):
+    classifier = GPSControlClassifier(index_dir=index_dir)
+    response, intent, confidence = classifier.classify_intent("quiero saber el precio del gps para mi camioneta")
+    assert (classifier.match_stats["exact_hits"], classifier.match_stats["exact_misses"]) == (0, 1)
+    assert 0 < confidence < 1
+    assert classifier.get_match_stats()["exact_hit_rate"] == 0.0
+
+
+@pytest.mark.parametrize("k", [1, 5, 50])
+def test_inverted_retrieval_matches_linear_scan(index_dir, messages, k):
+    inverted = GPSControlClassifier(index_dir=index_dir)
+    linear = GPSControlClassifier(index_dir=index_dir, retrieval="linear")
+    for message in messages:
+        assert inverted.find_top_matches(message, k=k) == linear.find_top_matches(message, k=k)
+    assert inverted.classify_intents(messages) == linear.classify_intents(messages)
+
+
+def test_inverted_retrieval_breaks_ties_by_lowest_row(tmp_path):
+    # Repeated inputs score exactly the same: both retrievals must return the first rows
+    rng = random.Random(3)
+    words = ["gps", "camara", "flota", "precio", "instalacion", "combustible", "rastreo", "alarma"]
+    dataset = [{"input": " ".join(rng.sample(words, 3)), "answer": f"a{i}", "intention": f"i{i}"} for i in range(300)]
+    path = tmp_path / "ties.json"
+    path.write_text(json.dumps(dataset), encoding="utf-8")
+    inverted = GPSControlClassifier(dataset_path=path, index_dir=tmp_path / "index", typo_tolerance=False)
+    linear = GPSControlClassifier(dataset_path=path, index_dir=tmp_path / "index", typo_tolerance=False,
+                                  retrieval="linear")
+    for query in ["gps precio", "camara flota alarma", "rastreo", "precio precio instalacion"]:
+        expected = linear._rank(linear.snapshot, query, 20)
+        assert inverted._rank(inverted.snapshot, query, 20) == expected
+        assert expected == sorted(expected, key=lambda match: (-match[1], match[0]))
+        assert len({score for _, score in expected}) < len(expected)  # The ranking did have ties
+    assert inverted._rank(inverted.snapshot, "nada", 20) == linear._rank(linear.snapshot, "nada", 20) == []
+
+
+def render_on_request(item: dict) -> str:
+    """Reply as built per message before answers were rendered at load time"""
+    response = item.get("answer", "")
+    if "${video}" in response:
+        response = response.replace("${video}", "🎥 Te comparto un video explicativo sobre nuestros servicios.")
+    for placeholder in VIDEOS_DICT:
+        if placeholder in response:
+            video_info = VIDEOS_INFO.get(placeholder.replace("${", "${machin-"), "Video informativo")
+            response = response.replace(placeholder, f"🎥 {video_info}")
+    suggested = item.get("suggested_responses", [])
+    if suggested:
+        response += "\n\nOpciones disponibles:\n"
+        for i, suggestion in enumerate(suggested[:4], 1):
+            response += f"{i}. {suggestion}\n"
+    return response
+
+
+def test_pre_rendered_answers_match_per_message_rendering(tmp_path):
+    dataset = [
+        {"id": "v", "input": "video", "answer": "Mira: ${video}", "intention": "info"},
+        {"id": "s", "input": "opciones", "answer": "Elige", "intention": "menu",
+         "suggested_responses": ["uno", "dos", "tres", "cuatro", "cinco"]},
+        {"id": "p", "input": "planes", "answer": "Plan ${v3}", "intention": "planes"},
+    ]
+    path = tmp_path / "faq.json"
+    path.write_text(json.dumps(dataset), encoding="utf-8")
+    classifier = GPSControlClassifier(dataset_path=path, index_dir=tmp_path / "index")
+
+    for item in classifier.dataset:
+        response, intent, _ = classifier.classify_intent(item["input"])
+        assert response == render_on_request(item)
+        assert intent == item["intention"]
+    assert "5. cinco" not in classifier.classify_intent("opciones")[0]
+
+
+def test_every_dataset_answer_is_rendered_once(index_dir):
+    classifier = GPSControlClassifier(index_dir=index_dir)
+    snapshot = classifier.snapshot
+    assert snapshot.responses == [classifier._render_response(item) for item in snapshot.dataset]
+    assert not any("${" in response for response in snapshot.responses)
+    for row, response in enumerate(snapshot.responses):
+        entry_id, version = classifier.response_reference(response)
+        first = snapshot.response_rows[response]
+        assert first <= row
+        assert (entry_id, version) == (str(snapshot.dataset[first].get("id", first)), snapshot.version)
@@ -0,0 +1,146 @@
+"""
+Tests for the classifier hot reload: snapshot swap, file watcher and endpoint
+"""
+import json
+import os
+import shutil
+import threading
+import time
+
+import pytest
+
+from utilities.classifier import DATASET_PATH, GPSControlClassifier
+
+
+@pytest.fixture
+def dataset(tmp_path):
+    """Writable copy of the dataset and a function to rewrite it"""
+    path = tmp_path / "dataset.json"
+    shutil.copy(DATASET_PATH, path)
+
+    def write(entries):
+        path.write_text(json.dumps(entries, ensure_ascii=False), encoding="utf-8")
+        # Distinct mtime even on coarse-grained filesystems
+        stat = path.stat()
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10_000_000_000))
+
+    write.path = path
+    write.entries = lambda: json.loads(path.read_text(encoding="utf-8"))
+    return write
+
+
+@pytest.fixture
+def classifier(dataset, tmp_path):
+    classifier = GPSControlClassifier(dataset_path=dataset.path, index_dir=tmp_path / "index")
+    yield classifier
+    classifier.stop_watcher()
+
+
+def test_answer_only_edit_reuses_the_index(dataset, classifier):
+    before = classifier.snapshot
+    classifier.classify_intent("hola")
+    entries = dataset.entries()
+    row = before.exact_index[classifier.normalize_text("hola")]
+    entries[row]["answer"] = "¡Hola de nuevo!"
+    dataset(entries)
+
+    report = classifier.reload(wait=True)
+    assert (report["status"], report["mode"]) == ("ok", "incremental")
+    assert classifier.index is before.index
+    assert classifier.snapshot.version != before.version
+    assert classifier.classify_intent("hola")[0].startswith("¡Hola de nuevo!\n")
+    assert classifier.response_cache.stats()["invalidations"] == 1
+
+
+def test_input_edit_refits_and_swaps(dataset, classifier):
+    before = classifier.snapshot
+    entries = dataset.entries()
+    entries.append({"input": "necesito rastrear mi lancha", "answer": "Rastreo marino", "intention": "marino"})
+    dataset(entries)
+
+    report = classifier.reload(wait=True)
+    assert (report["status"], report["mode"], report["entries"]) == ("ok", "refit", len(entries))
+    assert classifier.index.fingerprint != before.index.fingerprint
+    assert classifier.classify_intent("necesito rastrear mi lancha")[1:] == ("marino", 1.0)
+    # In-flight classifications keep the snapshot they started with
+    assert len(before.dataset) == len(entries) - 1
+
+
+def test_failed_reload_keeps_the_current_snapshot(dataset, classifier):
+    before = classifier.snapshot
+    dataset([])
+    report = classifier.reload(wait=True)
+    assert report["status"] == "error"
+    assert classifier.snapshot is before
+    assert classifier.classify_intent("hola")[1] != "error"
+
+
+def test_concurrent_reload_is_reported_in_progress(classifier, monkeypatch):
+    classifier.warmup()
+    release = threading.Event()
+    build = classifier._build_snapshot
+    monkeypatch.setattr(classifier, "_build_snapshot", lambda previous=None: release.wait() and build(previous))
+
+    assert classifier.reload() == {"status": "started"}
+    assert classifier.reload() == {"status": "in_progress"}
+    release.set()
+    deadline = time.monotonic() + 5
+    while classifier.last_reload is None:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert classifier.last_reload["status"] == "ok"
+
+
+def test_watcher_reloads_on_file_change(dataset, classifier):
+    classifier.warmup()
+    classifier.start_watcher(interval=0.05)
+    entries = dataset.entries()
+    entries.append({"input": "tienen gps para bicicletas", "answer": "Sí, para bicicletas", "intention": "bici"})
+    dataset(entries)
+
+    deadline = time.monotonic() + 5
+    while classifier.last_reload is None:
+        assert time.monotonic() < deadline, "watcher did not reload"
+        time.sleep(0.02)
+    assert classifier.last_reload["status"] == "ok"
+    assert classifier.classify_intent("tienen gps para bicicletas")[1] == "bici"
+
+
+@pytest.fixture
+def reloads(main_module, monkeypatch):
+    """Calls to reload_classifier made by the endpoint (the real rebuild is not run)"""
+    calls = []
+
+    def reload_classifier(wait: bool = False):
+        calls.append(wait)
+        return {"status": "reloaded" if wait else "started"}
+
+    monkeypatch.setattr(main_module, "reload_classifier", reload_classifier)
+    return calls
+
+
+def test_reload_is_disabled_without_a_token(main_module, reloads, monkeypatch):
+    monkeypatch.setattr(main_module, "RELOAD_TOKEN", None)
+    response = main_module.app.test_client().post("/api/classifier/reload")
+    assert response.status_code == 404
+    assert reloads == []
+
+
+@pytest.mark.parametrize("headers", [{}, {"X-Reload-Token": "wrong"}])
+def test_reload_rejects_a_wrong_token(main_module, reloads, monkeypatch, headers):
+    monkeypatch.setattr(main_module, "RELOAD_TOKEN", "s3cret")
+    response = main_module.app.test_client().post("/api/classifier/reload", headers=headers)
+    assert response.status_code == 403
+    assert reloads == []
+
+
+def test_reload_with_the_token(main_module, reloads, monkeypatch):
+    monkeypatch.setattr(main_module, "RELOAD_TOKEN", "s3cret")
+    client = main_module.app.test_client()
+    response = client.post("/api/classifier/reload", headers={"X-Reload-Token": "s3cret"})
+    assert response.status_code == 202
+    assert response.get_json()["scope"] == "this worker only"
+
+    response = client.post("/api/classifier/reload?wait=1", headers={"X-Reload-Token": "s3cret"})
+    assert response.status_code == 200
+    assert reloads == [False, True]
@@ -0,0 +1,155 @@
+"""
+Tests for the conversation context backends (memory, SQLite, Redis)
+"""
+import os
+import time
+
+import pytest
+
+from utilities.context_backends import (
+    ContextBackend, ConversationContext, HistoryEntry, MemoryContextBackend, RedisContextBackend,
+    SQLiteContextBackend, create_context_backend
+)
+
+BACKENDS = ["memory", "sqlite", "redis"]
+SHARED_BACKENDS = ["sqlite", "redis"]
+
+
+@pytest.fixture
+def make_backend(tmp_path):
+    """Factory for a backend by name; instances of a shared backend see the same store"""
+    created, state = [], {}
+
+    def make(name: str, ttl: float = 1800, max_history: int = 3) -> ContextBackend:
+        if name == "memory":
+            backend = MemoryContextBackend(ttl=ttl, max_history=max_history)
+        elif name == "sqlite":
+            backend = SQLiteContextBackend(str(tmp_path / "contexts.db"), ttl=ttl, max_history=max_history)
+        else:
+            fakeredis = pytest.importorskip("fakeredis")
+            server = state.setdefault("server", fakeredis.FakeServer())
+            backend = RedisContextBackend(fakeredis.FakeRedis(server=server, decode_responses=True),
+                                          ttl=ttl, max_history=max_history)
+        created.append(backend)
+        return backend
+
+    yield make
+    for backend in created:
+        backend.stop_sweeper()
+
+
+def entry(message: str, intent: str = "saludo") -> HistoryEntry:
+    return HistoryEntry(time.time(), message, intent, f"re: {message}")
+
+
+def test_base_class_is_abstract():
+    with pytest.raises(TypeError):
+        ContextBackend()
+
+
+@pytest.mark.parametrize("name", BACKENDS)
+def test_unknown_user_has_no_context(make_backend, name):
+    assert make_backend(name).get("u1", "web") is None
+
+
+@pytest.mark.parametrize("name", BACKENDS)
+def test_append_exchange_keeps_latest_history(make_backend, name):
+    backend = make_backend(name)
+    for i in range(5):
+        context = backend.append_exchange("u1", "web", entry(f"m{i}", intent=f"i{i}"))
+    assert [e.message for e in context.conversation_history] == ["m2", "m3", "m4"]
+
+    context = backend.get("u1", "web")
+    assert context.current_intent == "i4"
+    assert [e.message for e in context.conversation_history] == ["m2", "m3", "m4"]
+    assert context.conversation_history[-1].response == "re: m4"
+    assert backend.get("u1", "whatsapp") is None
+
+
+@pytest.mark.parametrize("name", BACKENDS)
+def test_quote_data_merges_and_survives_exchanges(make_backend, name):
+    backend = make_backend(name)
+    backend.update_quote_data("u1", "web", {"units": 5})
+    backend.append_exchange("u1", "web", entry("hola"))
+    backend.update_quote_data("u1", "web", {"plan": "pro", "units": 7})
+
+    context = backend.get("u1", "web")
+    assert context.quote_data == {"units": 7, "plan": "pro"}
+    assert [e.message for e in context.conversation_history] == ["hola"]
+
+
+@pytest.mark.parametrize("name", BACKENDS)
+def test_put_round_trips_a_context(make_backend, name):
+    backend = make_backend(name)
+    context = ConversationContext("u1", "messenger")
+    context.current_intent = "precio"
+    context.step = 2
+    context.quote_data = {"vehicles": 3, "features": ["gps", "camara"]}
+    context.conversation_history = [entry("¿cuánto cuesta?", "precio")]
+    backend.put(context)
+
+    loaded = backend.get("u1", "messenger")
+    assert loaded.current_intent == "precio"
+    assert loaded.step == 2
+    assert loaded.quote_data == {"vehicles": 3, "features": ["gps", "camara"]}
+    assert loaded.conversation_history == context.conversation_history
+
+
+@pytest.mark.parametrize("name", SHARED_BACKENDS)
+def test_shared_backends_are_seen_by_every_worker(make_backend, name):
+    first, second = make_backend(name), make_backend(name)
+    first.append_exchange("u1", "web", entry("hola"))
+    second.append_exchange("u1", "web", entry("precio", "precio"))
+    second.update_quote_data("u1", "web", {"units": 2})
+
+    context = first.get("u1", "web")
+    assert [e.message for e in context.conversation_history] == ["hola", "precio"]
+    assert context.quote_data == {"units": 2}
+
+
+@pytest.mark.parametrize("name", ["memory", "sqlite"])
+def test_inactive_contexts_expire(make_backend, name):
+    backend = make_backend(name, ttl=0.2)
+    backend.append_exchange("u1", "web", entry("hola"))
+    time.sleep(0.3)
+    assert backend.get("u1", "web") is None
+    backend.sweep()
+    assert len(backend) == 0
+
+
+def test_redis_keys_carry_the_ttl(make_backend):
+    backend = make_backend("redis", ttl=60)
+    backend.append_exchange("u1", "web", entry("hola"))
+    backend.update_quote_data("u1", "web", {"units": 1})
+    for key in backend._keys("u1", "web"):
+        assert 0 < backend.client.ttl(key) <= 60
+    assert backend.stats()["round_trips"] == 2
+
+
+def test_unknown_backend_falls_back_to_memory():
+    backend = create_context_backend({
+        "backend": "carrier-pigeon", "context_timeout": 60, "max_context_length": 4, "max_active_contexts": 10
+    })
+    assert isinstance(backend, MemoryContextBackend)
+    assert backend.max_history == 4
+
+
+def test_sqlite_connection_is_reopened_after_fork(make_backend):
+    backend = make_backend("sqlite")
+    backend.append_exchange("u1", "web", entry("parent"))
+    parent_conn = backend._conn
+
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        try:
+            if backend._conn is not parent_conn:
+                backend.append_exchange("u1", "web", entry("child"))
+                os.write(write, b"1")
+        finally:
+            os._exit(0)
+    os.close(write)
+    os.waitpid(pid, 0)
+    assert os.read(read, 1) == b"1"
+    assert backend._conn is parent_conn
+    assert [e.message for e in backend.get("u1", "web").conversation_history] == ["parent", "child"]
@@ -0,0 +1,105 @@
+"""
+Tests for write-behind persistence of in-memory contexts into user_context
+"""
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import text
+
+from model.models import db, UserContext
+from utilities.context_backends import HistoryEntry, MemoryContextBackend
+from utilities.context_persistence import ContextPersister
+
+
+def persisted_backend(app, **kwargs) -> MemoryContextBackend:
+    """Memory backend with a persister, as after a (re)start"""
+    backend = MemoryContextBackend(ttl=1800, max_history=5)
+    backend.persister = ContextPersister(app, ttl=1800, **kwargs)
+    backend.persister.load_keys()
+    return backend
+
+
+def exchange(message: str) -> HistoryEntry:
+    return HistoryEntry(time.time(), message, "cotizacion_gps", f"re: {message}")
+
+
+def test_contexts_survive_a_restart(app):
+    backend = persisted_backend(app)
+    backend.append_exchange("u1", "whatsapp", exchange("quiero cotizar"))
+    backend.update_quote_data("u1", "whatsapp", {"units": 4})
+    backend.append_exchange("u1", "whatsapp", exchange("para camionetas"))
+    assert UserContext.query.count() == 0  # Nothing written on the reply path
+    assert backend.persister.flush() == 1
+
+    restarted = persisted_backend(app)
+    assert restarted.persister.stats()["persisted_keys"] == 1
+    context = restarted.get("u1", "whatsapp")
+    assert [entry.message for entry in context.conversation_history] == ["quiero cotizar", "para camionetas"]
+    assert context.quote_data == {"units": 4}
+    assert context.current_intent == "cotizacion_gps"
+    assert restarted.persister.stats()["loads"] == 1
+    restarted.get("u1", "whatsapp")
+    assert restarted.persister.stats()["loads"] == 1  # Loaded once, then served from memory
+
+
+def test_unknown_users_never_query_the_database(app):
+    backend = persisted_backend(app)
+    assert backend.get("new-user", "web") is None
+    assert backend.persister.stats()["loads"] == 0
+
+
+def test_each_flush_replaces_the_users_row(app):
+    backend = persisted_backend(app)
+    for message in ["a", "b", "c"]:
+        backend.append_exchange("u1", "web", exchange(message))
+        backend.persister.flush()
+
+    row = UserContext.query.one()
+    assert row.last_message == "c"
+    assert len(row.context_data["conversation_history"]) == 3
+    assert backend.persister.stats()["rows_flushed"] == 3
+
+
+def test_failed_flush_is_retried_with_the_latest_version(app):
+    backend = persisted_backend(app)
+    backend.append_exchange("u1", "web", exchange("a"))
+    with db.engine.begin() as conn:
+        conn.execute(text("ALTER TABLE user_context RENAME TO user_context_offline"))
+    assert backend.persister.flush() == 0
+    backend.append_exchange("u1", "web", exchange("b"))
+    assert backend.persister.stats()["dirty"] == 1
+
+    with db.engine.begin() as conn:
+        conn.execute(text("ALTER TABLE user_context_offline RENAME TO user_context"))
+    db.session.remove()
+    assert backend.persister.flush() == 1
+    assert UserContext.query.one().last_message == "b"
+    assert backend.persister.stats()["flush_failures"] == 1
+
+
+def test_expired_rows_are_bulk_deleted(app):
+    backend = persisted_backend(app)
+    backend.append_exchange("u1", "web", exchange("hola"))
+    backend.persister.flush()
+    UserContext.query.update({UserContext.expires_at: datetime.now() - timedelta(minutes=1)})
+    db.session.commit()
+
+    assert persisted_backend(app).get("u1", "web") is None
+    assert backend.persister.delete_expired() == 1
+    assert UserContext.query.count() == 0
+
+
+def test_full_batch_wakes_the_flusher(app):
+    backend = persisted_backend(app, flush_interval=60, batch_size=3)
+    backend.persister.start()
+    try:
+        for i in range(3):
+            backend.append_exchange(f"u{i}", "web", exchange("hola"))
+        deadline = time.monotonic() + 5
+        while backend.persister.stats()["rows_flushed"] < 3:
+            assert time.monotonic() < deadline, "full batch was not flushed early"
+            time.sleep(0.02)
+    finally:
+        backend.persister.stop()
+    db.session.remove()
+    assert UserContext.query.count() == 3
@@ -0,0 +1,49 @@
+"""
+Tests for the compact slotted context records and their bounded history
+"""
+from datetime import datetime
+
+import pytest
+
+from benchmark_context_memory import fill_original, fill_slotted, measure
+from utilities.context_backends import ConversationContext, HistoryEntry
+
+
+def test_context_has_no_instance_dict():
+    context = ConversationContext("u1", "web")
+    assert not hasattr(context, "__dict__")
+    with pytest.raises(AttributeError):
+        context.unexpected = 1
+
+
+def test_append_trims_the_history_in_place():
+    context = ConversationContext("u1", "web")
+    history = context.conversation_history
+    for i in range(15):
+        context.append(HistoryEntry(1000.0 + i, f"m{i}", f"i{i}", f"r{i}"), max_history=10)
+
+    assert context.conversation_history is history
+    assert [entry.message for entry in history] == [f"m{i}" for i in range(5, 15)]
+    assert (context.current_intent, context.last_activity) == ("i14", 1014.0)
+
+
+def test_to_dict_keeps_the_original_layout():
+    context = ConversationContext("u1", "whatsapp")
+    context.append(HistoryEntry(1700000000.5, "hola", "saludo", "¡Hola!"), max_history=10)
+    context.quote_data["units"] = 3
+
+    data = context.to_dict()
+    assert list(data) == ["user_id", "channel", "current_intent", "conversation_history", "quote_data",
+                          "last_activity", "step"]
+    assert data["conversation_history"] == [{
+        "timestamp": datetime.fromtimestamp(1700000000.5).isoformat(),
+        "message": "hola", "intent": "saludo", "response": "¡Hola!"
+    }]
+    assert data["last_activity"] == datetime.fromtimestamp(1700000000.5).isoformat()
+    assert (data["current_intent"], data["quote_data"], data["step"]) == ("saludo", {"units": 3}, 0)
+
+
+def test_slotted_contexts_use_less_memory_than_dicts():
+    original = measure(fill_original, 2000, 10)
+    slotted = measure(fill_slotted, 2000, 10)
+    assert slotted["bytes_per_context"] < original["bytes_per_context"] * 0.75
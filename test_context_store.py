@@ -0,0 +1,99 @@
+"""
+Tests for the bounded, self-evicting in-memory context store
+"""
+import time
+
+import pytest
+
+from utilities.context_backends import HistoryEntry, MemoryContextBackend
+from utilities.context_manager import ContextManager
+from utilities.context_store import ContextStore
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.time for the store module"""
+    now = [1000.0]
+    monkeypatch.setattr("utilities.context_store.time.time", lambda: now[0])
+    return now
+
+
+def test_least_recently_active_is_evicted(clock):
+    store = ContextStore(max_entries=2, ttl=60)
+    store["a"] = 1
+    clock[0] += 1
+    store["b"] = 2
+    clock[0] += 1
+    store.touch("a")  # A new message from "a": "b" is now the least recently active
+    store["c"] = 3
+
+    assert "b" not in store
+    assert (store.get("a"), store.get("c")) == (1, 3)
+    assert store.stats()["evictions"] == 1
+
+
+def test_reads_do_not_extend_a_context(clock):
+    store = ContextStore(max_entries=10, ttl=60)
+    store["a"] = 1
+    clock[0] += 30
+    assert store.get("a") == 1
+    clock[0] += 31
+    assert store.get("a") is None
+    assert store.stats()["expirations"] == 1
+    assert len(store) == 0
+
+
+def test_sweep_removes_only_expired_entries(clock):
+    store = ContextStore(max_entries=10, ttl=60)
+    for key in "abc":
+        store[key] = key
+        clock[0] += 20
+    store.touch("a")
+    clock[0] += 30  # "b" idle for 70 s, "c" for 50 s, "a" touched 30 s ago
+
+    assert store.sweep() == 1
+    assert sorted(store._entries) == ["a", "c"]
+    assert store.stats()["sweeps"] == 1
+
+
+def test_background_sweeper_expires_contexts():
+    store = ContextStore(max_entries=10, ttl=0.05)
+    store["a"] = 1
+    store.start_sweeper(interval=0.02)
+    try:
+        deadline = time.monotonic() + 5
+        while len(store):
+            assert time.monotonic() < deadline, "sweeper did not expire the context"
+            time.sleep(0.01)
+        assert store.stats()["sweeper_running"]
+    finally:
+        store.stop_sweeper()
+    assert not store.stats()["sweeper_running"]
+
+
+def test_memory_estimate_grows_with_contexts():
+    store = ContextStore()
+    empty = store.memory_bytes()
+    for i in range(50):
+        store[(f"u{i}", "web")] = {"history": ["mensaje " * 20] * 5}
+    assert store.memory_bytes() > empty + 50 * 5 * len("mensaje " * 20)
+
+
+def test_manager_starts_over_after_the_timeout(clock):
+    manager = ContextManager(backend=MemoryContextBackend(ttl=60, max_history=5, max_entries=100))
+    manager.update_context("u1", "web", "hola", "saludo", "¡Hola!")
+    assert manager.get_context("u1", "web").current_intent == "saludo"
+
+    clock[0] += 61
+    context = manager.get_context("u1", "web")
+    assert context.current_intent is None
+    assert list(context.conversation_history) == []
+
+
+def test_manager_keeps_the_latest_history(clock):
+    manager = ContextManager(backend=MemoryContextBackend(ttl=60, max_history=3, max_entries=100))
+    for i in range(5):
+        manager.update_context("u1", "web", f"m{i}", "saludo", "r")
+    history = manager.get_context("u1", "web").conversation_history
+    assert [entry.message for entry in history] == ["m2", "m3", "m4"]
+    assert all(isinstance(entry, HistoryEntry) for entry in history)
@@ -0,0 +1,129 @@
+"""
+Tests for conversation retention: archiving whole months, purging exactly the
+archived rows and reading archived months back
+"""
+import gzip
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from model.models import db, Conversation
+from utilities.conversation_archive import (
+    _partition_clause, archive_conversations, archive_month, archive_status, archived_page, load_manifest,
+    partition_conversations, purge_part
+)
+
+
+def add_conversations(*rows):
+    """Insert (user_id, channel, created_at) conversations and return their ids"""
+    conversations = [
+        Conversation(user_id=user_id, channel=channel, message=f"{user_id} {created_at:%Y-%m-%d %H:%M}",
+                     response="r", intent="saludo", confidence=0.9, created_at=created_at)
+        for user_id, channel, created_at in rows
+    ]
+    db.session.add_all(conversations)
+    db.session.commit()
+    return [c.id for c in conversations]
+
+
+def archived_ids(archive_dir, part):
+    with gzip.open(archive_dir / part["file"], "rt", encoding="utf-8") as f:
+        return [json.loads(line)["id"] for line in f]
+
+
+def live_ids():
+    db.session.expire_all()
+    return sorted(c.id for c in Conversation.query.all())
+
+
+@pytest.fixture
+def archive_dir(tmp_path):
+    return tmp_path / "archive"
+
+
+@pytest.fixture
+def old_and_recent(app):
+    """Two conversations in each of two old months and one from today"""
+    january = add_conversations(("u1", "web", datetime(2023, 1, 5)), ("u2", "whatsapp", datetime(2023, 1, 31, 23, 59)))
+    february = add_conversations(("u1", "web", datetime(2023, 2, 1)), ("u3", "messenger", datetime(2023, 2, 14)))
+    recent = add_conversations(("u1", "web", datetime.now() - timedelta(hours=1)))
+    return {"2023-01": january, "2023-02": february, "recent": recent}
+
+
+def test_old_months_are_archived_then_purged(app, archive_dir, old_and_recent):
+    summary = archive_conversations(db.engine, str(archive_dir), archive_after_days=30, purge_pause=0)
+
+    assert summary == {"2023-01": {"archived": 2, "purged": 2}, "2023-02": {"archived": 2, "purged": 2}}
+    assert live_ids() == old_and_recent["recent"]
+    manifest = load_manifest(str(archive_dir))
+    for month in ("2023-01", "2023-02"):
+        [part] = manifest["months"][month]
+        assert part["purged"] is True
+        assert part["rows"] == 2
+        assert archived_ids(archive_dir, part) == old_and_recent[month]
+    assert archive_status(db.engine, str(archive_dir))["archived_months"] == {"2023-01": 2, "2023-02": 2}
+
+
+def test_rerun_archives_late_rows_as_a_new_part(app, archive_dir, old_and_recent):
+    archive_conversations(db.engine, str(archive_dir), archive_after_days=30, purge_pause=0)
+    late = add_conversations(("u4", "web", datetime(2023, 1, 20)))
+
+    summary = archive_conversations(db.engine, str(archive_dir), archive_after_days=30, purge_pause=0)
+
+    assert summary == {"2023-01": {"archived": 1, "purged": 1}}
+    parts = load_manifest(str(archive_dir))["months"]["2023-01"]
+    assert [part["file"] for part in parts] == ["conversations-2023-01.jsonl.gz", "conversations-2023-01.2.jsonl.gz"]
+    assert archived_ids(archive_dir, parts[1]) == late
+    assert live_ids() == old_and_recent["recent"]
+
+
+def test_purge_leaves_rows_missing_from_the_part(app, archive_dir, old_and_recent):
+    manifest = load_manifest(str(archive_dir))
+    part = archive_month(db.engine, str(archive_dir), datetime(2023, 1, 1), manifest)
+    # Committed after the part was written: same month, not in the file
+    late = add_conversations(("u4", "web", datetime(2023, 1, 10)))
+
+    assert purge_part(db.engine, str(archive_dir), datetime(2023, 1, 1), part, batch_size=1, pause=0) == 2
+    assert live_ids() == sorted(late + old_and_recent["2023-02"] + old_and_recent["recent"])
+
+
+def test_unpurged_part_from_a_crashed_run_is_purged_not_archived_again(app, archive_dir, old_and_recent):
+    manifest = load_manifest(str(archive_dir))
+    archive_month(db.engine, str(archive_dir), datetime(2023, 1, 1), manifest)  # Crash before the purge
+
+    summary = archive_conversations(db.engine, str(archive_dir), archive_after_days=30, purge_pause=0)
+
+    assert summary["2023-01"] == {"archived": 0, "purged": 2}
+    [part] = load_manifest(str(archive_dir))["months"]["2023-01"]
+    assert part["purged"] is True
+    assert live_ids() == old_and_recent["recent"]
+
+
+def test_archived_pages_use_filters_and_cursor(app, archive_dir, old_and_recent):
+    archive_conversations(db.engine, str(archive_dir), archive_after_days=30, purge_pause=0)
+    archived = old_and_recent["2023-01"] + old_and_recent["2023-02"]
+
+    first, has_more = archived_page(str(archive_dir), {}, None, per_page=3)
+    assert has_more
+    last = first[-1]
+    rest, has_more = archived_page(str(archive_dir), {}, (datetime.fromisoformat(last["created_at"]), last["id"]), 3)
+    assert not has_more
+    assert [row["id"] for row in first + rest] == list(reversed(archived))
+    assert all(row["archived"] for row in first + rest)
+
+    web, _ = archived_page(str(archive_dir), {"channel": "web"}, None, per_page=10)
+    assert [row["id"] for row in web] == [old_and_recent["2023-02"][0], old_and_recent["2023-01"][0]]
+    february, _ = archived_page(str(archive_dir), {"since": datetime(2023, 2, 1), "until": datetime(2023, 3, 1)},
+                                None, per_page=10)
+    assert [row["id"] for row in february] == list(reversed(old_and_recent["2023-02"]))
+
+
+@pytest.mark.parametrize("timestamp, bound", [(True, "UNIX_TIMESTAMP('2025-01-01')"), (False, "'2025-01-01'")])
+def test_partition_bounds_follow_the_created_at_type(timestamp, bound):
+    assert _partition_clause(datetime(2024, 12, 1), timestamp) == f"PARTITION p202412 VALUES LESS THAN ({bound})"
+
+
+def test_partitioning_is_mysql_only(app):
+    with pytest.raises(ValueError):
+        partition_conversations(db.engine)
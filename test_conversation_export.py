@@ -0,0 +1,92 @@
+"""
+Tests for the streaming conversation export
+"""
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from model.models import db, Conversation, ResponseTemplate, Seller
+from utilities.conversation_export import EXPORT_FIELDS, export_stream, iter_conversation_batches
+
+
+@pytest.fixture
+def conversations(app):
+    """Five conversations oldest first; one with a seller, one stored as a template reference"""
+    seller = Seller(name="Ana")
+    template = ResponseTemplate(source="dataset", template_key="saludo", version="1", text="¡Hola! ¿En qué te ayudo?")
+    db.session.add_all([seller, template])
+    db.session.flush()
+    base = datetime(2024, 5, 1, 12, 0, 0)
+    rows = [
+        Conversation(user_id="u1", channel="web", message="hola", response=None, response_template_id=template.id,
+                     intent="saludo", confidence=0.9, created_at=base, context_data={"step": 1}),
+        Conversation(user_id="u2", channel="whatsapp", message="precio, \"plan\"", response="Desde $199",
+                     intent="precio", confidence=0.8, created_at=base + timedelta(minutes=1), seller_id=seller.id),
+    ] + [
+        Conversation(user_id="u1", channel="web", message=f"m{i}", response="r", intent="otro", confidence=0.5,
+                     created_at=base + timedelta(minutes=2 + i))
+        for i in range(3)
+    ]
+    db.session.add_all(rows)
+    db.session.commit()
+    return rows
+
+
+def read_ndjson(body: bytes):
+    return [json.loads(line) for line in body.decode("utf-8").splitlines()]
+
+
+def test_batches_are_bounded_and_ordered(app, conversations):
+    batches = list(iter_conversation_batches(db.engine, [], batch_rows=2))
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+    assert [row["id"] for batch in batches for row in batch] == [c.id for c in conversations]
+
+
+def test_ndjson_rehydrates_templates_and_sellers(app, conversations):
+    rows = read_ndjson(b"".join(export_stream(db.engine, [], "ndjson", compress=False)))
+    assert len(rows) == 5
+    assert list(rows[0]) == EXPORT_FIELDS
+    assert rows[0]["response"] == "¡Hola! ¿En qué te ayudo?"
+    assert rows[0]["context_data"] == {"step": 1}
+    assert rows[0]["created_at"] == "2024-05-01T12:00:00"
+    assert rows[1]["seller_name"] == "Ana"
+    assert rows[2]["seller_name"] is None
+
+
+def test_csv_has_header_and_escapes_values(app, conversations):
+    body = b"".join(export_stream(db.engine, [Conversation.channel == "whatsapp"], "csv", compress=False))
+    rows = list(csv.DictReader(io.StringIO(body.decode("utf-8"))))
+    assert len(rows) == 1
+    assert rows[0]["message"] == "precio, \"plan\""
+    assert rows[0]["seller_name"] == "Ana"
+
+
+def test_gzip_stream_decompresses_to_plain_export(app, conversations):
+    plain = b"".join(export_stream(db.engine, [], "ndjson", compress=False))
+    compressed = b"".join(export_stream(db.engine, [], "ndjson", compress=True))
+    assert gzip.decompress(compressed) == plain
+
+
+def test_export_endpoint(main_module):
+    client = main_module.app.test_client()
+    with main_module.app.app_context():
+        db.session.add(Conversation(user_id="u9", channel="messenger", message="hola", response="r",
+                                    intent="saludo", confidence=0.9, created_at=datetime(2024, 6, 1)))
+        db.session.commit()
+    try:
+        response = client.get("/api/conversations/export", query_string={"channel": "messenger", "gzip": 1})
+        assert response.status_code == 200
+        assert response.mimetype == "application/gzip"
+        assert ".ndjson.gz" in response.headers["Content-Disposition"]
+        assert [row["user_id"] for row in read_ndjson(gzip.decompress(response.data))] == ["u9"]
+
+        assert client.get("/api/conversations/export", query_string={"format": "xml"}).status_code == 400
+        assert client.get("/api/conversations/export", query_string={"since": "yesterday"}).status_code == 400
+    finally:
+        with main_module.app.app_context():
+            Conversation.query.delete()
+            db.session.commit()
@@ -0,0 +1,81 @@
+"""
+Tests for keyset pagination of /api/conversations
+"""
+from datetime import datetime, timedelta
+
+import pytest
+
+from model.models import db, Conversation
+
+
+@pytest.fixture
+def client(main_module):
+    """Test client over seven conversations, three of them sharing a created_at"""
+    main_app = main_module.app
+    with main_app.app_context():
+        Conversation.query.delete()
+        base = datetime(2024, 5, 1, 12, 0, 0)
+        for i, minutes in enumerate([0, 1, 2, 2, 2, 3, 4]):
+            db.session.add(Conversation(
+                user_id=f"u{i % 2}", channel="web" if i % 2 else "whatsapp", message=f"m{i}",
+                response="r", intent="saludo", confidence=0.9, created_at=base + timedelta(minutes=minutes)
+            ))
+        db.session.commit()
+        expected = [c.id for c in Conversation.query.order_by(
+            Conversation.created_at.desc(), Conversation.id.desc()
+        )]
+    client = main_app.test_client()
+    client.expected = expected
+    yield client
+    with main_app.app_context():
+        Conversation.query.delete()
+        db.session.commit()
+
+
+def test_cursor_round_trip(main_module):
+    created_at = datetime(2024, 5, 1, 12, 30, 15, 123456)
+    assert main_module.decode_cursor(main_module.encode_cursor(created_at, 42)) == (created_at, 42)
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "WzFd", ""])
+def test_malformed_cursor_raises(main_module, cursor):
+    with pytest.raises(ValueError):
+        main_module.decode_cursor(cursor)
+
+
+def test_pages_cover_every_row_once_in_order(client):
+    ids, cursor, pages = [], None, 0
+    while True:
+        response = client.get("/api/conversations", query_string={"per_page": 2, **({"cursor": cursor} if cursor else {})})
+        assert response.status_code == 200
+        data = response.get_json()
+        ids += [c["id"] for c in data["conversations"]]
+        pages += 1
+        cursor = data["next_cursor"]
+        if cursor is None:
+            break
+    assert ids == client.expected
+    assert pages == 4
+
+
+def test_last_full_page_has_no_next_cursor(client):
+    data = client.get("/api/conversations", query_string={"per_page": 7}).get_json()
+    assert [c["id"] for c in data["conversations"]] == client.expected
+    assert data["next_cursor"] is None
+
+
+def test_filters_apply_across_pages(client):
+    first = client.get("/api/conversations", query_string={"per_page": 2, "channel": "web", "total": "exact"}).get_json()
+    assert first["total"] == 3
+    second = client.get("/api/conversations", query_string={
+        "per_page": 2, "channel": "web", "cursor": first["next_cursor"]
+    }).get_json()
+    conversations = first["conversations"] + second["conversations"]
+    assert [c["channel"] for c in conversations] == ["web"] * 3
+    assert second["next_cursor"] is None
+
+
+def test_invalid_cursor_is_a_bad_request(client):
+    response = client.get("/api/conversations", query_string={"cursor": "garbage"})
+    assert response.status_code == 400
+    assert response.get_json()["error"] == "Invalid cursor"
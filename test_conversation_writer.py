@@ -0,0 +1,134 @@
+"""
+Tests for the background conversation writer: batching, spill to disk and replay
+"""
+import json
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import text
+
+from model.models import db, ChatReport, Conversation
+from utilities.conversation_writer import ConversationWriter
+
+
+def make_row(user_id: str = "u1", channel: str = "web", intent: str = "saludo", message: str = "Hola"):
+    now = datetime.now()
+    return {
+        "user_id": user_id, "channel": channel, "message": message, "response": "Respuesta",
+        "intent": intent, "confidence": 0.9, "session_id": f"{user_id}_{channel}_{now.strftime('%Y%m%d')}",
+        "created_at": now
+    }
+
+
+def wait_for(condition, timeout: float = 5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        time.sleep(0.02)
+
+
+def test_rows_are_written_in_batches(app, tmp_path):
+    writer = ConversationWriter(app, batch_size=10, flush_interval=0.5, spill_dir=str(tmp_path / "spill"))
+    for i in range(25):
+        writer.submit("u1", "web", f"mensaje {i}", "Respuesta", "saludo", 0.9)
+    writer.start()
+    wait_for(lambda: writer.stats()["written"] == 25)
+    writer.stop()
+
+    stats = writer.stats()
+    assert stats["batches"] == 3
+    assert stats["write_failures"] == 0
+    assert stats["skipped_steps"] == []
+    assert Conversation.query.count() == 25
+
+
+def test_stop_flushes_queued_rows(app, tmp_path):
+    writer = ConversationWriter(app, batch_size=10, spill_dir=str(tmp_path / "spill"))
+    for i in range(5):
+        writer.submit("u1", "web", f"mensaje {i}", "Respuesta", "saludo", 0.9)
+    writer.stop()
+    assert Conversation.query.count() == 5
+
+
+def test_failed_batch_is_spilled_and_replayed(app, tmp_path):
+    spill_dir = tmp_path / "spill"
+    writer = ConversationWriter(app, spill_dir=str(spill_dir))
+    with db.engine.begin() as conn:
+        conn.execute(text("ALTER TABLE conversations RENAME TO conversations_offline"))
+
+    assert writer.flush_rows([make_row(message="a"), make_row(message="b")]) is False
+    assert writer.stats()["spilled"] == 2
+    assert len(list(spill_dir.glob("conversations-*.jsonl"))) == 1
+
+    with db.engine.begin() as conn:
+        conn.execute(text("ALTER TABLE conversations_offline RENAME TO conversations"))
+    db.session.remove()
+    assert writer.replay_spill() == 2
+    assert sorted(c.message for c in Conversation.query.all()) == ["a", "b"]
+    assert list(spill_dir.iterdir()) == []
+
+
+def test_replay_quarantines_corrupt_lines(app, tmp_path):
+    spill_dir = tmp_path / "spill"
+    spill_dir.mkdir()
+    row = make_row(message="ok")
+    (spill_dir / "conversations-20240101.jsonl").write_text(
+        json.dumps({**row, "created_at": row["created_at"].isoformat()}) + "\n" + '{"user_id": "u1", "trunc\n',
+        encoding="utf-8"
+    )
+    writer = ConversationWriter(app, spill_dir=str(spill_dir))
+
+    assert writer.replay_spill() == 1
+    assert [c.message for c in Conversation.query.all()] == ["ok"]
+    corrupt = list(spill_dir.glob("corrupt-*.jsonl"))
+    assert len(corrupt) == 1
+    assert corrupt[0].read_text(encoding="utf-8") == '{"user_id": "u1", "trunc\n'
+
+
+def test_replay_reclaims_files_left_by_dead_process(app, tmp_path):
+    spill_dir = tmp_path / "spill"
+    spill_dir.mkdir()
+    pid = os.fork()
+    if pid == 0:
+        os._exit(0)
+    os.waitpid(pid, 0)
+    row = make_row(message="left over")
+    (spill_dir / f"conversations-20240101.jsonl.{pid}-0123abcd.replaying").write_text(
+        json.dumps({**row, "created_at": row["created_at"].isoformat()}) + "\n", encoding="utf-8"
+    )
+    # Claimed by a live process (this one's parent): not ours to replay
+    (spill_dir / f"conversations-20240102.jsonl.{os.getppid()}-0123abcd.replaying").write_text("", encoding="utf-8")
+    writer = ConversationWriter(app, spill_dir=str(spill_dir))
+
+    assert writer.replay_spill() == 1
+    assert [c.message for c in Conversation.query.all()] == ["left over"]
+    assert [p.name for p in spill_dir.iterdir()] == [f"conversations-20240102.jsonl.{os.getppid()}-0123abcd.replaying"]
+
+
+def test_chat_reports_are_upserted_per_batch(app, tmp_path):
+    writer = ConversationWriter(app, spill_dir=str(tmp_path / "spill"))
+    assert writer.flush_rows([make_row("u1", intent="saludo"), make_row("u1", intent="precio"),
+                              make_row("u2", channel="whatsapp", intent="saludo")])
+    assert writer.flush_rows([make_row("u1", intent="saludo")])
+
+    reports = {(r.user_id, r.channel): r for r in ChatReport.query.all()}
+    assert set(reports) == {("u1", "web"), ("u2", "whatsapp")}
+    assert reports[("u1", "web")].message_count == 3
+    assert reports[("u1", "web")].intent_summary == {"saludo": 2, "precio": 1}
+    assert reports[("u2", "whatsapp")].message_count == 1
+    assert reports[("u2", "whatsapp")].intent_summary == {"saludo": 1}
+
+
+def test_pending_migrations_skip_steps_without_losing_rows(app, tmp_path):
+    with db.engine.begin() as conn:
+        conn.execute(text("DELETE FROM schema_migrations WHERE version IN (2, 3, 4)"))
+    writer = ConversationWriter(app, spill_dir=str(tmp_path / "spill"))
+
+    assert writer.flush_rows([make_row(intent="saludo"), make_row(intent="saludo")])
+    assert writer.flush_rows([make_row(intent="precio")])
+    assert sorted(writer.stats()["skipped_steps"]) == ["report_key", "rollups", "templates"]
+    assert Conversation.query.count() == 3
+    report = ChatReport.query.one()
+    assert report.message_count == 3
+    assert report.intent_summary == {"saludo": 2, "precio": 1}
@@ -0,0 +1,93 @@
+"""
+Tests for the process-wide asyncio event loop worker
+"""
+import asyncio
+import threading
+
+import pytest
+from flask import Flask, current_app
+
+from utilities.event_loop import EventLoopWorker
+
+
+@pytest.fixture
+def worker():
+    worker = EventLoopWorker(Flask("event-loop-test"), request_timeout=2, shutdown_timeout=1)
+    worker.start()
+    yield worker
+    worker.stop()
+
+
+async def loop_thread():
+    await asyncio.sleep(0)
+    return threading.current_thread().name, id(asyncio.get_running_loop()), current_app.name
+
+
+def test_every_call_shares_one_loop_with_an_app_context(worker):
+    results = {worker.run(loop_thread()) for _ in range(3)}
+    assert len(results) == 1
+    name, _, app_name = results.pop()
+    assert (name, app_name) == ("event-loop", "event-loop-test")
+    assert worker.stats() == {"submitted": 3, "completed": 3, "failed": 0, "timeouts": 0, "in_flight": 0,
+                              "running": True}
+
+
+def test_errors_reach_the_caller(worker):
+    async def fail():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError, match="boom"):
+        worker.run(fail())
+    assert worker.stats()["failed"] == 1
+
+
+def test_timeout_cancels_the_coroutine(worker):
+    cancelled = threading.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(TimeoutError):
+        worker.run(slow(), timeout=0.1)
+    assert cancelled.wait(1)
+    assert worker.stats()["timeouts"] == 1
+
+
+def test_submit_from_the_loop_thread_is_rejected(worker):
+    async def nested():
+        inner = asyncio.sleep(0)
+        with pytest.raises(RuntimeError):
+            worker.submit(inner)
+        return True
+
+    assert worker.run(nested())
+
+
+def test_http_session_is_shared_and_closed_on_stop(worker):
+    pytest.importorskip("aiohttp")
+
+    async def session():
+        return await worker.http_session()
+
+    first = worker.run(session())
+    assert worker.run(session()) is first
+    worker.stop()
+    assert first.closed
+    assert not worker.stats()["running"]
+
+
+def test_stop_drains_in_flight_coroutines_and_restarts_on_demand(worker):
+    async def short():
+        await asyncio.sleep(0.2)
+        return "done"
+
+    future = worker.submit(short())
+    worker.stop()
+    assert future.result(0) == "done"
+
+    assert worker.run(short()) == "done"
+    assert worker.stats()["running"]
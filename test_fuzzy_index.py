@@ -0,0 +1,73 @@
+"""
+Tests for the character-trigram typo index
+"""
+import random
+
+import pytest
+
+from utilities.classifier import GPSControlClassifier
+from utilities.fuzzy_index import TrigramIndex, edit_distance
+
+
+def levenshtein(a: str, b: str) -> int:
+    """Unbounded reference distance"""
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char_a != char_b)))
+        previous = current
+    return previous[-1]
+
+
+def test_bounded_edit_distance_matches_levenshtein():
+    rng = random.Random(11)
+    for _ in range(2000):
+        a = "".join(rng.choices("abcz", k=rng.randint(0, 7)))
+        b = "".join(rng.choices("abcz", k=rng.randint(0, 7)))
+        for max_distance in (1, 2):
+            distance = levenshtein(a, b)
+            assert edit_distance(a, b, max_distance) == (distance if distance <= max_distance else max_distance + 1)
+
+
+@pytest.fixture
+def index():
+    return TrigramIndex(["cotizar", "camaras", "camara", "satelital", "instalacion", "gps", "de", "flota mixta"])
+
+
+@pytest.mark.parametrize("token, expected", [
+    ("cotisar", "cotizar"),
+    ("camras", "camaras"),
+    ("satelitall", "satelital"),
+    ("instalasion", "instalacion"),  # Two edits allowed from 8 characters
+    ("cotizar", None),  # Known word
+    ("gsp", None),  # Too short to correct
+    ("2024", None),
+    ("zzzzzz", None),
+    ("cotxxxr", None),  # Beyond the edit budget
+])
+def test_correct(index, token, expected):
+    assert index.correct(token) == expected
+
+
+def test_vocabulary_skips_short_words_and_phrases(index):
+    assert index.words == ["camara", "camaras", "cotizar", "instalacion", "satelital"]
+
+
+def test_correct_text_reports_corrections(index):
+    assert index.correct_text("quiero cotisar camras de gps") == (
+        "quiero cotizar camaras de gps", {"cotisar": "cotizar", "camras": "camaras"}
+    )
+
+
+def test_misspelled_message_is_rescued(tmp_path):
+    tolerant = GPSControlClassifier(index_dir=tmp_path)
+    strict = GPSControlClassifier(index_dir=tmp_path, typo_tolerance=False)
+    message = "quiero cotisar camras para mi flota"
+
+    match = tolerant.find_best_match(message)
+    assert match["typo_corrections"] == {"cotisar": "cotizar", "camras": "camaras"}
+    assert match["similarity_score"] > strict.find_best_match(message)["similarity_score"]
+    assert tolerant.get_match_stats()["typo_rescues"] == 1
+    # Correctly spelled messages are never rewritten
+    assert "typo_corrections" not in tolerant.find_best_match("quiero cotizar camaras para mi flota")
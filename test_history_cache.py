@@ -0,0 +1,192 @@
+"""
+Tests for the prompt history ring cache (memory, SQLite, Redis)
+"""
+import time
+from datetime import datetime
+
+import pytest
+
+from model.models import db, Conversation
+from utilities.context_backends import HistoryEntry
+from utilities.history_cache import (
+    MemoryHistoryCache, RedisHistoryCache, SQLiteHistoryCache, merge_exchanges
+)
+
+BACKENDS = ["memory", "sqlite", "redis"]
+
+
+class Stored:
+    """Stand-in for main.load_history over a list of stored exchanges, counting queries"""
+
+    def __init__(self, *entries: HistoryEntry):
+        self.entries = sorted(entries, key=lambda entry: entry.timestamp)
+        self.queries = 0
+
+    def __call__(self, user_id: str, channel: str, before, limit: int):
+        self.queries += 1
+        rows = [entry for entry in self.entries if before is None or entry.timestamp <= before]
+        return rows[-limit:]
+
+
+@pytest.fixture
+def make_cache(tmp_path):
+    """Factory for a cache by name; caches of a shared backend see the same rings"""
+    state = {}
+
+    def make(name: str, size: int = 3, **kwargs):
+        if name == "memory":
+            return MemoryHistoryCache(size=size, **kwargs)
+        if name == "sqlite":
+            return SQLiteHistoryCache(str(tmp_path / "history.db"), size=size, **kwargs)
+        fakeredis = pytest.importorskip("fakeredis")
+        server = state.setdefault("server", fakeredis.FakeServer())
+        return RedisHistoryCache(fakeredis.FakeRedis(server=server, decode_responses=True), size=size, **kwargs)
+
+    return make
+
+
+def exchange(timestamp: float, message: str) -> HistoryEntry:
+    return HistoryEntry(timestamp, message, "saludo", f"re: {message}")
+
+
+@pytest.mark.parametrize("name", BACKENDS)
+def test_append_then_recent_fills_once(make_cache, name):
+    cache = make_cache(name)
+    stored = Stored()
+    for i in range(4):
+        cache.append("u1", "web", exchange(1000 + i, f"m{i}"))
+
+    assert [e.message for e in cache.recent("u1", "web", stored)] == ["m1", "m2", "m3"]
+    assert [e.message for e in cache.recent("u1", "web", stored)] == ["m1", "m2", "m3"]
+    assert stored.queries == 1
+    assert cache.stats()["hits"] == 1
+
+
+@pytest.mark.parametrize("name", BACKENDS)
+def test_partial_ring_is_filled_from_the_database(make_cache, name):
+    cache = make_cache(name)
+    stored = Stored(exchange(1000, "old0"), exchange(1001, "old1"), exchange(1002, "m2"))
+    cache.append("u1", "web", exchange(1002.4, "m2"))  # Also flushed to the database already
+    cache.append("u1", "web", exchange(1003, "m3"))
+
+    assert [e.message for e in cache.recent("u1", "web", stored)] == ["old1", "m2", "m3"]
+    entries, complete = cache.get("u1", "web")
+    assert complete
+    assert [e.message for e in entries] == ["old1", "m2", "m3"]
+
+    cache.append("u1", "web", exchange(1004, "m4"))
+    assert [e.message for e in cache.recent("u1", "web", stored)] == ["m2", "m3", "m4"]
+    assert stored.queries == 1
+
+
+@pytest.mark.parametrize("name", BACKENDS)
+def test_empty_ring_reads_the_latest_rows(make_cache, name):
+    cache = make_cache(name)
+    stored = Stored(*(exchange(1000 + i, f"m{i}") for i in range(5)))
+    assert [e.message for e in cache.recent("u1", "web", stored)] == ["m2", "m3", "m4"]
+    assert [e.message for e in cache.recent("u1", "web", stored)] == ["m2", "m3", "m4"]
+    assert stored.queries == 1
+
+
+def test_memory_ring_is_refilled_after_refresh(make_cache):
+    cache = make_cache("memory", refresh=0.1)
+    stored = Stored(exchange(1000, "m0"))
+    cache.append("u1", "web", exchange(1001, "m1"))
+    assert [e.message for e in cache.recent("u1", "web", stored)] == ["m0", "m1"]
+
+    # Handled by another worker: not in this ring until the next fill
+    stored.entries.append(exchange(1002, "other worker"))
+    assert [e.message for e in cache.recent("u1", "web", stored)] == ["m0", "m1"]
+    time.sleep(0.15)
+    assert [e.message for e in cache.recent("u1", "web", stored)] == ["m0", "m1", "other worker"]
+    assert stored.queries == 2
+
+
+def test_memory_refresh_zero_reads_the_database_every_time(make_cache):
+    cache = make_cache("memory", refresh=0)
+    stored = Stored(exchange(1000, "m0"))
+    for _ in range(3):
+        assert [e.message for e in cache.recent("u1", "web", stored)] == ["m0"]
+    assert stored.queries == 3
+
+
+@pytest.mark.parametrize("name", ["sqlite", "redis"])
+def test_shared_rings_see_every_worker(make_cache, name):
+    first, second = make_cache(name), make_cache(name)
+    stored = Stored()
+    first.append("u1", "web", exchange(1000, "a"))
+    second.append("u1", "web", exchange(1001, "b"))
+    assert [e.message for e in first.recent("u1", "web", stored)] == ["a", "b"]
+    assert [e.message for e in second.recent("u1", "web", stored)] == ["a", "b"]
+    assert stored.queries == 1
+
+
+class RacingClient:
+    """Redis client whose next transaction starts after another worker's call (between WATCH and MULTI)"""
+
+    def __init__(self, client, race):
+        self.client = client
+        self.race = race
+
+    def pipeline(self, transaction: bool = True):
+        pipe = self.client.pipeline(transaction=transaction)
+        multi, race = pipe.multi, self.race
+        self.race = None
+
+        def racing_multi():
+            if race is not None:
+                race()
+            return multi()
+
+        pipe.multi = racing_multi
+        return pipe
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def test_redis_fill_race_prepends_once(make_cache):
+    first, second = make_cache("redis"), make_cache("redis")
+    stored = Stored(exchange(1000, "old"))
+    first.append("u1", "web", exchange(1001, "new"))
+
+    first.client = RacingClient(first.client, lambda: second.recent("u1", "web", stored))
+    assert [e.message for e in first.recent("u1", "web", stored)] == ["old", "new"]
+
+    entries, complete = second.get("u1", "web")
+    assert complete
+    assert [e.message for e in entries] == ["old", "new"]
+
+
+@pytest.mark.parametrize("name", BACKENDS)
+def test_rounded_database_timestamp_is_the_same_exchange(make_cache, name):
+    cache = make_cache(name)
+    # MySQL DATETIME rounds :00.7 up to :01, so the stored row is later than the ring entry
+    cache.append("u1", "web", exchange(1000.7, "hola"))
+    stored = Stored(exchange(999, "antes"), exchange(1001, "hola"))
+    assert [e.message for e in cache.recent("u1", "web", stored)] == ["antes", "hola"]
+
+
+def test_merge_keeps_distinct_exchanges():
+    ring = [exchange(1000.7, "hola")]
+    stored = [exchange(1001, "hola"), exchange(1001, "otra"), exchange(1003, "hola")]
+    assert [(e.timestamp, e.message) for e in merge_exchanges(stored, ring)] == [
+        (1000.7, "hola"), (1001, "otra"), (1003, "hola")
+    ]
+
+
+def test_fractional_created_at_round_trip(main_module):
+    """A row stored with a rounded created_at and its ring entry reach the prompt once"""
+    created_at = datetime(2024, 5, 1, 12, 0, 0, 700000)
+    cache = MemoryHistoryCache(size=3)
+    cache.append("u-round", "web", HistoryEntry(created_at.timestamp(), "hola", "saludo", "¡Hola!"))
+    with main_module.app.app_context():
+        db.session.add(Conversation(user_id="u-round", channel="web", message="hola", response="¡Hola!",
+                                    intent="saludo", confidence=0.9, created_at=datetime(2024, 5, 1, 12, 0, 1)))
+        db.session.commit()
+        try:
+            entries = cache.recent("u-round", "web", main_module.load_history)
+        finally:
+            Conversation.query.filter_by(user_id="u-round").delete()
+            db.session.commit()
+    assert [(e.message, e.response) for e in entries] == [("hola", "¡Hola!")]
@@ -0,0 +1,51 @@
+"""
+Tests for the single-pass compiled intent matcher
+"""
+import re
+
+import pytest
+
+from benchmark_intent_matcher import build_corpus, compiled_get_intent, reference_get_intent
+from utilities.intent_matcher import IntentMatcher, LiteralScanner, leading_literal, trie_regex
+
+
+def test_matches_the_original_loop_on_the_benchmark_corpus():
+    corpus = build_corpus(synthetic=3000, seed=42)
+    mismatches = [(message, reference_get_intent(message), compiled_get_intent(message))
+                  for message in corpus if reference_get_intent(message) != compiled_get_intent(message)]
+    assert mismatches == []
+    # The corpus does exercise the matcher, not only the "general" fallback
+    assert sum(reference_get_intent(message)[0] != "general" for message in corpus) > len(corpus) // 4
+
+
+@pytest.mark.parametrize("pattern, literal", [
+    ("precio", "precio"),
+    ("cotiz[ar|ación]", "cotiz"),
+    ("cuanto.*cuesta", "cuanto"),
+    ("camaras?", "camara"),
+    ("(hola|buenas)", ""),
+    (".*gps", ""),
+])
+def test_leading_literal(pattern, literal):
+    assert leading_literal(pattern) == literal
+
+
+def test_scanner_finds_overlapping_and_prefix_words():
+    scanner = LiteralScanner(["gps", "gps satelital", "sat", "satelital", "tel"])
+    assert scanner.scan("rastreo gps satelital") == {"gps", "gps satelital", "sat", "satelital", "tel"}
+    assert scanner.scan("nada") == set()
+    assert LiteralScanner([]).scan("gps") == set()
+
+
+def test_trie_regex_prefers_the_longest_word():
+    assert re.match(trie_regex(["cam", "camara", "camaras"]), "camaras").group() == "camaras"
+
+
+def test_duplicate_keywords_and_untriggered_patterns_count_like_the_loop():
+    patterns = {"saludo": ["(hola|buenas)", "buen dia"], "precio": ["precio", "cuanto.*cuesta"]}
+    keywords = ["gps", "gps", "precio"]
+    matcher = IntentMatcher(patterns, keywords)
+    # "gps" is listed twice, so it adds 0.2 to every intent's score
+    assert matcher.get_intent("hola, precio del gps?") == ("saludo", pytest.approx((1 + 0.3) / 2))
+    assert matcher.get_intent("cuanto cuesta, cuanto cuesta el precio") == ("precio", 0.9)
+    assert matcher.get_intent("nada que ver") == ("general", 0.0)
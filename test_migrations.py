@@ -0,0 +1,133 @@
+"""
+Tests for the versioned schema migrations, run from the setup_database.sql schema (version 0)
+"""
+import re
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+from model.migrations import MIGRATIONS, apply_migrations, migration_lock, schema_status
+
+SETUP_SQL = Path(__file__).parent / "setup_database.sql"
+
+
+def sqlite_ddl(sql: str):
+    """CREATE TABLE/INSERT statements of setup_database.sql in SQLite syntax"""
+    for statement in sql.split(";"):
+        statement = "\n".join(line for line in statement.splitlines() if not line.strip().startswith("--")).strip()
+        if not statement.startswith(("CREATE TABLE", "INSERT")):
+            continue
+        statement = statement.replace("INT AUTO_INCREMENT PRIMARY KEY", "INTEGER PRIMARY KEY AUTOINCREMENT")
+        yield re.sub(r"\s+ON UPDATE CURRENT_TIMESTAMP", "", statement)
+
+
+@pytest.fixture
+def engine(tmp_path):
+    """SQLite database created by setup_database.sql: base tables only, schema version 0"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'setup.db'}")
+    with engine.begin() as conn:
+        for statement in sqlite_ddl(SETUP_SQL.read_text(encoding="utf-8")):
+            conn.execute(text(statement))
+    yield engine
+    engine.dispose()
+
+
+def indexes(engine, table: str) -> set:
+    """Index and unique constraint names (create_all declares the chat_reports key as a constraint)"""
+    inspector = inspect(engine)
+    return {index["name"] for index in inspector.get_indexes(table)} | {
+        constraint["name"] for constraint in inspector.get_unique_constraints(table) if constraint["name"]
+    }
+
+
+def add_history(engine):
+    with engine.begin() as conn:
+        conn.execute(text(
+            "INSERT INTO conversations (user_id, channel, message, response, intent, created_at) VALUES "
+            "('u1', 'web', 'hola', 'r', 'saludo', '2024-05-01 10:00:00'), "
+            "('u1', 'web', 'precio', 'r', 'precio', '2024-05-01 10:30:00'), "
+            "('u2', 'whatsapp', 'hola', 'r', 'saludo', '2024-05-02 09:00:00')"
+        ))
+        # Duplicates left by the old read-modify-write report updates
+        conn.execute(text(
+            "INSERT INTO chat_reports (user_id, channel, message_count, last_interaction, intent_summary) VALUES "
+            "('u1', 'web', 1, '2024-05-01 10:00:00', '{\"saludo\": 1}'), "
+            "('u1', 'web', 1, '2024-05-01 10:30:00', '{\"precio\": 1}'), "
+            "('u2', 'whatsapp', 1, '2024-05-02 09:00:00', '{\"saludo\": 1}')"
+        ))
+
+
+def test_upgrade_from_version_0(engine):
+    assert schema_status(engine) == {"version": 0, "latest": MIGRATIONS[-1].version,
+                                     "pending": [m.version for m in MIGRATIONS]}
+    add_history(engine)
+
+    assert apply_migrations(engine) == [m.version for m in MIGRATIONS]
+    assert schema_status(engine)["pending"] == []
+    assert {"idx_conversations_user_channel_created", "idx_conversations_created_at",
+            "idx_conversations_channel_created", "idx_conversations_intent_created"} <= indexes(engine, "conversations")
+    assert {"idx_user_context_user_channel", "idx_user_context_expires_at"} <= indexes(engine, "user_context")
+    assert "uq_chat_reports_user_channel" in indexes(engine, "chat_reports")
+    assert "response_template_id" in {c["name"] for c in inspect(engine).get_columns("conversations")}
+
+    with engine.connect() as conn:
+        reports = conn.execute(text(
+            "SELECT user_id, message_count, last_interaction, intent_summary FROM chat_reports ORDER BY user_id"
+        )).all()
+        totals = conn.execute(text(
+            "SELECT messages, unique_users FROM conversation_rollups WHERE period = 'all' AND channel = 'all'"
+        )).one()
+    assert [(r[0], r[1], str(r[2])[:19]) for r in reports] == [
+        ("u1", 2, "2024-05-01 10:30:00"), ("u2", 1, "2024-05-02 09:00:00")
+    ]
+    assert '"precio": 1' in reports[0][3] and '"saludo": 1' in reports[0][3]
+    assert tuple(totals) == (3, 2)
+
+
+def test_nothing_pending_is_a_no_op(engine):
+    apply_migrations(engine)
+    assert apply_migrations(engine) == []
+
+
+def test_every_step_can_be_re_run(engine):
+    """A migration interrupted after its DDL committed (MySQL) is simply run again"""
+    add_history(engine)
+    apply_migrations(engine)
+    with engine.begin() as conn:
+        conn.execute(text("DELETE FROM schema_migrations"))
+
+    assert apply_migrations(engine) == [m.version for m in MIGRATIONS]
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT COUNT(*) FROM chat_reports")).scalar() == 2
+        assert conn.execute(text(
+            "SELECT messages FROM conversation_rollups WHERE period = 'all' AND channel = 'all'"
+        )).scalar() == 3
+
+
+def test_model_schema_gets_the_same_indexes(app, engine):
+    """db.create_all (model metadata) and setup_database.sql + migrations end with the same indexes"""
+    from model.models import db
+    apply_migrations(engine)
+    for table in ("conversations", "chat_reports", "user_context"):
+        assert indexes(db.engine, table) == indexes(engine, table), table
+
+
+def test_migration_lock_excludes_other_processes(engine):
+    with migration_lock(engine):
+        with pytest.raises(RuntimeError):
+            # A separate open file description, like another process
+            with migration_lock(engine, timeout=0.3):
+                pass
+    with migration_lock(engine, timeout=0.3):
+        pass
+
+
+def test_applied_at_is_recorded(engine):
+    before = datetime.now().replace(microsecond=0)
+    apply_migrations(engine)
+    with engine.connect() as conn:
+        rows = conn.execute(text("SELECT version, name, applied_at FROM schema_migrations ORDER BY version")).all()
+    assert [(row[0], row[1]) for row in rows] == [(m.version, m.name) for m in MIGRATIONS]
+    assert all(datetime.fromisoformat(str(row[2])) >= before for row in rows)
@@ -0,0 +1,79 @@
+"""
+Tests for the LRU + TTL response cache and its use by the context manager
+"""
+import pytest
+
+from utilities.classifier import GPSControlClassifier
+from utilities.context_backends import MemoryContextBackend
+from utilities.context_manager import ContextManager
+from utilities.response_cache import ResponseCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Controllable time.monotonic for the cache module"""
+    now = [1000.0]
+    monkeypatch.setattr("utilities.response_cache.time.monotonic", lambda: now[0])
+    return now
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = ResponseCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # "b" is now the least recently used
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+    assert cache.stats()["evictions"] == 1
+    assert len(cache) == 2
+
+
+def test_entries_expire_after_the_ttl(clock):
+    cache = ResponseCache(max_entries=10, ttl=60)
+    cache.set("a", 1)
+    clock[0] += 59
+    assert cache.get("a") == 1
+    clock[0] += 1
+    assert cache.get("a") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["expirations"], stats["size"]) == (1, 1, 1, 0)
+
+
+def test_zero_size_disables_caching():
+    cache = ResponseCache(max_entries=0)
+    cache.set("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_clear_counts_an_invalidation():
+    cache = ResponseCache()
+    cache.clear()
+    cache.set("a", 1)
+    cache.clear()
+    assert cache.get("a") is None
+    assert cache.stats()["invalidations"] == 1
+
+
+def test_cached_contextual_response_still_updates_the_context():
+    manager = ContextManager(backend=MemoryContextBackend(ttl=60, max_history=10))
+    first = manager.generate_contextual_response("Hola, ¿cuánto cuesta el GPS?", "u1", "web")
+    again = manager.generate_contextual_response("HOLA, ¿CUÁNTO CUESTA EL GPS?", "u2", "whatsapp")
+
+    assert again == first == manager._compute_response("Hola, ¿cuánto cuesta el GPS?")
+    assert manager.response_cache.stats()["hits"] == 1
+    for user_id, channel in [("u1", "web"), ("u2", "whatsapp")]:
+        context = manager.get_context(user_id, channel)
+        assert context.current_intent == first[1]
+        assert len(context.conversation_history) == 1
+
+
+def test_classifier_caches_by_normalized_message(tmp_path):
+    classifier = GPSControlClassifier(index_dir=tmp_path)
+    first = classifier.classify_intent("¿Cuánto cuesta el GPS?")
+    assert classifier.classify_intent("cuanto  cuesta el gps") == first
+    assert classifier.response_cache.stats()["hits"] == 1
+    assert classifier.match_stats["exact_hits"] + classifier.match_stats["exact_misses"] == 1
@@ -0,0 +1,76 @@
+"""
+Tests for canned replies stored as response template references
+"""
+from datetime import datetime
+
+import pytest
+
+from model import models
+from model.models import db, Conversation, ResponseTemplate
+from utilities.classifier import gps_classifier, warmup_classifier
+from utilities.context_manager import GPS_CONTROL_RESPONSES
+from utilities.conversation_writer import ConversationWriter
+from utilities.response_templates import backfill_response_templates, resolve_response, response_storage_report
+
+FREE_FORM = "Claro, te comparto la información por correo."
+
+
+@pytest.fixture(autouse=True)
+def template_caches(monkeypatch):
+    """Process-wide id/text caches emptied for each test's fresh database"""
+    monkeypatch.setattr(models, "_template_ids", {})
+    monkeypatch.setattr(models, "_template_texts", {})
+
+
+@pytest.fixture(scope="module")
+def replies():
+    """A rendered dataset answer, a context template and a free-form reply"""
+    warmup_classifier()
+    return [gps_classifier.classify_intent("hola")[0], GPS_CONTROL_RESPONSES["precio"], FREE_FORM]
+
+
+def row(response: str):
+    return {"user_id": "u1", "channel": "web", "message": "m", "response": response, "intent": "saludo",
+            "confidence": 0.9, "session_id": "u1_web", "created_at": datetime.now()}
+
+
+def test_only_canned_replies_resolve(replies):
+    dataset_answer, template, free_form = replies
+    assert resolve_response(dataset_answer)[0] == "dataset"
+    assert resolve_response(template)[:2] == ("context", "precio")
+    assert resolve_response(free_form) is None
+    assert resolve_response(dataset_answer + " ") is None
+    assert resolve_response("") is None
+
+
+def test_writer_stores_references_and_to_dict_rehydrates(app, tmp_path, replies):
+    writer = ConversationWriter(app, spill_dir=str(tmp_path / "spill"))
+    assert writer.flush_rows([row(reply) for reply in replies + replies])
+
+    conversations = Conversation.query.order_by(Conversation.id).all()
+    assert [c.response is None for c in conversations] == [True, True, False] * 2
+    assert conversations[0].response_template_id == conversations[3].response_template_id
+    assert ResponseTemplate.query.count() == 2
+
+    # A fresh process has empty caches and reads the text back from response_templates
+    models._template_ids.clear()
+    models._template_texts.clear()
+    assert [c.to_dict()["response"] for c in conversations] == replies + replies
+
+
+def test_backfill_compacts_existing_text(app, replies):
+    db.session.add_all([Conversation(user_id=f"u{i}", channel="web", message="m", response=reply, intent="saludo",
+                                     confidence=0.9) for i, reply in enumerate(replies * 3)])
+    db.session.commit()
+    before = response_storage_report(db.engine)
+    assert (before["verbatim_rows"], before["compactable_rows"], before["template_rows"]) == (9, 6, 0)
+
+    counts = backfill_response_templates(db.engine, batch_size=4, pause=0)
+    assert (counts["scanned"], counts["compacted"]) == (9, 6)
+    assert counts["bytes_freed"] == before["compactable_bytes"]
+
+    after = response_storage_report(db.engine)
+    assert (after["verbatim_rows"], after["compactable_rows"], after["template_rows"]) == (3, 0, 6)
+    db.session.expire_all()
+    assert [c.to_dict()["response"] for c in Conversation.query.order_by(Conversation.id)] == replies * 3
+    assert backfill_response_templates(db.engine, pause=0)["compacted"] == 0
@@ -0,0 +1,120 @@
+"""
+Tests for the statistics rollups kept by the conversation writer
+"""
+from datetime import datetime, timedelta
+
+from model.models import db, ConversationRollup, IntentRollup, RollupUser
+from model.rollups import (
+    EPOCH, approximate_conversation_count, get_rollup_stats, prune_rollup_users, rebuild_rollups
+)
+from utilities.conversation_writer import ConversationWriter
+
+
+def row(user_id: str, channel: str, created_at: datetime, intent: str = "saludo"):
+    return {"user_id": user_id, "channel": channel, "message": "m", "response": "r", "intent": intent,
+            "confidence": 0.9, "session_id": f"{user_id}_{channel}", "created_at": created_at}
+
+
+def rollups(period: str = "all"):
+    """{(bucket, channel): (messages, unique_users)} for a period"""
+    db.session.expire_all()
+    return {(r.bucket, r.channel): (r.messages, r.unique_users)
+            for r in ConversationRollup.query.filter_by(period=period)}
+
+
+def snapshot():
+    db.session.expire_all()
+    conversations = sorted((r.period, r.bucket, r.channel, r.messages, r.unique_users)
+                           for r in ConversationRollup.query.all())
+    intents = sorted((r.period, r.bucket, r.channel, r.intent, r.count) for r in IntentRollup.query.all())
+    return conversations, intents
+
+
+def test_all_time_unique_users_come_from_chat_reports(app, tmp_path):
+    writer = ConversationWriter(app, spill_dir=str(tmp_path / "spill"))
+    now = datetime.now()
+    assert writer.flush_rows([row("u1", "web", now), row("u1", "web", now), row("u2", "whatsapp", now)])
+    assert writer.flush_rows([row("u1", "web", now), row("u1", "whatsapp", now), row("u3", "web", now)])
+
+    totals = rollups("all")
+    assert totals[(EPOCH, "all")] == (6, 3)
+    assert totals[(EPOCH, "web")] == (4, 2)
+    assert totals[(EPOCH, "whatsapp")] == (2, 2)
+    assert rollups("day")[(now.replace(hour=0, minute=0, second=0, microsecond=0), "all")] == (6, 3)
+    # Only open hour/day buckets keep user lists; nothing grows per user for all time
+    assert RollupUser.query.filter_by(period="day").count() == 7
+    assert RollupUser.query.filter_by(period="all").count() == 0
+
+
+def test_closed_bucket_user_lists_are_pruned(app, tmp_path):
+    writer = ConversationWriter(app, spill_dir=str(tmp_path / "spill"))
+    old = datetime.now() - timedelta(days=5)
+    assert writer.flush_rows([row("u1", "web", old), row("u2", "web", datetime.now())])
+
+    assert prune_rollup_users() == 4  # hour and day, channel and all, of the old row
+    assert {r.user_id for r in RollupUser.query.all()} == {"u2"}
+
+
+def test_rebuild_matches_incremental_rollups(app, tmp_path):
+    writer = ConversationWriter(app, spill_dir=str(tmp_path / "spill"))
+    base = datetime.now() - timedelta(days=3)
+    batches = [
+        [row("u1", "web", base), row("u2", "web", base + timedelta(hours=1), "precio")],
+        [row("u1", "whatsapp", base + timedelta(days=1)), row("u3", "messenger", base + timedelta(days=2))],
+        [row("u2", "web", base + timedelta(days=2), "precio"), row("u4", "web", base + timedelta(days=2, hours=3))],
+    ]
+    for batch in batches:
+        assert writer.flush_rows(batch)
+    incremental = snapshot()
+
+    with db.engine.begin() as conn:
+        rebuild_rollups(conn)
+    assert snapshot() == incremental
+
+
+def test_rebuild_in_chunks_counts_all_time_users_once(app, tmp_path, monkeypatch):
+    writer = ConversationWriter(app, spill_dir=str(tmp_path / "spill"))
+    now = datetime.now()
+    assert writer.flush_rows([row(f"u{i % 3}", "web" if i % 2 else "whatsapp", now) for i in range(10)])
+    incremental = snapshot()
+
+    # Dialects without a GROUP BY rebuild go through update_rollups in keyset chunks
+    monkeypatch.setattr("model.rollups.BUCKET_FORMATS", {})
+    with db.engine.begin() as conn:
+        rebuild_rollups(conn, chunk=3)
+    assert snapshot() == incremental
+
+
+def test_dashboard_stats_match_the_conversations(app, tmp_path):
+    writer = ConversationWriter(app, spill_dir=str(tmp_path / "spill"))
+    now = datetime.now()
+    yesterday = now - timedelta(days=1)
+    assert writer.flush_rows([row("u1", "web", yesterday), row("u2", "whatsapp", yesterday, "precio"),
+                              row("u1", "web", now, "precio"), row("u3", "web", now, "precio")])
+
+    stats = get_rollup_stats()
+    assert (stats["total_conversations"], stats["total_users"]) == (4, 3)
+    assert (stats["conversations_today"], stats["users_today"]) == (2, 2)
+    assert stats["intent_stats"] == {"precio": 3, "saludo": 1}
+    assert list(get_rollup_stats(top_intents=1)["top_intents"]) == ["precio"]
+    assert stats["channels"] == {"web": {"messages": 3, "unique_users": 2},
+                                 "whatsapp": {"messages": 1, "unique_users": 1}}
+    assert [day["messages"] for day in stats["daily"]] == [2, 2]
+    assert sum(hour["messages"] for hour in stats["hourly"]) == 2  # Yesterday's hour is just outside the window
+    assert sum(hour["messages"] for hour in get_rollup_stats(hours=25)["hourly"]) == 4
+
+
+def test_approximate_count_follows_the_filters(app, tmp_path):
+    writer = ConversationWriter(app, spill_dir=str(tmp_path / "spill"))
+    now = datetime.now()
+    old = now - timedelta(days=10)
+    assert writer.flush_rows([row("u1", "web", old), row("u2", "whatsapp", old, "precio"),
+                              row("u1", "web", now, "precio"), row("u3", "web", now)])
+
+    assert approximate_conversation_count() == 4
+    assert approximate_conversation_count(channel="web") == 3
+    assert approximate_conversation_count(intent="precio") == 2
+    assert approximate_conversation_count(channel="web", intent="precio") == 1
+    assert approximate_conversation_count(since=now - timedelta(days=1)) == 2
+    assert approximate_conversation_count(until=now - timedelta(days=1)) == 2
+    assert approximate_conversation_count(channel="messenger") == 0
@@ -0,0 +1,55 @@
+"""
+Tests for lazy startup: heavy dependencies and the classifier index load on first use
+"""
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).parent
+
+PROBE = """
+import json, sys
+import main
+modules = lambda: sorted(name for name in ("numpy", "scipy.sparse", "sklearn", "openai") if name in sys.modules)
+state = {"loaded_at_import": main.gps_classifier.loaded, "modules_at_import": modules()}
+intent = main.classify_message("hola quiero cotizar gps")[1]
+state.update(loaded_after_message=main.gps_classifier.loaded, modules_after_message=modules(), intent=intent)
+main.conversation_writer.stop()
+print(json.dumps(state))
+"""
+
+
+def start_app(tmp_path, lazy: bool) -> dict:
+    """Import main in a fresh interpreter and report what was loaded when"""
+    env = {
+        **os.environ,
+        "LAZY_STARTUP": "true" if lazy else "false",
+        "DATABASE_URL": f"sqlite:///{tmp_path / 'chatbot.db'}",
+        "DB_CREATE_ALL": "true",
+        "DB_MIGRATIONS": "upgrade",
+        "CONTEXT_BACKEND": "memory",
+        "CONTEXT_PERSIST": "false",
+        "CONVERSATION_SPILL_DIR": str(tmp_path / "spill"),
+        "CLASSIFIER_INDEX_DIR": str(tmp_path / "index"),
+    }
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=ROOT, env=env, capture_output=True, text=True,
+                            timeout=120)
+    assert result.returncode == 0, result.stderr
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+@pytest.mark.parametrize("lazy", [True, False])
+def test_classifier_loads_on_first_message_only_when_lazy(tmp_path, lazy):
+    state = start_app(tmp_path, lazy)
+    assert state["loaded_at_import"] is not lazy
+    assert state["loaded_after_message"] is True
+    assert state["intent"] not in ("error", "general")
+    if lazy:
+        assert state["modules_at_import"] == []
+    assert {"numpy", "scipy.sparse"} <= set(state["modules_after_message"])
+    # The OpenAI SDK is only imported for the ChatGPT fallback
+    assert "openai" not in state["modules_after_message"]
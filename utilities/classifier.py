@@ -2,19 +2,39 @@
 Classification and Intent Recognition System for GPS Control Chatbot
 Simplified version of the original clasificador.py focused on essential functionality
 """
+import hashlib
 import json
 import re
 import os
+import threading
+import time
+from datetime import datetime
 from pathlib import Path
-from typing import Dict, List, Tuple, Optional
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Tuple, Optional
 import logging
-from difflib import SequenceMatcher
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
 import unicodedata
 
+from model.config import CACHE_CONFIG
+from utilities.fuzzy_index import TrigramIndex
+from utilities.response_cache import ResponseCache
+
+# numpy/scipy and the TF-IDF index are imported when the index is first loaded,
+# so a lazy startup does not pay for them until the first classification or warmup
+if TYPE_CHECKING:
+    from utilities.index_artifact import TfidfIndex
+
 logger = logging.getLogger(__name__)
 
+DATASET_PATH = Path(__file__).parent / "dataset_gpscontrol.json"
+
+# Vectorizer settings; part of the artifact fingerprint so changing them forces a refit
+FIT_CONFIG = {
+    "lowercase": True,
+    "max_features": 1000,
+    "ngram_range": [1, 2],
+    "normalize_inputs": True  # Dataset inputs go through normalize_text like queries
+}
+
 # Video mapping for GPS Control content
 VIDEOS_DICT = {
     "${v1}": "machin-v1-rastreo-satelital-c.mp4",
@@ -54,51 +74,290 @@ VIDEOS_INFO = {
     "${machin-v16-visualizacion-de-camaras_c}": "Ejemplos de Visualización de cámaras en tiempo real."
 }
 
+class RowMatch(NamedTuple):
+    """Matched dataset row, its similarity score and any typo corrections applied"""
+    row: int
+    score: float
+    corrections: Optional[Dict[str, str]] = None
+
+class ClassifierSnapshot:
+    """
+    One loaded dataset version: entries, TF-IDF index and exact-match map.
+    Never mutated after construction; reloads build a new snapshot and swap the
+    reference, so in-flight classifications keep reading the one they started with.
+    """
+    
+    def __init__(self, dataset: List[Dict], index: Optional["TfidfIndex"],
+                 exact_index: Dict[str, int], version: Optional[str], build_mode: str = "empty",
+                 fuzzy_index: Optional[TrigramIndex] = None,
+                 responses: Optional[List[str]] = None):
+        self.dataset = dataset
+        self.index = index
+        self.exact_index = exact_index  # normalized input -> dataset row
+        self.fuzzy_index = fuzzy_index  # typo correction over the index vocabulary
+        # Final reply text and intent per row, rendered once at load so matching is a lookup
+        self.responses = responses if responses is not None else []
+        # Rendered reply -> first row producing it, to store replies as a dataset reference
+        self.response_rows = {}
+        for row, response in enumerate(self.responses):
+            self.response_rows.setdefault(response, row)
+        self.intents = [item.get("intention", "general") for item in dataset]
+        self.version = version
+        self.build_mode = build_mode  # artifact, refit, incremental or empty
+        self.loaded_at = time.time()
+    
+    @property
+    def ready(self) -> bool:
+        return bool(self.dataset) and self.index is not None
+    
+    def size_stats(self) -> Dict:
+        """Entry count and in-memory index footprint"""
+        return {
+            "entries": len(self.dataset),
+            "vocabulary": self.index.n_features if self.index is not None else 0,
+            "nnz": int(self.index.matrix.nnz) if self.index is not None else 0,
+            "index_bytes": self.index.nbytes if self.index is not None else 0
+        }
+
 class GPSControlClassifier:
     """Classification system for GPS Control chatbot interactions"""
     
-    def __init__(self):
-        self.dataset = []
-        self.vectorizer = TfidfVectorizer(
-            lowercase=True,
-            stop_words=None,  # Keep Spanish stop words
-            max_features=1000,
-            ngram_range=(1, 2)
+    def __init__(self, dataset_path: Optional[Path] = None, index_dir: Optional[Path] = None,
+                 retrieval: str = "inverted", typo_tolerance: bool = True, lazy: bool = False):
+        self.retrieval = retrieval  # "inverted" index, or "linear" reference scan
+        self.typo_tolerance = typo_tolerance
+        self.dataset_path = Path(dataset_path) if dataset_path else DATASET_PATH
+        self.index_dir = Path(index_dir) if index_dir else None  # None: DEFAULT_INDEX_DIR, resolved at load
+        self.index_prefix = self.dataset_path.stem  # Artifacts of other datasets in index_dir are left alone
+        self.match_stats = {"exact_hits": 0, "exact_misses": 0, "typo_attempts": 0, "typo_rescues": 0}
+        self.response_cache = ResponseCache(
+            max_entries=CACHE_CONFIG['max_entries'],
+            ttl=CACHE_CONFIG['ttl']
         )
-        self.load_dataset()
-        self._prepare_classifier()
+        self.last_reload = None
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._watcher_stop = threading.Event()
+        
+        # Built by warmup(): at construction, or on first use when lazy
+        self._snapshot = None
+        self._load_lock = threading.Lock()
+        if not lazy:
+            self.warmup()
+    
+    def warmup(self) -> ClassifierSnapshot:
+        """Load the dataset and index now instead of on the first classification"""
+        with self._load_lock:
+            if self._snapshot is None:
+                start = time.perf_counter()
+                try:
+                    self._snapshot = self._build_snapshot()
+                    logger.info(f"Classifier ready ({self._snapshot.build_mode}) in "
+                                f"{time.perf_counter() - start:.3f}s")
+                except Exception as e:
+                    logger.error(f"Error preparing classifier: {e}")
+                    self._snapshot = ClassifierSnapshot([], None, {}, None)
+        return self._snapshot
+    
+    @property
+    def loaded(self) -> bool:
+        return self._snapshot is not None
     
-    def load_dataset(self):
-        """Load GPS Control dataset from JSON file"""
+    @property
+    def snapshot(self) -> ClassifierSnapshot:
+        """Current dataset snapshot, loading it on first access"""
+        snapshot = self._snapshot
+        if snapshot is None:
+            snapshot = self.warmup()
+        return snapshot
+    
+    # Read-only views of the current snapshot
+    @property
+    def dataset(self) -> List[Dict]:
+        return self.snapshot.dataset
+    
+    @property
+    def index(self) -> Optional["TfidfIndex"]:
+        return self.snapshot.index
+    
+    @property
+    def exact_index(self) -> Dict[str, int]:
+        return self.snapshot.exact_index
+    
+    @property
+    def input_vectors(self):
+        return self.snapshot.index.matrix if self.snapshot.index is not None else None
+    
+    @property
+    def dataset_version(self) -> Optional[str]:
+        """Version of the loaded dataset, used to key cached responses (None until loaded)"""
+        snapshot = self._snapshot
+        return snapshot.version if snapshot is not None else None
+    
+    def response_reference(self, response: str) -> Optional[Tuple[str, str]]:
+        """(dataset entry id, dataset version) whose rendered answer is exactly response, if any"""
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version is None:
+            return None
+        row = snapshot.response_rows.get(response)
+        if row is None:
+            return None
+        return str(snapshot.dataset[row].get("id", row)), snapshot.version
+    
+    def load_dataset(self) -> Tuple[List[Dict], Optional[str]]:
+        """Load GPS Control dataset from JSON file; returns (entries, content version)"""
         try:
-            dataset_path = Path(__file__).parent / "dataset_gpscontrol.json"
+            dataset_path = self.dataset_path
             if dataset_path.exists():
-                with open(dataset_path, "r", encoding="utf-8") as f:
-                    self.dataset = json.load(f)
-                logger.info(f"Loaded {len(self.dataset)} entries from dataset")
+                raw = dataset_path.read_bytes()
+                dataset = json.loads(raw.decode("utf-8"))
+                logger.info(f"Loaded {len(dataset)} entries from dataset")
+                return dataset, hashlib.sha256(raw).hexdigest()[:12]
             else:
                 logger.warning("Dataset file not found, using empty dataset")
-                self.dataset = []
+                return [], None
         except Exception as e:
             logger.error(f"Error loading dataset: {e}")
-            self.dataset = []
+            return [], None
     
-    def _prepare_classifier(self):
-        """Prepare TF-IDF vectors for similarity matching"""
-        if not self.dataset:
+    def _build_snapshot(self, previous: Optional[ClassifierSnapshot] = None) -> ClassifierSnapshot:
+        """
+        Load the dataset and its TF-IDF index. The prebuilt artifact is used when
+        present; the index is refit only when the dataset inputs changed, and is
+        reused as-is from the previous snapshot when only answers changed.
+        """
+        from utilities.index_artifact import TfidfIndex, DEFAULT_INDEX_DIR, fit_fingerprint
+        
+        dataset, version = self.load_dataset()
+        if not dataset:
             logger.warning("No dataset available for classification")
-            return
+            return ClassifierSnapshot(dataset, None, {}, version)
+        
+        # Extract input texts for vectorization, normalized the same way as queries
+        input_texts = [self.normalize_text(item.get("input", "")) for item in dataset]
+        fingerprint = fit_fingerprint(input_texts, FIT_CONFIG)
+        
+        responses = [self._render_response(item) for item in dataset]
+        
+        if previous is not None and previous.index is not None and previous.index.fingerprint == fingerprint:
+            logger.info("Dataset inputs unchanged, reusing current classifier index")
+            return ClassifierSnapshot(dataset, previous.index, previous.exact_index,
+                                      version, "incremental", previous.fuzzy_index, responses)
+        
+        index = TfidfIndex.load(self.index_dir or DEFAULT_INDEX_DIR, fingerprint, self.index_prefix)
+        if index is None:
+            logger.info("Classifier index missing or stale, refitting")
+            index = self.build_index(input_texts, fingerprint)
+            build_mode = "refit"
+        else:
+            logger.info(f"Loaded prebuilt classifier index {index.version}")
+            build_mode = "artifact"
+        
+        return ClassifierSnapshot(dataset, index, self._build_exact_index(input_texts),
+                                  version, build_mode, TrigramIndex(index.terms), responses)
+    
+    def build_index(self, input_texts: List[str], fingerprint: str) -> "TfidfIndex":
+        """Fit the TF-IDF index on normalized dataset inputs and save it as an artifact"""
+        from utilities.index_artifact import TfidfIndex, DEFAULT_INDEX_DIR
+        
+        index = TfidfIndex.fit(input_texts, fingerprint, FIT_CONFIG)
         
         try:
-            # Extract input texts for vectorization
-            input_texts = [item.get("input", "") for item in self.dataset]
+            index.save(self.index_dir or DEFAULT_INDEX_DIR, self.index_prefix)
+        except OSError as e:
+            logger.warning(f"Could not save classifier index: {e}")
+        
+        logger.info("TF-IDF vectors prepared successfully")
+        return index
+    
+    def _build_exact_index(self, input_texts: List[str]) -> Dict[str, int]:
+        """Map each normalized dataset input to its first dataset row"""
+        exact_index = {}
+        for idx, key in enumerate(input_texts):
+            if key and key not in exact_index:
+                exact_index[key] = idx
+        return exact_index
+    
+    def reload(self, wait: bool = False) -> Dict:
+        """
+        Rebuild the dataset index in a background thread and swap it in atomically.
+        Returns the reload report when wait=True, otherwise a status stub.
+        """
+        if not self._reload_lock.acquire(blocking=False):
+            return {"status": "in_progress"}
+        
+        thread = threading.Thread(target=self._reload_worker, name="classifier-reload", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+            return self.last_reload
+        return {"status": "started"}
+    
+    def _reload_worker(self):
+        """Build a new snapshot off the request path, then swap it in"""
+        try:
+            start = time.perf_counter()
+            snapshot = self._build_snapshot(previous=self._snapshot)
+            if not snapshot.ready:
+                raise ValueError("reloaded dataset is empty or could not be indexed")
+            
+            # Single reference assignment: readers see either the old or the new snapshot
+            self._snapshot = snapshot
+            self.response_cache.clear()
             
-            # Fit vectorizer on input texts
-            if input_texts:
-                self.input_vectors = self.vectorizer.fit_transform(input_texts)
-                logger.info("TF-IDF vectors prepared successfully")
+            self.last_reload = {
+                "status": "ok",
+                "mode": snapshot.build_mode,
+                "version": snapshot.version,
+                "seconds": round(time.perf_counter() - start, 4),
+                "finished_at": datetime.now().isoformat(),
+                **snapshot.size_stats()
+            }
+            logger.info(f"Classifier reloaded ({snapshot.build_mode}) in "
+                        f"{self.last_reload['seconds']}s: {snapshot.size_stats()}")
         except Exception as e:
-            logger.error(f"Error preparing classifier: {e}")
+            logger.error(f"Error reloading classifier, keeping current index: {e}")
+            self.last_reload = {
+                "status": "error",
+                "error": str(e),
+                "finished_at": datetime.now().isoformat()
+            }
+        finally:
+            self._reload_lock.release()
+    
+    def start_watcher(self, interval: float = 5.0):
+        """Poll the dataset file and hot-reload when its modification time changes"""
+        if self._watcher is not None:
+            return
+        
+        # Baseline taken before the thread starts, so a change right after this call is not missed
+        baseline = self._dataset_mtime()
+        
+        def watch():
+            last_mtime = baseline
+            while not self._watcher_stop.wait(interval):
+                mtime = self._dataset_mtime()
+                if mtime is not None and mtime != last_mtime:
+                    logger.info("Dataset file changed, reloading classifier")
+                    # A reload already running may have read the file before this change:
+                    # keep the old mtime so the next poll retries until a reload starts
+                    if self.reload().get("status") == "started":
+                        last_mtime = mtime
+        
+        self._watcher_stop.clear()
+        self._watcher = threading.Thread(target=watch, name="classifier-watcher", daemon=True)
+        self._watcher.start()
+    
+    def stop_watcher(self):
+        """Stop the dataset file watcher"""
+        self._watcher_stop.set()
+        self._watcher = None
+    
+    def _dataset_mtime(self) -> Optional[float]:
+        try:
+            return self.dataset_path.stat().st_mtime
+        except OSError:
+            return None
     
     def normalize_text(self, text: str) -> str:
         """Normalize text for better matching"""
@@ -117,31 +376,164 @@ class GPSControlClassifier:
     
     def find_best_match(self, user_input: str, threshold: float = 0.3) -> Optional[Dict]:
         """Find the best matching response from dataset"""
-        if not self.dataset or not hasattr(self, 'input_vectors'):
+        snapshot = self.snapshot
+        if not snapshot.ready:
             return None
         
         try:
-            # Normalize and vectorize user input
-            normalized_input = self.normalize_text(user_input)
-            user_vector = self.vectorizer.transform([normalized_input])
-            
-            # Calculate similarities
-            similarities = cosine_similarity(user_vector, self.input_vectors)[0]
+            match = self._match_normalized(snapshot, self.normalize_text(user_input), threshold)
+            return self._match_to_dict(snapshot, match) if match else None
+        except Exception as e:
+            logger.error(f"Error finding best match: {e}")
+            return None
+    
+    def _match_normalized(self, snapshot: ClassifierSnapshot, normalized_input: str,
+                          threshold: float = 0.3) -> Optional[RowMatch]:
+        """Best dataset row for already-normalized text"""
+        # Fast path: message is exactly a dataset input (greetings, tapped suggestions)
+        exact_idx = snapshot.exact_index.get(normalized_input)
+        if exact_idx is not None:
+            self.match_stats["exact_hits"] += 1
+            return RowMatch(exact_idx, 1.0)
+        self.match_stats["exact_misses"] += 1
+        
+        # Score user input against the index
+        candidates = self._rank(snapshot, normalized_input, k=1)
+        best_idx, best_score = candidates[0] if candidates else (None, 0.0)
+        
+        # Misspelled words ("cotisar", "camras") only lower the score; retry corrected
+        corrected_match = self._match_corrected(snapshot, normalized_input, best_score)
+        if corrected_match is not None and corrected_match.score >= threshold:
+            return corrected_match
+        
+        # Find best match above threshold
+        if best_idx is not None and best_score >= threshold:
+            return RowMatch(best_idx, best_score)
+        
+        return None
+    
+    def _match_corrected(self, snapshot: ClassifierSnapshot, normalized_input: str,
+                         score_to_beat: float) -> Optional[RowMatch]:
+        """
+        Re-score a message after replacing out-of-vocabulary words with their closest
+        vocabulary word; returns the match only if it beats score_to_beat
+        """
+        if not self.typo_tolerance or snapshot.fuzzy_index is None:
+            return None
+        
+        corrected, corrections = snapshot.fuzzy_index.correct_text(normalized_input)
+        if not corrections:
+            return None
+        self.match_stats["typo_attempts"] += 1
+        
+        exact_idx = snapshot.exact_index.get(corrected)
+        if exact_idx is not None:
+            best_idx, best_score = exact_idx, 1.0
+        else:
+            candidates = self._rank(snapshot, corrected, k=1)
+            if not candidates:
+                return None
+            best_idx, best_score = candidates[0]
+        
+        if best_score <= score_to_beat:
+            return None
+        
+        self.match_stats["typo_rescues"] += 1
+        return RowMatch(best_idx, best_score, corrections)
+    
+    def _match_to_dict(self, snapshot: ClassifierSnapshot, match: RowMatch) -> Dict:
+        """Copy of the matched dataset entry annotated with its similarity score"""
+        result = snapshot.dataset[match.row].copy()
+        result['similarity_score'] = match.score
+        if match.corrections:
+            result['typo_corrections'] = match.corrections
+        return result
+    
+    def find_top_matches(self, user_input: str, k: int = 5, threshold: float = 0.0) -> List[Dict]:
+        """Return up to k ranked dataset matches with their similarity scores"""
+        snapshot = self.snapshot
+        if not snapshot.ready:
+            return []
+        
+        try:
+            candidates = self._rank(snapshot, self.normalize_text(user_input), k)
+            matches = []
+            for idx, score in candidates:
+                if score < threshold:
+                    break
+                matches.append(self._match_to_dict(snapshot, RowMatch(idx, score)))
+            return matches
             
-            # Find best match above threshold
-            best_idx = similarities.argmax()
-            best_score = similarities[best_idx]
+        except Exception as e:
+            logger.error(f"Error finding top matches: {e}")
+            return []
+    
+    def _rank(self, snapshot: ClassifierSnapshot, normalized_input: str,
+              k: int) -> List[Tuple[int, float]]:
+        """Top-k (dataset row, score) candidates for already-normalized text"""
+        if self.retrieval == "linear":
+            import numpy as np
+            from utilities.index_artifact import SCORE_DECIMALS
             
-            if best_score >= threshold:
-                match = self.dataset[best_idx].copy()
-                match['similarity_score'] = float(best_score)
-                return match
+            similarities = np.round(snapshot.index.similarities(normalized_input), SCORE_DECIMALS)
+            order = np.lexsort((np.arange(len(similarities)), -similarities))[:k]
+            return [(int(i), float(similarities[i])) for i in order if similarities[i] > 0]
+        return snapshot.index.top_k(normalized_input, k)
+    
+    def find_best_matches(self, user_inputs: List[str], threshold: float = 0.3) -> List[Optional[Dict]]:
+        """Find the best matching dataset entry for several messages at once"""
+        snapshot = self.snapshot
+        if not snapshot.ready:
+            return [None] * len(user_inputs)
+        
+        try:
+            normalized_inputs = [self.normalize_text(text) for text in user_inputs]
+            matches = self._match_normalized_batch(snapshot, normalized_inputs, threshold)
+            return [self._match_to_dict(snapshot, match) if match else None for match in matches]
+        except Exception as e:
+            logger.error(f"Error finding best matches: {e}")
+            return [None] * len(user_inputs)
+    
+    def _match_normalized_batch(self, snapshot: ClassifierSnapshot, normalized_inputs: List[str],
+                                threshold: float = 0.3) -> List[Optional[RowMatch]]:
+        """Best dataset rows for already-normalized texts, in input order"""
+        matches = [None] * len(normalized_inputs)
+        if not snapshot.ready:
+            return matches
+        
+        # Exact matches skip vectorization, the rest are scored together
+        pending = []
+        for pos, normalized_input in enumerate(normalized_inputs):
+            exact_idx = snapshot.exact_index.get(normalized_input)
+            if exact_idx is not None:
+                self.match_stats["exact_hits"] += 1
+                matches[pos] = RowMatch(exact_idx, 1.0)
+            else:
+                self.match_stats["exact_misses"] += 1
+                pending.append(pos)
+        
+        if pending:
+            import numpy as np
+            from utilities.index_artifact import SCORE_DECIMALS
             
-            return None
+            similarities = snapshot.index.similarities_batch(
+                [normalized_inputs[pos] for pos in pending]
+            )
+            # Same rounding and lowest-row tie-break as the single-message path
+            similarities.data = np.round(similarities.data, SCORE_DECIMALS)
+            similarities.sort_indices()
+            best_idxs = np.asarray(similarities.argmax(axis=1)).ravel()
+            best_scores = similarities[np.arange(len(pending)), best_idxs]
+            best_scores = np.asarray(best_scores).ravel()
             
-        except Exception as e:
-            logger.error(f"Error finding best match: {e}")
-            return None
+            for pos, best_idx, best_score in zip(pending, best_idxs, best_scores):
+                corrected_match = self._match_corrected(snapshot, normalized_inputs[pos], best_score)
+                if corrected_match is not None and corrected_match.score >= threshold:
+                    matches[pos] = corrected_match
+                elif best_score >= threshold:
+                    matches[pos] = RowMatch(int(best_idx), float(best_score))
+        
+        return matches
     
     def classify_intent(self, message: str) -> Tuple[str, str, float]:
         """
@@ -149,32 +541,67 @@ class GPSControlClassifier:
         Returns: (response, intent, confidence)
         """
         try:
-            best_match = self.find_best_match(message)
+            snapshot = self.snapshot
+            normalized_input = self.normalize_text(message)
+            cache_key = (snapshot.version, normalized_input)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                return cached
             
-            if best_match:
-                # Get response and process video placeholders
-                response = best_match.get("answer", "")
-                response = self._process_video_placeholders(response)
-                
-                intent = best_match.get("intention", "general")
-                confidence = best_match.get("similarity_score", 0.0)
-                
-                # Add suggested responses if available
-                suggested = best_match.get("suggested_responses", [])
-                if suggested:
-                    response += "\n\n" + "Opciones disponibles:\n"
-                    for i, suggestion in enumerate(suggested[:4], 1):
-                        response += f"{i}. {suggestion}\n"
-                
-                return response, intent, confidence
-            
-            # Fallback response if no good match found
-            return self._get_fallback_response(), "general", 0.0
+            best_match = None
+            if snapshot.ready:
+                best_match = self._match_normalized(snapshot, normalized_input)
+            result = self._build_classification(snapshot, best_match)
+            self.response_cache.set(cache_key, result)
+            return result
             
         except Exception as e:
             logger.error(f"Error in classify_intent: {e}")
             return "Disculpa, tuve un problema. ¿Podrías repetir tu pregunta?", "error", 0.0
     
+    def classify_intents(self, messages: List[str]) -> List[Tuple[str, str, float]]:
+        """
+        Classify several user messages with a single sparse similarity product
+        Returns: list of (response, intent, confidence), in input order
+        """
+        try:
+            snapshot = self.snapshot
+            cache_keys = [(snapshot.version, self.normalize_text(message)) for message in messages]
+            results = [self.response_cache.get(key) for key in cache_keys]
+            pending = [pos for pos, result in enumerate(results) if result is None]
+            
+            matches = self._match_normalized_batch(snapshot, [cache_keys[pos][1] for pos in pending])
+            for pos, match in zip(pending, matches):
+                results[pos] = self._build_classification(snapshot, match)
+                self.response_cache.set(cache_keys[pos], results[pos])
+            return results
+        except Exception as e:
+            logger.error(f"Error in classify_intents: {e}")
+            return [("Disculpa, tuve un problema. ¿Podrías repetir tu pregunta?", "error", 0.0)] * len(messages)
+    
+    def _build_classification(self, snapshot: ClassifierSnapshot,
+                              best_match: Optional[RowMatch]) -> Tuple[str, str, float]:
+        """Turn a matched row into (response, intent, confidence) from pre-rendered answers"""
+        if best_match:
+            return (snapshot.responses[best_match.row], snapshot.intents[best_match.row],
+                    best_match.score)
+        
+        # Fallback response if no good match found
+        return self._get_fallback_response(), "general", 0.0
+    
+    def _render_response(self, item: Dict) -> str:
+        """Final reply text for a dataset entry: video placeholders and suggested options"""
+        # Get response and process video placeholders
+        response = self._process_video_placeholders(item.get("answer", ""))
+        
+        # Add suggested responses if available
+        suggested = item.get("suggested_responses", [])
+        if suggested:
+            options = "".join(f"{i}. {suggestion}\n" for i, suggestion in enumerate(suggested[:4], 1))
+            response += "\n\nOpciones disponibles:\n" + options
+        
+        return response
+    
     def _process_video_placeholders(self, response: str) -> str:
         """Process video placeholders in responses"""
         # Replace ${video} with video information
@@ -205,16 +632,17 @@ class GPSControlClassifier:
     
     def get_classification_stats(self) -> Dict:
         """Get classification statistics"""
-        if not self.dataset:
+        dataset = self.snapshot.dataset
+        if not dataset:
             return {"total_entries": 0, "classifications": {}}
         
         stats = {
-            "total_entries": len(self.dataset),
+            "total_entries": len(dataset),
             "classifications": {},
             "intentions": {}
         }
         
-        for item in self.dataset:
+        for item in dataset:
             classification = item.get("clasification", "Unknown")
             intention = item.get("intention", "Unknown")
             
@@ -222,9 +650,24 @@ class GPSControlClassifier:
             stats["intentions"][intention] = stats["intentions"].get(intention, 0) + 1
         
         return stats
+    
+    def get_match_stats(self) -> Dict:
+        """Get exact-match fast path and typo correction counters"""
+        hits = self.match_stats["exact_hits"]
+        lookups = hits + self.match_stats["exact_misses"]
+        attempts = self.match_stats["typo_attempts"]
+        fuzzy_index = self.snapshot.fuzzy_index
+        return {
+            **self.match_stats,
+            "exact_hit_rate": hits / lookups if lookups else 0.0,
+            "exact_index_size": len(self.exact_index),
+            "typo_rescue_rate": self.match_stats["typo_rescues"] / attempts if attempts else 0.0,
+            "typo_vocabulary_size": len(fuzzy_index) if fuzzy_index is not None else 0
+        }
 
-# Global classifier instance
-gps_classifier = GPSControlClassifier()
+# Global classifier instance; importing this module never builds it (first use or warmup_classifier() does,
+# which main runs at import unless LAZY_STARTUP)
+gps_classifier = GPSControlClassifier(lazy=True)
 
 def classify_message(message: str) -> Tuple[str, str, float]:
     """
@@ -241,6 +684,54 @@ def classify_message(message: str) -> Tuple[str, str, float]:
             0.0
         )
 
+def classify_messages(messages: List[str]) -> List[Tuple[str, str, float]]:
+    """
+    Classify a batch of user messages (webhook deliveries, replays, evaluations)
+    Returns: list of (response, intent, confidence), in input order
+    """
+    try:
+        return gps_classifier.classify_intents(messages)
+    except Exception as e:
+        logger.error(f"Error in classify_messages: {e}")
+        return [(
+            "Disculpa, ocurrió un error procesando tu mensaje. ¿Podrías intentar de nuevo?",
+            "error", 
+            0.0
+        )] * len(messages)
+
+def get_response_cache_stats() -> Dict:
+    """Hit-rate and eviction stats of the classifier response cache"""
+    return {
+        **gps_classifier.response_cache.stats(),
+        "dataset_version": gps_classifier.dataset_version
+    }
+
+def warmup_classifier(wait: bool = True):
+    """Load the classifier index ahead of the first message (no-op once loaded)"""
+    if wait:
+        gps_classifier.warmup()
+    else:
+        threading.Thread(target=gps_classifier.warmup, name="classifier-warmup", daemon=True).start()
+
+def reload_classifier(wait: bool = False) -> Dict:
+    """Hot-reload the dataset without restarting the process"""
+    return gps_classifier.reload(wait=wait)
+
+def get_classifier_status() -> Dict:
+    """Loaded dataset version, index size and last reload report"""
+    if not gps_classifier.loaded:
+        return {"loaded": False, "last_reload": gps_classifier.last_reload}
+    
+    snapshot = gps_classifier.snapshot
+    return {
+        "loaded": True,
+        "dataset_version": snapshot.version,
+        "build_mode": snapshot.build_mode,
+        "loaded_at": datetime.fromtimestamp(snapshot.loaded_at).isoformat(),
+        **snapshot.size_stats(),
+        "last_reload": gps_classifier.last_reload
+    }
+
 def get_suggested_responses(intent: str) -> List[str]:
     """Get suggested responses for a given intent"""
     suggestions_map = {
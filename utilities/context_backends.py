@@ -0,0 +1,455 @@
+"""
+Conversation context records and the backends that hold them
+The in-process store is the default; the SQLite and Redis backends are shared by
+every worker process, so a user's flow survives requests landing on different workers
+"""
+from abc import ABC, abstractmethod
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, List, NamedTuple, Optional, Tuple
+import logging
+
+from utilities.context_store import ContextStore
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryEntry(NamedTuple):
+    """One exchange in a conversation context"""
+    timestamp: float  # time.time()
+    message: str
+    intent: str
+    response: str
+
+
+class ConversationContext:
+    """Per-user conversation state; slotted so 100k active users stay compact"""
+    __slots__ = ("user_id", "channel", "current_intent", "conversation_history",
+                 "quote_data", "last_activity", "step")
+
+    def __init__(self, user_id: str, channel: str):
+        self.user_id = user_id
+        self.channel = channel
+        self.current_intent = None
+        # Last max_history exchanges, oldest first (trimmed in place on append)
+        self.conversation_history = []
+        self.quote_data = {}
+        self.last_activity = time.time()
+        self.step = 0
+
+    def append(self, entry: HistoryEntry, max_history: int):
+        """Record an exchange, dropping the oldest past max_history"""
+        self.current_intent = entry.intent
+        self.last_activity = entry.timestamp
+        history = self.conversation_history
+        history.append(entry)
+        if len(history) > max_history:
+            del history[0]
+
+    def to_dict(self) -> Dict:
+        """JSON-friendly view with ISO timestamps"""
+        return {
+            "user_id": self.user_id,
+            "channel": self.channel,
+            "current_intent": self.current_intent,
+            "conversation_history": [
+                {**entry._asdict(), "timestamp": datetime.fromtimestamp(entry.timestamp).isoformat()}
+                for entry in self.conversation_history
+            ],
+            "quote_data": self.quote_data,
+            "last_activity": datetime.fromtimestamp(self.last_activity).isoformat(),
+            "step": self.step
+        }
+
+
+class ContextBackend(ABC):
+    """Where conversation contexts live; every write is a single call (one round trip)"""
+
+    name = "base"
+
+    def __init__(self, ttl: float = 1800, max_history: int = 10):
+        self.ttl = ttl
+        self.max_history = max_history
+        self._sweeper = None
+        self._sweeper_stop = threading.Event()
+
+    @abstractmethod
+    def get(self, user_id: str, channel: str) -> Optional[ConversationContext]:
+        """Current context, or None if missing or expired"""
+
+    @abstractmethod
+    def put(self, context: ConversationContext):
+        """Store a whole context, replacing any previous one"""
+
+    @abstractmethod
+    def append_exchange(self, user_id: str, channel: str, entry: HistoryEntry) -> ConversationContext:
+        """Record an exchange (starting a fresh context if expired) and return the updated context"""
+
+    @abstractmethod
+    def update_quote_data(self, user_id: str, channel: str, data: Dict):
+        """Merge data into the context's quote_data"""
+
+    def sweep(self) -> int:
+        """Drop expired contexts; returns how many were removed"""
+        return 0
+
+    def stats(self) -> Dict:
+        return {"backend": self.name, "ttl": self.ttl}
+
+    def start_sweeper(self, interval: float = 60):
+        """Call sweep() every interval seconds in a background thread"""
+        if self._sweeper is not None:
+            return
+
+        def run():
+            while not self._sweeper_stop.wait(interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"Error sweeping contexts: {e}")
+
+        self._sweeper_stop.clear()
+        self._sweeper = threading.Thread(target=run, name="context-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        self._sweeper_stop.set()
+        self._sweeper = None
+
+
+class MemoryContextBackend(ContextBackend):
+    """Contexts in this process only (the default): bounded LRU with TTL expiry"""
+
+    name = "memory"
+
+    def __init__(self, ttl: float = 1800, max_history: int = 10, max_entries: int = 10000):
+        super().__init__(ttl, max_history)
+        self.store = ContextStore(max_entries=max_entries, ttl=ttl)
+        # Optional write-behind ContextPersister (see utilities.context_persistence)
+        self.persister = None
+
+    def get(self, user_id: str, channel: str) -> Optional[ConversationContext]:
+        context = self.store.get((user_id, channel))
+        if context is None and self.persister is not None:
+            # First access since a restart (or eviction): reload the persisted context once
+            context = self.persister.load(user_id, channel)
+            if context is not None:
+                self.store[(user_id, channel)] = context
+        return context
+
+    def put(self, context: ConversationContext):
+        self.store[(context.user_id, context.channel)] = context
+        self._mark_dirty(context)
+
+    def _mark_dirty(self, context: ConversationContext):
+        if self.persister is not None:
+            self.persister.mark_dirty(context)
+
+    def append_exchange(self, user_id: str, channel: str, entry: HistoryEntry) -> ConversationContext:
+        context = self.get(user_id, channel)
+        if context is None:
+            context = ConversationContext(user_id, channel)
+            self.put(context)
+        context.append(entry, self.max_history)
+        self.store.touch((user_id, channel))
+        self._mark_dirty(context)
+        return context
+
+    def update_quote_data(self, user_id: str, channel: str, data: Dict):
+        context = self.get(user_id, channel)
+        if context is None:
+            context = ConversationContext(user_id, channel)
+            self.put(context)
+        context.quote_data.update(data)
+        context.last_activity = time.time()
+        self.store.touch((user_id, channel))
+        self._mark_dirty(context)
+
+    def sweep(self) -> int:
+        return self.store.sweep()
+
+    def start_sweeper(self, interval: float = 60):
+        self.store.start_sweeper(interval)
+
+    def stop_sweeper(self):
+        self.store.stop_sweeper()
+
+    def __len__(self) -> int:
+        return len(self.store)
+
+    def stats(self) -> Dict:
+        stats = {"backend": self.name, **self.store.stats()}
+        if self.persister is not None:
+            stats["persistence"] = self.persister.stats()
+        return stats
+
+
+def _encode_history(history: List[HistoryEntry]) -> str:
+    return json.dumps([list(entry) for entry in history], ensure_ascii=False)
+
+
+def _decode_history(raw: Optional[str]) -> List[HistoryEntry]:
+    return [HistoryEntry(*entry) for entry in json.loads(raw)] if raw else []
+
+
+class ProcessLocalSQLite:
+    """
+    sqlite3 connection opened on first use in each process: a connection must
+    not cross a fork, so a preforked worker opens its own instead of using the
+    one it inherited. Subclasses set path and schema (statements run on open).
+    """
+
+    path: str
+    schema: Tuple[str, ...] = ()
+    _connection = None
+    _connection_pid = None
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        if self._connection_pid != os.getpid():
+            # Autocommit mode; writes take BEGIN IMMEDIATE so read-modify-write is atomic across processes
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            for statement in self.schema:
+                conn.execute(statement)
+            self._connection, self._connection_pid = conn, os.getpid()
+        return self._connection
+
+
+class SQLiteContextBackend(ProcessLocalSQLite, ContextBackend):
+    """
+    Contexts in a SQLite file shared by every worker on the host; point it at
+    /dev/shm for a shared-memory store. Each call is one short transaction.
+    """
+
+    name = "sqlite"
+    schema = (
+        """
+        CREATE TABLE IF NOT EXISTS contexts (
+            user_id TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            current_intent TEXT,
+            conversation_history TEXT,
+            quote_data TEXT,
+            last_activity REAL NOT NULL,
+            step INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, channel)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_contexts_last_activity ON contexts (last_activity)"
+    )
+
+    def __init__(self, path: str, ttl: float = 1800, max_history: int = 10):
+        super().__init__(ttl, max_history)
+        self.path = path
+        self._lock = threading.Lock()
+        self.expirations = 0
+        self.sweeps = 0
+
+    def _row_to_context(self, row) -> ConversationContext:
+        context = ConversationContext(row[0], row[1])
+        context.current_intent = row[2]
+        context.conversation_history = _decode_history(row[3])
+        context.quote_data = json.loads(row[4]) if row[4] else {}
+        context.last_activity = row[5]
+        context.step = row[6]
+        return context
+
+    def _select(self, user_id: str, channel: str) -> Optional[ConversationContext]:
+        row = self._conn.execute(
+            "SELECT user_id, channel, current_intent, conversation_history, quote_data, last_activity, step "
+            "FROM contexts WHERE user_id = ? AND channel = ? AND last_activity >= ?",
+            (user_id, channel, time.time() - self.ttl)
+        ).fetchone()
+        return self._row_to_context(row) if row else None
+
+    def _upsert(self, context: ConversationContext):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO contexts (user_id, channel, current_intent, conversation_history, "
+            "quote_data, last_activity, step) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (context.user_id, context.channel, context.current_intent,
+             _encode_history(context.conversation_history),
+             json.dumps(context.quote_data, ensure_ascii=False), context.last_activity, context.step)
+        )
+
+    def _modify(self, user_id: str, channel: str, change) -> ConversationContext:
+        """Read, change and write one context inside a single write transaction"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                context = self._select(user_id, channel) or ConversationContext(user_id, channel)
+                change(context)
+                self._upsert(context)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return context
+
+    def get(self, user_id: str, channel: str) -> Optional[ConversationContext]:
+        with self._lock:
+            return self._select(user_id, channel)
+
+    def put(self, context: ConversationContext):
+        with self._lock:
+            self._upsert(context)
+
+    def append_exchange(self, user_id: str, channel: str, entry: HistoryEntry) -> ConversationContext:
+        return self._modify(user_id, channel, lambda context: context.append(entry, self.max_history))
+
+    def update_quote_data(self, user_id: str, channel: str, data: Dict):
+        def change(context: ConversationContext):
+            context.quote_data.update(data)
+            context.last_activity = time.time()
+        self._modify(user_id, channel, change)
+
+    def sweep(self) -> int:
+        with self._lock:
+            removed = self._conn.execute(
+                "DELETE FROM contexts WHERE last_activity < ?", (time.time() - self.ttl,)
+            ).rowcount
+        self.expirations += removed
+        self.sweeps += 1
+        return removed
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM contexts").fetchone()[0]
+
+    def stats(self) -> Dict:
+        return {
+            "backend": self.name,
+            "path": self.path,
+            "size": len(self),
+            "ttl": self.ttl,
+            "expirations": self.expirations,
+            "sweeps": self.sweeps,
+            "sweeper_running": self._sweeper is not None
+        }
+
+
+class RedisContextBackend(ContextBackend):
+    """
+    Contexts in Redis (or anything speaking its protocol). Every operation is one
+    pipelined MULTI/EXEC, so a message costs a single round trip; keys expire via TTL.
+    Takes any redis-py compatible client, e.g. a local fake in development.
+    """
+
+    name = "redis"
+
+    def __init__(self, client, ttl: float = 1800, max_history: int = 10, prefix: str = "gps:ctx"):
+        super().__init__(ttl, max_history)
+        self.client = client
+        self.prefix = prefix
+        self.round_trips = 0
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisContextBackend":
+        import redis  # optional dependency, only needed for CONTEXT_BACKEND=redis
+        return cls(redis.Redis.from_url(url, decode_responses=True), **kwargs)
+
+    def _keys(self, user_id: str, channel: str):
+        base = f"{self.prefix}:{channel}:{user_id}"
+        return base, f"{base}:history", f"{base}:quote"
+
+    def _execute(self, pipe) -> list:
+        self.round_trips += 1
+        return pipe.execute()
+
+    def _expire(self, pipe, *keys):
+        for key in keys:
+            pipe.expire(key, max(1, int(self.ttl)))
+
+    @staticmethod
+    def _text(value):
+        return value.decode("utf-8") if isinstance(value, bytes) else value
+
+    def _to_context(self, user_id: str, channel: str, fields: Dict, history: list,
+                    quote: Dict) -> Optional[ConversationContext]:
+        if not fields:
+            return None
+        fields = {self._text(key): self._text(value) for key, value in fields.items()}
+        context = ConversationContext(user_id, channel)
+        context.current_intent = fields.get("current_intent") or None
+        context.last_activity = float(fields.get("last_activity", 0))
+        context.step = int(fields.get("step", 0))
+        context.conversation_history = [HistoryEntry(*json.loads(self._text(raw))) for raw in history]
+        context.quote_data = {self._text(key): json.loads(self._text(value)) for key, value in quote.items()}
+        return context
+
+    def _read_into(self, pipe, keys):
+        key, history_key, quote_key = keys
+        pipe.hgetall(key)
+        pipe.lrange(history_key, 0, -1)
+        pipe.hgetall(quote_key)
+
+    def get(self, user_id: str, channel: str) -> Optional[ConversationContext]:
+        pipe = self.client.pipeline(transaction=False)
+        self._read_into(pipe, self._keys(user_id, channel))
+        fields, history, quote = self._execute(pipe)
+        return self._to_context(user_id, channel, fields, history, quote)
+
+    def put(self, context: ConversationContext):
+        keys = self._keys(context.user_id, context.channel)
+        key, history_key, quote_key = keys
+        pipe = self.client.pipeline(transaction=True)
+        pipe.delete(history_key, quote_key)
+        pipe.hset(key, mapping={
+            "current_intent": context.current_intent or "",
+            "last_activity": context.last_activity,
+            "step": context.step
+        })
+        if context.conversation_history:
+            pipe.rpush(history_key, *(json.dumps(list(entry), ensure_ascii=False)
+                                      for entry in context.conversation_history))
+        if context.quote_data:
+            pipe.hset(quote_key, mapping={name: json.dumps(value, ensure_ascii=False)
+                                          for name, value in context.quote_data.items()})
+        self._expire(pipe, *keys)
+        self._execute(pipe)
+
+    def append_exchange(self, user_id: str, channel: str, entry: HistoryEntry) -> ConversationContext:
+        # Write, trim, refresh TTLs and read back the result in the same round trip
+        keys = self._keys(user_id, channel)
+        key, history_key, quote_key = keys
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(key, mapping={"current_intent": entry.intent, "last_activity": entry.timestamp})
+        pipe.hsetnx(key, "step", 0)
+        pipe.rpush(history_key, json.dumps(list(entry), ensure_ascii=False))
+        pipe.ltrim(history_key, -self.max_history, -1)
+        self._expire(pipe, *keys)
+        self._read_into(pipe, keys)
+        fields, history, quote = self._execute(pipe)[-3:]
+        return self._to_context(user_id, channel, fields, history, quote)
+
+    def update_quote_data(self, user_id: str, channel: str, data: Dict):
+        keys = self._keys(user_id, channel)
+        key, _, quote_key = keys
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(quote_key, mapping={name: json.dumps(value, ensure_ascii=False) for name, value in data.items()})
+        pipe.hset(key, mapping={"last_activity": time.time()})
+        pipe.hsetnx(key, "step", 0)
+        self._expire(pipe, *keys)
+        self._execute(pipe)
+
+    def stats(self) -> Dict:
+        return {"backend": self.name, "ttl": self.ttl, "prefix": self.prefix, "round_trips": self.round_trips}
+
+
+def create_context_backend(config: Dict) -> ContextBackend:
+    """Backend selected by CONTEXT_CONFIG['backend'] (memory, sqlite or redis)"""
+    backend = config.get('backend', 'memory')
+    common = {"ttl": config['context_timeout'], "max_history": config['max_context_length']}
+
+    if backend == "sqlite":
+        return SQLiteContextBackend(config['sqlite_path'], **common)
+    if backend == "redis":
+        return RedisContextBackend.from_url(config['redis_url'], **common)
+    if backend != "memory":
+        logger.warning(f"Unknown context backend '{backend}', using memory")
+    return MemoryContextBackend(max_entries=config['max_active_contexts'], **common)
@@ -2,12 +2,19 @@
 Context Management System for GPS Control Chatbot
 Handles conversation context, intent recognition, and response generation
 """
-import json
-import re
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Tuple
+import atexit
+import hashlib
+import time
+from typing import Dict, Optional, Tuple
 import logging
 
+from model.config import CACHE_CONFIG, CONTEXT_CONFIG
+from utilities.response_cache import ResponseCache
+from utilities.context_backends import (
+    ContextBackend, ConversationContext, HistoryEntry, MemoryContextBackend, create_context_backend
+)
+from utilities.intent_matcher import IntentMatcher
+
 logger = logging.getLogger(__name__)
 
 # GPS Control Keywords and Context
@@ -150,106 +157,104 @@ RESPONSE_TEMPLATES = {
     ]
 }
 
+# Keyword replies for messages without a template intent
+GPS_CONTROL_RESPONSES = {
+    "precio": ("Para darte un precio exacto necesito conocer más detalles. "
+               "¿Podrías decirme qué tipo de servicio te interesa: GPS, cámaras o ambos?"),
+    "como_funciona": ("Nuestro sistema GPS Control incluye:\n"
+                      "📍 Rastreo satelital 24/7\n"
+                      "📱 App móvil gratuita\n"
+                      "🛡️ Centro de monitoreo\n"
+                      "⚡ Alertas en tiempo real\n\n"
+                      "¿Te gustaría más información sobre algún servicio específico?"),
+    "instalacion_general": ("La instalación es muy sencilla:\n"
+                            "✅ Agendamos cita gratuita\n"
+                            "✅ Técnico certificado va a tu ubicación\n"
+                            "✅ Instalación en 30-45 minutos\n"
+                            "✅ Te enseñamos a usar la app\n\n"
+                            "¿En qué zona necesitas la instalación?"),
+    "general": ("¡Hola! Soy Machín de GPS Control 🤖\n\n"
+                "Te puedo ayudar con:\n"
+                "📍 Cotizaciones de GPS\n"
+                "📹 Cámaras de seguridad\n"
+                "🔧 Información de instalación\n"
+                "📞 Soporte técnico\n\n"
+                "¿Qué servicio te interesa? 😊")
+}
+
+# Final reply text -> (template name, hash of the text), to store replies as a template reference
+TEMPLATE_KEYS = {
+    text: (name, hashlib.sha256(text.encode("utf-8")).hexdigest()[:12])
+    for name, text in [
+        *((intent, "\n".join(lines) if isinstance(lines, list) else lines)
+          for intent, lines in RESPONSE_TEMPLATES.items()),
+        *GPS_CONTROL_RESPONSES.items()
+    ]
+}
+
+# Keywords and pattern triggers compiled once into a single automaton
+INTENT_MATCHER = IntentMatcher(INTENT_PATTERNS, GPS_CONTROL_KEYWORDS)
+
 class ContextManager:
     """Manages conversation context and intent recognition for GPS Control chatbot"""
     
-    def __init__(self):
-        self.active_contexts = {}  # user_id -> context_data
-        self.context_timeout = timedelta(minutes=30)
+    def __init__(self, backend: Optional[ContextBackend] = None):
+        # (user_id, channel) -> ConversationContext, expired after context_timeout; in-process
+        # by default, or shared by all workers (CONTEXT_BACKEND=sqlite|redis)
+        self.active_contexts = backend if backend is not None else create_context_backend(CONTEXT_CONFIG)
+        # Caches only the stateless (intent, template) part; context is still updated per message
+        self.response_cache = ResponseCache(
+            max_entries=CACHE_CONFIG['max_entries'],
+            ttl=CACHE_CONFIG['ttl']
+        )
         
     def get_intent(self, message: str) -> Tuple[str, float]:
         """
         Analyze message and return most likely intent with confidence score
         """
-        message_lower = message.lower()
-        best_intent = "general"
-        best_score = 0.0
-        
-        for intent, patterns in INTENT_PATTERNS.items():
-            score = 0
-            pattern_matches = 0
-            
-            for pattern in patterns:
-                matches = len(re.findall(pattern, message_lower))
-                if matches > 0:
-                    pattern_matches += 1
-                    score += matches
-            
-            # Calculate confidence based on pattern matches and keyword presence
-            keyword_matches = sum(1 for keyword in GPS_CONTROL_KEYWORDS 
-                                if keyword in message_lower)
-            
-            if pattern_matches > 0:
-                confidence = min(0.9, (score + keyword_matches * 0.1) / len(patterns))
-                if confidence > best_score:
-                    best_score = confidence
-                    best_intent = intent
-        
-        return best_intent, best_score
+        return INTENT_MATCHER.get_intent(message.lower())
     
-    def get_context(self, user_id: str, channel: str) -> Dict:
+    def get_context(self, user_id: str, channel: str) -> ConversationContext:
         """Get or create user context"""
-        key = f"{user_id}_{channel}"
-        
-        if key not in self.active_contexts:
-            self.active_contexts[key] = {
-                "user_id": user_id,
-                "channel": channel,
-                "current_intent": None,
-                "conversation_history": [],
-                "quote_data": {},
-                "last_activity": datetime.now(),
-                "step": 0
-            }
-        
-        # Check if context has expired
-        context = self.active_contexts[key]
-        if datetime.now() - context["last_activity"] > self.context_timeout:
-            context = self._reset_context(key)
+        # Missing or expired (past context_timeout) contexts start over
+        context = self.active_contexts.get(user_id, channel)
+        if context is None:
+            context = self._reset_context(user_id, channel)
         
         return context
     
     def update_context(self, user_id: str, channel: str, message: str, 
-                      intent: str, response: str) -> Dict:
-        """Update user context with new interaction"""
-        context = self.get_context(user_id, channel)
-        
-        # Update context data
-        context["current_intent"] = intent
-        context["last_activity"] = datetime.now()
-        context["conversation_history"].append({
-            "timestamp": datetime.now().isoformat(),
-            "message": message,
-            "intent": intent,
-            "response": response
-        })
-        
-        # Keep only last 10 interactions
-        if len(context["conversation_history"]) > 10:
-            context["conversation_history"] = context["conversation_history"][-10:]
-        
-        return context
+                      intent: str, response: str) -> ConversationContext:
+        """Update user context with new interaction (one backend call, keeps the last max_context_length)"""
+        entry = HistoryEntry(time.time(), message, intent, response)
+        return self.active_contexts.append_exchange(user_id, channel, entry)
     
-    def _reset_context(self, key: str) -> Dict:
+    def _reset_context(self, user_id: str, channel: str) -> ConversationContext:
         """Reset context for expired or new conversations"""
-        user_id, channel = key.split("_", 1)
-        self.active_contexts[key] = {
-            "user_id": user_id,
-            "channel": channel,
-            "current_intent": None,
-            "conversation_history": [],
-            "quote_data": {},
-            "last_activity": datetime.now(),
-            "step": 0
-        }
-        return self.active_contexts[key]
+        context = ConversationContext(user_id, channel)
+        self.active_contexts.put(context)
+        return context
     
     def generate_contextual_response(self, message: str, user_id: str, 
                                    channel: str) -> Tuple[str, str, float]:
         """
         Generate contextual response based on message and conversation history
         """
-        context = self.get_context(user_id, channel)
+        cache_key = message.lower()
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            response, intent, confidence = cached
+        else:
+            response, intent, confidence = self._compute_response(message)
+            self.response_cache.set(cache_key, (response, intent, confidence))
+        
+        # Update context
+        self.update_context(user_id, channel, message, intent, response)
+        
+        return response, intent, confidence
+    
+    def _compute_response(self, message: str) -> Tuple[str, str, float]:
+        """Intent and template response for a message; independent of user context"""
         intent, confidence = self.get_intent(message)
         
         # Get base response template
@@ -260,66 +265,42 @@ class ContextManager:
             else:
                 response = base_response
         else:
-            response = self._generate_gps_control_response(message, context)
-        
-        # Update context
-        self.update_context(user_id, channel, message, intent, response)
+            response = self._generate_gps_control_response(message)
         
         return response, intent, confidence
     
-    def _generate_gps_control_response(self, message: str, context: Dict) -> str:
+    def _generate_gps_control_response(self, message: str) -> str:
         """Generate GPS Control specific response"""
         message_lower = message.lower()
         
         # Check for specific GPS Control keywords
         if any(keyword in message_lower for keyword in ["precio", "costo", "cuanto"]):
-            return ("Para darte un precio exacto necesito conocer más detalles. "
-                   "¿Podrías decirme qué tipo de servicio te interesa: GPS, cámaras o ambos?")
+            return GPS_CONTROL_RESPONSES["precio"]
         
         if any(keyword in message_lower for keyword in ["como funciona", "que incluye"]):
-            return ("Nuestro sistema GPS Control incluye:\n"
-                   "📍 Rastreo satelital 24/7\n"
-                   "📱 App móvil gratuita\n" 
-                   "🛡️ Centro de monitoreo\n"
-                   "⚡ Alertas en tiempo real\n\n"
-                   "¿Te gustaría más información sobre algún servicio específico?")
+            return GPS_CONTROL_RESPONSES["como_funciona"]
         
         if any(keyword in message_lower for keyword in ["instalacion", "instalar"]):
-            return ("La instalación es muy sencilla:\n"
-                   "✅ Agendamos cita gratuita\n"
-                   "✅ Técnico certificado va a tu ubicación\n"
-                   "✅ Instalación en 30-45 minutos\n"
-                   "✅ Te enseñamos a usar la app\n\n"
-                   "¿En qué zona necesitas la instalación?")
+            return GPS_CONTROL_RESPONSES["instalacion_general"]
         
         # Default GPS Control response
-        return ("¡Hola! Soy Machín de GPS Control 🤖\n\n"
-               "Te puedo ayudar con:\n"
-               "📍 Cotizaciones de GPS\n" 
-               "📹 Cámaras de seguridad\n"
-               "🔧 Información de instalación\n"
-               "📞 Soporte técnico\n\n"
-               "¿Qué servicio te interesa? 😊")
+        return GPS_CONTROL_RESPONSES["general"]
     
     def is_quote_in_progress(self, user_id: str, channel: str) -> bool:
         """Check if user has an active quote process"""
         context = self.get_context(user_id, channel)
-        return bool(context.get("quote_data")) and context.get("current_intent") in [
+        return bool(context.quote_data) and context.current_intent in [
             "cotizacion_gps", "cotizacion_camaras"
         ]
     
     def get_quote_data(self, user_id: str, channel: str) -> Dict:
         """Get current quote data for user"""
         context = self.get_context(user_id, channel)
-        return context.get("quote_data", {})
+        return context.quote_data
     
     def update_quote_data(self, user_id: str, channel: str, data: Dict):
         """Update quote data in context"""
-        context = self.get_context(user_id, channel)
-        if "quote_data" not in context:
-            context["quote_data"] = {}
-        context["quote_data"].update(data)
-        context["last_activity"] = datetime.now()
+        self.active_contexts.update_quote_data(user_id, channel, data)
 
 # Global context manager instance
 context_manager = ContextManager()
@@ -339,6 +320,48 @@ def get_contextual_response(message: str, user_id: str, channel: str = "web") ->
             0.0
         )
 
+def template_reference(response: str) -> Optional[Tuple[str, str]]:
+    """(template name, version) of a context reply that is exactly a template, if any"""
+    return TEMPLATE_KEYS.get(response)
+
+def get_response_cache_stats() -> Dict:
+    """Hit-rate and eviction stats of the contextual response cache"""
+    return context_manager.response_cache.stats()
+
+def get_context_store_stats() -> Dict:
+    """Backend name plus size, eviction and memory gauges of the context store"""
+    return context_manager.active_contexts.stats()
+
+def start_context_sweeper(interval: float = CONTEXT_CONFIG['sweep_interval']):
+    """Expire inactive contexts in the background so one-time senders are released"""
+    if interval > 0:
+        context_manager.active_contexts.start_sweeper(interval)
+
+def enable_context_persistence(app):
+    """
+    Write-behind persistence of memory-backend contexts into user_context
+    (shared backends are already durable). Returns the persister or None.
+    """
+    backend = context_manager.active_contexts
+    if not CONTEXT_CONFIG['persist'] or not isinstance(backend, MemoryContextBackend):
+        return None
+    if backend.persister is not None:
+        return backend.persister
+
+    from utilities.context_persistence import ContextPersister
+    persister = ContextPersister(
+        app,
+        ttl=CONTEXT_CONFIG['context_timeout'],
+        flush_interval=CONTEXT_CONFIG['flush_interval'],
+        batch_size=CONTEXT_CONFIG['flush_batch_size'],
+        cleanup_interval=CONTEXT_CONFIG['cleanup_interval']
+    )
+    backend.persister = persister
+    persister.start()
+    atexit.register(persister.stop)
+    logger.info("Context write-behind persistence enabled")
+    return persister
+
 def analyze_intent(message: str) -> Tuple[str, float]:
     """
     Analyze message intent
@@ -0,0 +1,214 @@
+"""
+Write-behind persistence of in-memory conversation contexts into user_context
+Changed contexts are only marked dirty on the reply path; a background thread
+flushes them in batches and bulk-deletes expired rows, and contexts are loaded
+back lazily on first access after a restart
+"""
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+import logging
+
+from sqlalchemy import delete, insert, tuple_
+
+from model.models import db, UserContext
+from utilities.context_backends import ConversationContext, HistoryEntry
+
+logger = logging.getLogger(__name__)
+
+
+class ContextPersister:
+    """Batches dirty contexts and writes them to user_context off the request path"""
+
+    def __init__(self, app, ttl: float = 1800, flush_interval: float = 5, batch_size: int = 200,
+                 cleanup_interval: float = 300):
+        self.app = app
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.cleanup_interval = cleanup_interval
+        self._dirty = {}  # (user_id, channel) -> ConversationContext
+        # Keys with an unexpired row -> its expires_at (epoch seconds); a miss for any
+        # other key never touches the database. Pruned with the expired rows
+        self._persisted_keys = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._last_cleanup = time.monotonic()
+        self.stats_counters = {
+            "flushes": 0, "rows_flushed": 0, "flush_failures": 0, "loads": 0,
+            "load_failures": 0, "expired_deleted": 0, "last_flush_seconds": None
+        }
+
+    def mark_dirty(self, context: ConversationContext):
+        """Queue a context for the next flush (no database access)"""
+        with self._lock:
+            self._dirty[(context.user_id, context.channel)] = context
+            pending = len(self._dirty)
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def load_keys(self) -> int:
+        """Read the keys of every unexpired row in one query (at startup)"""
+        try:
+            with self.app.app_context():
+                rows = db.session.query(UserContext.user_id, UserContext.channel, UserContext.expires_at).filter(
+                    UserContext.expires_at >= datetime.now()
+                ).all()
+            with self._lock:
+                for user_id, channel, expires_at in rows:
+                    key = (user_id, channel)
+                    self._persisted_keys[key] = max(self._persisted_keys.get(key, 0), expires_at.timestamp())
+            return len(rows)
+        except Exception as e:
+            logger.error(f"Error reading persisted context keys: {e}")
+            return 0
+
+    def load(self, user_id: str, channel: str) -> Optional[ConversationContext]:
+        """Unexpired persisted context for a user, or None"""
+        key = (user_id, channel)
+        with self._lock:
+            expires_at = self._persisted_keys.get(key)
+            if expires_at is None:
+                return None
+            if expires_at < time.time():
+                del self._persisted_keys[key]
+                return None
+        try:
+            with self.app.app_context():
+                row = UserContext.query.filter(
+                    UserContext.user_id == user_id,
+                    UserContext.channel == channel,
+                    UserContext.expires_at >= datetime.now()
+                ).order_by(UserContext.id.desc()).first()
+                self.stats_counters["loads"] += 1
+                if row is None:
+                    # Only a miss forgets the key: the row stays reloadable if this context is evicted again
+                    with self._lock:
+                        if self._persisted_keys.get(key) == expires_at:
+                            del self._persisted_keys[key]
+                    return None
+                return self._to_context(row)
+        except Exception as e:
+            self.stats_counters["load_failures"] += 1
+            logger.error(f"Error loading persisted context for {user_id}: {e}")
+            return None
+
+    def _to_context(self, row: UserContext) -> ConversationContext:
+        data = row.context_data or {}
+        context = ConversationContext(row.user_id, row.channel)
+        context.current_intent = row.current_intent
+        context.conversation_history = [HistoryEntry(*entry) for entry in data.get("conversation_history", [])]
+        context.quote_data = data.get("quote_data", {})
+        context.step = data.get("step", 0)
+        context.last_activity = data.get("last_activity", time.time())
+        return context
+
+    def _to_row(self, context: ConversationContext) -> Dict:
+        history = list(context.conversation_history)
+        return {
+            "user_id": context.user_id,
+            "channel": context.channel,
+            "current_intent": context.current_intent,
+            "context_data": {
+                "conversation_history": [list(entry) for entry in history],
+                "quote_data": dict(context.quote_data),
+                "step": context.step,
+                "last_activity": context.last_activity
+            },
+            "last_message": history[-1].message if history else None,
+            "expires_at": datetime.fromtimestamp(context.last_activity + self.ttl),
+            "created_at": datetime.now(),
+            "updated_at": datetime.now()
+        }
+
+    def flush(self) -> int:
+        """Write every dirty context in one transaction; returns rows written"""
+        with self._lock:
+            batch, self._dirty = self._dirty, {}
+        if not batch:
+            return 0
+
+        start = time.perf_counter()
+        rows = [self._to_row(context) for context in batch.values()]
+        try:
+            with self.app.app_context():
+                # user_context has no unique (user_id, channel) key: replace the batch's rows
+                db.session.execute(delete(UserContext).where(
+                    tuple_(UserContext.user_id, UserContext.channel).in_(list(batch))
+                ))
+                db.session.execute(insert(UserContext), rows)
+                db.session.commit()
+        except Exception as e:
+            self.stats_counters["flush_failures"] += 1
+            logger.error(f"Error flushing {len(rows)} contexts, will retry: {e}")
+            with self._lock:
+                # Keep newer versions queued since the failed batch was taken
+                self._dirty = {**batch, **self._dirty}
+            try:
+                with self.app.app_context():
+                    db.session.rollback()
+            except Exception:
+                pass
+            return 0
+
+        with self._lock:
+            # Reloadable if the in-memory copy is later evicted
+            for key, context in batch.items():
+                self._persisted_keys[key] = context.last_activity + self.ttl
+        self.stats_counters["flushes"] += 1
+        self.stats_counters["rows_flushed"] += len(rows)
+        self.stats_counters["last_flush_seconds"] = round(time.perf_counter() - start, 4)
+        return len(rows)
+
+    def delete_expired(self) -> int:
+        """One bulk DELETE of expired rows (uses the expires_at index), and forget their keys"""
+        now = time.time()
+        with self._lock:
+            self._persisted_keys = {
+                key: expires_at for key, expires_at in self._persisted_keys.items() if expires_at >= now
+            }
+        try:
+            with self.app.app_context():
+                deleted = db.session.execute(
+                    delete(UserContext).where(UserContext.expires_at < datetime.now())
+                ).rowcount
+                db.session.commit()
+            self.stats_counters["expired_deleted"] += deleted
+            return deleted
+        except Exception as e:
+            logger.error(f"Error deleting expired contexts: {e}")
+            return 0
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+            if time.monotonic() - self._last_cleanup >= self.cleanup_interval:
+                self._last_cleanup = time.monotonic()
+                self.delete_expired()
+
+    def start(self):
+        """Start the background flusher"""
+        if self._thread is not None:
+            return
+        self.load_keys()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="context-flusher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the flusher and write whatever is still dirty"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        self.flush()
+
+    def stats(self) -> Dict:
+        return {**self.stats_counters, "dirty": len(self._dirty), "persisted_keys": len(self._persisted_keys),
+                "running": self._thread is not None}
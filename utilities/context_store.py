@@ -0,0 +1,153 @@
+"""
+Bounded in-memory store for per-user conversation contexts
+Entries are kept in last-activity order, capped at a maximum size (least recently
+active evicted first) and expired by a background sweeper after the context timeout
+"""
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Any, Dict, Hashable, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Entries sampled when estimating the memory held by the store
+MEMORY_SAMPLE_SIZE = 100
+
+
+def deep_sizeof(obj: Any, seen: Optional[set] = None) -> int:
+    """Approximate bytes held by obj and the containers/values it references"""
+    seen = seen if seen is not None else set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(deep_sizeof(key, seen) + deep_sizeof(value, seen) for key, value in obj.items())
+    elif isinstance(obj, (list, tuple, set, frozenset, deque)):
+        size += sum(deep_sizeof(item, seen) for item in obj)
+    elif hasattr(obj, "__dict__"):
+        size += deep_sizeof(vars(obj), seen)
+    elif hasattr(obj, "__slots__"):
+        size += sum(deep_sizeof(getattr(obj, slot), seen) for slot in obj.__slots__ if hasattr(obj, slot))
+    return size
+
+
+class ContextStore:
+    """Thread-safe LRU (by last activity) + TTL map of user contexts, keyed by (user_id, channel)"""
+
+    def __init__(self, max_entries: int = 10000, ttl: float = 1800):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> [last_activity, value], oldest activity first
+        self._lock = threading.Lock()
+        self._sweeper = None
+        self._sweeper_stop = threading.Event()
+        self.evictions = 0
+        self.expirations = 0
+        self.sweeps = 0
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the stored value, or None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if time.time() - entry[0] > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                return None
+            return entry[1]
+
+    def __setitem__(self, key: Hashable, value: Any):
+        """Store a value as just active, evicting the least recently active past capacity"""
+        with self._lock:
+            self._entries[key] = [time.time(), value]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def touch(self, key: Hashable):
+        """Mark an entry as active now"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                entry[0] = time.time()
+                self._entries.move_to_end(key)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            return entry[1] if entry is not None else default
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.get(key) is not None
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def sweep(self) -> int:
+        """Drop every expired entry; returns how many were removed"""
+        cutoff = time.time() - self.ttl
+        removed = 0
+        with self._lock:
+            # Oldest activity first, so stop at the first entry still alive
+            while self._entries:
+                key, (last_activity, _) = next(iter(self._entries.items()))
+                if last_activity > cutoff:
+                    break
+                del self._entries[key]
+                removed += 1
+            self.expirations += removed
+            self.sweeps += 1
+        if removed:
+            logger.info(f"Expired {removed} inactive contexts, {len(self._entries)} active")
+        return removed
+
+    def start_sweeper(self, interval: float = 60):
+        """Expire inactive contexts every interval seconds in a background thread"""
+        if self._sweeper is not None:
+            return
+
+        def run():
+            while not self._sweeper_stop.wait(interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"Error sweeping contexts: {e}")
+
+        self._sweeper_stop.clear()
+        self._sweeper = threading.Thread(target=run, name="context-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def stop_sweeper(self):
+        """Stop the background sweeper"""
+        self._sweeper_stop.set()
+        self._sweeper = None
+
+    def memory_bytes(self) -> int:
+        """Estimated bytes held by stored contexts, extrapolated from a sample"""
+        with self._lock:
+            size = len(self._entries)
+            sample = list(islice(self._entries.items(), MEMORY_SAMPLE_SIZE))
+        if not sample:
+            return sys.getsizeof(self._entries)
+        per_entry = sum(deep_sizeof(key) + deep_sizeof(value) for key, (_, value) in sample) / len(sample)
+        return int(sys.getsizeof(self._entries) + per_entry * size)
+
+    def stats(self) -> Dict:
+        """Size, eviction and memory gauges for monitoring"""
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "sweeps": self.sweeps,
+            "sweeper_running": self._sweeper is not None,
+            "memory_bytes": self.memory_bytes()
+        }
@@ -0,0 +1,369 @@
+"""
+Retention for the conversations table
+Whole months older than the retention age are written to gzip JSONL files (one
+or more parts per month, listed in manifest.json with their row count and id
+range) and only then purged, in short bounded DELETE batches or, when
+conversations is range-partitioned on MySQL, by dropping the month's partition.
+Archived months stay readable through archived_page(), which takes the same
+filters and keyset cursor as /api/conversations
+"""
+import gzip
+import heapq
+import json
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+import logging
+
+from sqlalchemy import case, func, inspect, select, text
+
+from model.models import Conversation, Seller
+from model.rollups import EPOCH
+from utilities.conversation_export import gzip_chunks, iter_conversation_batches, ndjson_chunks
+
+logger = logging.getLogger(__name__)
+
+MANIFEST = "manifest.json"
+
+
+def month_start(at: datetime) -> datetime:
+    return at.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(month: datetime) -> datetime:
+    return month.replace(year=month.year + 1, month=1) if month.month == 12 else month.replace(month=month.month + 1)
+
+
+def load_manifest(archive_dir: str) -> Dict:
+    """Archived parts per month ("YYYY-MM"): file, rows, min_id, max_id, archived_at, purged"""
+    path = os.path.join(archive_dir, MANIFEST)
+    if not os.path.exists(path):
+        return {"months": {}}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _save_manifest(archive_dir: str, manifest: Dict):
+    path = os.path.join(archive_dir, MANIFEST)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def _month_range(month: datetime) -> List:
+    return [Conversation.created_at >= month, Conversation.created_at < next_month(month)]
+
+
+def archive_month(engine, archive_dir: str, month: datetime, manifest: Dict) -> Optional[Dict]:
+    """
+    Write the month's live rows to a new part; the manifest is saved only once
+    the file is synced and in place. Earlier parts must be purged first, so
+    every live row of the month is one not archived yet (late commits and
+    replayed spill rows included).
+    """
+    key = month.strftime("%Y-%m")
+    parts = manifest["months"].setdefault(key, [])
+    counts = {"rows": 0, "min_id": None, "max_id": None}
+
+    def counted(batches):
+        for rows in batches:
+            ids = [row["id"] for row in rows]
+            counts["rows"] += len(rows)
+            counts["min_id"] = min(ids) if counts["min_id"] is None else min(counts["min_id"], min(ids))
+            counts["max_id"] = max(ids) if counts["max_id"] is None else max(counts["max_id"], max(ids))
+            yield rows
+
+    name = f"conversations-{key}.jsonl.gz" if not parts else f"conversations-{key}.{len(parts) + 1}.jsonl.gz"
+    path = os.path.join(archive_dir, name)
+    os.makedirs(archive_dir, exist_ok=True)
+    batches = iter_conversation_batches(engine, _month_range(month))
+    with open(path + ".tmp", "wb") as f:
+        for chunk in gzip_chunks(ndjson_chunks(counted(batches))):
+            f.write(chunk)
+        f.flush()
+        os.fsync(f.fileno())
+    if not counts["rows"]:
+        os.remove(path + ".tmp")
+        if not parts:
+            del manifest["months"][key]
+        return None
+    os.replace(path + ".tmp", path)
+
+    part = {"file": name, **counts, "archived_at": datetime.now().isoformat(), "purged": False}
+    parts.append(part)
+    _save_manifest(archive_dir, manifest)
+    logger.info(f"Archived {counts['rows']} conversations from {key} to {path}")
+    return part
+
+
+def _part_ids(archive_dir: str, part: Dict, batch_size: int) -> Iterator[List[int]]:
+    """Ids written to a part file, in batches"""
+    ids = []
+    with gzip.open(os.path.join(archive_dir, part["file"]), "rt", encoding="utf-8") as f:
+        for line in f:
+            ids.append(json.loads(line)["id"])
+            if len(ids) >= batch_size:
+                yield ids
+                ids = []
+    if ids:
+        yield ids
+
+
+def purge_part(engine, archive_dir: str, month: datetime, part: Dict, batch_size: int = 1000,
+               pause: float = 0.05) -> int:
+    """
+    Delete exactly the rows written to a part, in short transactions of
+    batch_size ids; rows of the month that are not in the file stay live.
+    Re-running it is harmless (already deleted ids match nothing).
+    """
+    table = Conversation.__table__
+    deleted = 0
+    for ids in _part_ids(archive_dir, part, batch_size):
+        with engine.begin() as conn:
+            deleted += conn.execute(table.delete().where(table.c.id.in_(ids), *_month_range(month))).rowcount
+        time.sleep(pause)
+    return deleted
+
+
+def _partition_name(month: datetime) -> str:
+    return f"p{month.strftime('%Y%m')}"
+
+
+def _bound(month: datetime, timestamp: bool) -> str:
+    """Partition bound for the start of month, as RANGE(UNIX_TIMESTAMP()) or RANGE COLUMNS expects"""
+    day = f"'{month.strftime('%Y-%m-%d')}'"
+    return f"UNIX_TIMESTAMP({day})" if timestamp else day
+
+
+def _partition_clause(month: datetime, timestamp: bool) -> str:
+    return f"PARTITION {_partition_name(month)} VALUES LESS THAN ({_bound(next_month(month), timestamp)})"
+
+
+def _created_at_type(conn) -> str:
+    """SQL type of conversations.created_at: TIMESTAMP (setup_database.sql) or DATETIME (create_all)"""
+    column = next(c for c in inspect(conn).get_columns(Conversation.__tablename__) if c["name"] == "created_at")
+    return "TIMESTAMP" if str(column["type"]).upper().startswith("TIMESTAMP") else "DATETIME"
+
+
+def _months_ahead(first: datetime, months_ahead: int) -> List[datetime]:
+    """Months from first through months_ahead past the current one"""
+    last = month_start(datetime.now())
+    for _ in range(months_ahead):
+        last = next_month(last)
+    months = []
+    while first <= last:
+        months.append(first)
+        first = next_month(first)
+    return months
+
+
+def partition_names(engine) -> List[str]:
+    """Partitions of conversations (empty unless range-partitioned on MySQL)"""
+    if engine.dialect.name != 'mysql':
+        return []
+    with engine.connect() as conn:
+        return [row[0] for row in conn.execute(text(
+            "SELECT PARTITION_NAME FROM information_schema.PARTITIONS WHERE TABLE_SCHEMA = DATABASE() "
+            "AND TABLE_NAME = 'conversations' AND PARTITION_NAME IS NOT NULL ORDER BY PARTITION_ORDINAL_POSITION"
+        ))]
+
+
+def _drop_partition(engine, month: datetime, part: Dict) -> Optional[int]:
+    """
+    Drop the month's partition if it holds exactly the part's rows (every live
+    row was written before, and none arrived since); None when batched deletes
+    are needed
+    """
+    if _partition_name(month) not in partition_names(engine):
+        return None
+    table = Conversation.__table__
+    with engine.connect() as conn:
+        in_range = func.coalesce(func.sum(case(
+            (table.c.id.between(part["min_id"], part["max_id"]), 1), else_=0
+        )), 0)
+        counted, archived = conn.execute(select(func.count(), in_range).where(*_month_range(month))).one()
+    if counted != part["rows"] or archived != part["rows"]:
+        logger.info(f"{_partition_name(month)} holds {counted} rows, part has {part['rows']}: purging by id")
+        return None
+    with engine.begin() as conn:
+        conn.execute(text(f"ALTER TABLE conversations DROP PARTITION {_partition_name(month)}"))
+    logger.info(f"Dropped partition {_partition_name(month)} ({counted} rows)")
+    return counted
+
+
+def add_future_partitions(engine, months_ahead: int = 3) -> List[str]:
+    """Split pmax so monthly partitions exist up to months_ahead from now"""
+    existing = partition_names(engine)
+    monthly = sorted(datetime.strptime(name[1:], "%Y%m") for name in existing if name[1:].isdigit())
+    months = _months_ahead(next_month(monthly[-1]) if monthly else month_start(datetime.now()), months_ahead)
+    if months:
+        with engine.begin() as conn:
+            timestamp = _created_at_type(conn) == "TIMESTAMP"
+            conn.execute(text(
+                f"ALTER TABLE conversations REORGANIZE PARTITION pmax INTO ("
+                f"{', '.join(_partition_clause(month, timestamp) for month in months)}, "
+                f"PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+            ))
+        logger.info(f"Added partitions {[_partition_name(month) for month in months]}")
+    return [_partition_name(month) for month in months]
+
+
+def partition_conversations(engine, months_ahead: int = 3) -> List[str]:
+    """
+    Range-partition conversations by month of created_at (MySQL only). created_at
+    keeps its type: a TIMESTAMP column (setup_database.sql) is partitioned on
+    UNIX_TIMESTAMP(created_at), with month bounds in the time zone of the session
+    running this, a DATETIME column (create_all) on its value. MySQL needs the
+    partition column in the primary key, so created_at becomes NOT NULL (NULL
+    rows get the earliest TIMESTAMP, 1970-01-01 00:00:01 UTC) and the key becomes
+    (id, created_at). MySQL allows no foreign keys on a partitioned table, so the
+    seller_id foreign key is dropped and no longer enforced. Rebuilds the table:
+    run it off-peak.
+    """
+    if engine.dialect.name != 'mysql':
+        raise ValueError("Range partitioning is only supported on MySQL")
+    if partition_names(engine):
+        return add_future_partitions(engine, months_ahead)
+
+    table = Conversation.__table__
+    earliest = func.from_unixtime(1)
+    with engine.begin() as conn:
+        column_type = _created_at_type(conn)
+        for foreign_key in inspect(conn).get_foreign_keys(table.name):
+            logger.warning(f"Dropping foreign key {foreign_key['name']} ({foreign_key['constrained_columns']} -> "
+                           f"{foreign_key['referred_table']}): not allowed on a partitioned table")
+            conn.execute(text(f"ALTER TABLE conversations DROP FOREIGN KEY `{foreign_key['name']}`"))
+        conn.execute(table.update().where(table.c.created_at.is_(None)).values(created_at=earliest))
+        first = conn.execute(select(func.min(table.c.created_at)).where(table.c.created_at > earliest)).scalar()
+        conn.execute(text(
+            f"ALTER TABLE conversations MODIFY created_at {column_type} NOT NULL DEFAULT CURRENT_TIMESTAMP, "
+            f"DROP PRIMARY KEY, ADD PRIMARY KEY (id, created_at)"
+        ))
+
+    timestamp = column_type == "TIMESTAMP"
+    months = _months_ahead(month_start(first or datetime.now()), months_ahead)
+    with engine.begin() as conn:
+        conn.execute(text(
+            f"ALTER TABLE conversations PARTITION BY "
+            f"{'RANGE (UNIX_TIMESTAMP(created_at))' if timestamp else 'RANGE COLUMNS(created_at)'} ("
+            f"PARTITION p_before VALUES LESS THAN ({_bound(months[0], timestamp)}), "
+            f"{', '.join(_partition_clause(month, timestamp) for month in months)}, "
+            f"PARTITION pmax VALUES LESS THAN (MAXVALUE))"
+        ))
+    logger.info(f"Partitioned conversations on {column_type} created_at into {len(months)} monthly partitions")
+    return [_partition_name(month) for month in months]
+
+
+def archive_conversations(engine, archive_dir: str, archive_after_days: int = 365, purge_batch_size: int = 1000,
+                          purge_pause: float = 0.05) -> Dict[str, Dict]:
+    """
+    Archive then purge every whole month that ended more than archive_after_days
+    ago. Only rows written to a part are deleted. Safe to re-run after a crash:
+    parts not marked purged are purged first, so their rows are not archived
+    twice. Returns {month: {"archived": rows, "purged": rows}}.
+    """
+    cutoff = month_start(datetime.now() - timedelta(days=archive_after_days))
+    manifest = load_manifest(archive_dir)
+    table = Conversation.__table__
+    summary = {}
+    since = None
+    while True:
+        with engine.connect() as conn:
+            oldest = conn.execute(select(func.min(table.c.created_at)).where(
+                table.c.created_at < cutoff, *([table.c.created_at >= since] if since else [])
+            )).scalar()
+        if oldest is None:
+            break
+        month = month_start(oldest)
+        purged = 0
+        # Parts a crashed run archived but did not finish purging (older manifests lack the flag)
+        for earlier in manifest["months"].get(month.strftime("%Y-%m"), []):
+            if not earlier.get("purged", False):
+                purged += purge_part(engine, archive_dir, month, earlier, purge_batch_size, purge_pause)
+                earlier["purged"] = True
+                _save_manifest(archive_dir, manifest)
+
+        part = archive_month(engine, archive_dir, month, manifest)
+        if part is not None:
+            dropped = _drop_partition(engine, month, part)
+            purged += dropped if dropped is not None else purge_part(
+                engine, archive_dir, month, part, purge_batch_size, purge_pause
+            )
+            part["purged"] = True
+            _save_manifest(archive_dir, manifest)
+        summary[month.strftime("%Y-%m")] = {"archived": part["rows"] if part else 0, "purged": purged}
+        since = next_month(month)
+    return summary
+
+
+def archive_status(engine, archive_dir: str) -> Dict:
+    """Archived months with their row counts, the oldest live row and partitioning"""
+    manifest = load_manifest(archive_dir)
+    with engine.connect() as conn:
+        oldest = conn.execute(select(func.min(Conversation.__table__.c.created_at))).scalar()
+    return {
+        "archived_months": {month: sum(part["rows"] for part in parts)
+                            for month, parts in sorted(manifest["months"].items())},
+        "oldest_live": oldest.isoformat() if oldest else None,
+        "partitions": partition_names(engine)
+    }
+
+
+def _archived_rows(archive_dir: str, parts: List[Dict], needles: List[str]) -> Iterator[Dict]:
+    """Rows of the parts, skipping without parsing lines that lack any of the needles"""
+    for part in parts:
+        with gzip.open(os.path.join(archive_dir, part["file"]), "rt", encoding="utf-8") as f:
+            for line in f:
+                if not all(needle in line for needle in needles):
+                    continue
+                row = json.loads(line)
+                row["created_at"] = datetime.fromisoformat(row["created_at"]) if row["created_at"] else EPOCH
+                yield row
+
+
+def archived_page(archive_dir: str, values: Dict, cursor: Optional[Tuple[datetime, int]],
+                  per_page: int) -> Tuple[List[Dict], bool]:
+    """
+    Newest-first page of archived conversations for the /api/conversations
+    filters (channel, intent, user_id, since, until) and (created_at, id) cursor,
+    shaped like Conversation.to_dict(); also returns whether more rows follow.
+    Months are scanned newest first keeping only the per_page + 1 newest matches,
+    so memory is bounded by the page size.
+    """
+    manifest = load_manifest(archive_dir)
+    since, until = values.get("since"), values.get("until")
+
+    def matches(row) -> bool:
+        return (all(not values.get(name) or row[name] == values[name] for name in ("channel", "intent", "user_id"))
+                and (not since or row["created_at"] >= since) and (not until or row["created_at"] < until)
+                and (not cursor or (row["created_at"], row["id"]) < cursor))
+
+    # Equality filters as they appear in the NDJSON lines, checked before parsing
+    needles = [f'"{name}": {json.dumps(values[name], ensure_ascii=False)}'
+               for name in ("channel", "intent", "user_id") if values.get(name)]
+    page = []
+    for key in sorted(manifest["months"], reverse=True):
+        month = datetime.strptime(key, "%Y-%m")
+        if (until and month >= until) or (cursor and month > cursor[0]):
+            continue
+        if since and next_month(month) <= since:
+            break
+        rows = (row for row in _archived_rows(archive_dir, manifest["months"][key], needles) if matches(row))
+        page.extend(heapq.nlargest(per_page + 1 - len(page), rows, key=lambda row: (row["created_at"], row["id"])))
+        if len(page) > per_page:
+            break
+
+    page, has_more = page[:per_page], len(page) > per_page
+    seller_ids = {row["seller_id"] for row in page if row.get("seller_id")}
+    sellers = {seller.id: seller.to_dict() for seller in Seller.query.filter(Seller.id.in_(seller_ids))} \
+        if seller_ids else {}
+    return [{
+        **{name: row.get(name) for name in ("id", "user_id", "channel", "message", "response", "intent",
+                                            "confidence", "context_data", "session_id")},
+        "created_at": row["created_at"].isoformat(),
+        "seller": sellers.get(row.get("seller_id")),
+        "archived": True
+    } for row in page], has_more
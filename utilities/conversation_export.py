@@ -0,0 +1,91 @@
+"""
+Streaming export of conversation history as NDJSON or CSV
+Rows are read through a server-side cursor in fixed-size partitions and encoded
+(and optionally gzip-compressed) chunk by chunk, so memory stays constant
+however many rows are exported
+"""
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List
+
+from sqlalchemy import func, select
+
+from model.models import Conversation, ResponseTemplate, Seller
+
+EXPORT_FIELDS = [
+    "id", "user_id", "channel", "message", "response", "intent", "confidence",
+    "context_data", "created_at", "session_id", "seller_id", "seller_name"
+]
+
+# Rows fetched from the cursor (and encoded) per chunk
+EXPORT_BATCH_ROWS = 1000
+
+FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv"
+}
+
+
+def iter_conversation_batches(engine, filters: List, batch_rows: int = EXPORT_BATCH_ROWS) -> Iterator[List[Dict]]:
+    """Matching conversations oldest first, in partitions of batch_rows, on a dedicated connection"""
+    columns = {
+        "response": func.coalesce(Conversation.response, ResponseTemplate.text).label("response"),  # Rehydrated
+        "seller_name": Seller.name.label("seller_name")
+    }
+    statement = select(
+        *[columns.get(name, Conversation.__table__.c.get(name)) for name in EXPORT_FIELDS]
+    ).outerjoin(Seller, Conversation.seller_id == Seller.id).outerjoin(
+        ResponseTemplate, Conversation.response_template_id == ResponseTemplate.id
+    ).where(*filters).order_by(Conversation.created_at, Conversation.id)
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_rows).execute(statement)
+        for partition in result.mappings().partitions():
+            yield partition
+
+
+def _serialize(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def ndjson_chunks(batches: Iterable[List[Dict]]) -> Iterator[str]:
+    for rows in batches:
+        yield "".join(
+            json.dumps({name: _serialize(row[name]) for name in EXPORT_FIELDS}, ensure_ascii=False) + "\n"
+            for row in rows
+        )
+
+
+def csv_chunks(batches: Iterable[List[Dict]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    for rows in batches:
+        for row in rows:
+            writer.writerow([
+                json.dumps(row[name], ensure_ascii=False) if name == "context_data" and row[name] is not None
+                else _serialize(row[name])
+                for name in EXPORT_FIELDS
+            ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def gzip_chunks(chunks: Iterable[str]) -> Iterator[bytes]:
+    """gzip-compress a text stream on the fly"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def export_stream(engine, filters: List, export_format: str, compress: bool) -> Iterator:
+    """Encoded (and optionally compressed) export body"""
+    batches = iter_conversation_batches(engine, filters)
+    chunks = ndjson_chunks(batches) if export_format == "ndjson" else csv_chunks(batches)
+    return gzip_chunks(chunks) if compress else (chunk.encode("utf-8") for chunk in chunks)
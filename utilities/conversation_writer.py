@@ -0,0 +1,328 @@
+"""
+Background writer for conversation rows
+save_conversation only enqueues; a writer thread groups queued rows into
+multi-row inserts every flush interval or batch size, spills them to JSONL files
+when the database is unavailable and replays the spill once it is back
+"""
+import glob
+import json
+import os
+import queue
+import re
+import threading
+import time
+import uuid
+from collections import Counter
+from datetime import datetime
+from typing import Dict, List
+import logging
+
+from sqlalchemy import insert
+
+from model.migrations import applied_versions
+from model.models import db, Conversation, upsert_chat_report_counts
+from model.rollups import first_seen_users, prune_rollup_users, update_rollups
+from utilities.response_templates import compact_rows
+
+logger = logging.getLogger(__name__)
+
+# Seconds between prunes of closed rollup buckets' user lists
+ROLLUP_PRUNE_INTERVAL = 3600
+
+# Migrations a batch relies on; until one is applied its step is skipped without losing
+# data: reports are updated row by row (migration 2 folds any duplicates), rollups are
+# rebuilt from conversations by migration 3 and verbatim replies compacted by backfill
+SCHEMA_FEATURES = {"report_key": 2, "rollups": 3, "templates": 4}
+
+# Spill files being replayed: conversations-<date>.jsonl.<pid>-<token>.replaying
+CLAIM_PATTERN = re.compile(r"\.(\d+)-[0-9a-f]+\.replaying$")
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class ConversationWriter:
+    """Bounded queue of conversation rows drained in batches by one thread"""
+
+    def __init__(self, app, max_queue: int = 10000, batch_size: int = 100, flush_interval: float = 0.2,
+                 spill_dir: str = "conversation_spill"):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spill_dir = spill_dir
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        self._spill_lock = threading.Lock()
+        self._last_prune = time.monotonic()
+        self.schema = {feature: False for feature in SCHEMA_FEATURES}
+        self.stats_counters = {
+            "enqueued": 0, "written": 0, "batches": 0, "write_failures": 0,
+            "spilled": 0, "replayed": 0, "queue_full": 0, "last_batch_seconds": None
+        }
+
+    def submit(self, user_id: str, channel: str, message: str, response: str, intent: str,
+               confidence: float) -> datetime:
+        """Queue one exchange and return its created_at; never blocks (a full queue spills straight to disk)"""
+        now = datetime.now()
+        row = {
+            "user_id": user_id,
+            "channel": channel,
+            "message": message,
+            "response": response,
+            "intent": intent,
+            "confidence": confidence,
+            "session_id": f"{user_id}_{channel}_{now.strftime('%Y%m%d')}",
+            "created_at": now
+        }
+        try:
+            self._queue.put_nowait(row)
+            self.stats_counters["enqueued"] += 1
+        except queue.Full:
+            self.stats_counters["queue_full"] += 1
+            self._spill([row])
+        return now
+
+    def _drain(self) -> List[Dict]:
+        """Block up to the flush interval for the first row, then take up to a batch"""
+        try:
+            rows = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + self.flush_interval
+        while len(rows) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                rows.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return rows
+
+    def _refresh_schema(self):
+        """Re-read applied migrations while any the batch relies on is pending"""
+        if all(self.schema.values()):
+            return
+        applied = set(applied_versions(db.engine))
+        schema = {feature: version in applied for feature, version in SCHEMA_FEATURES.items()}
+        if schema != self.schema:
+            pending = [feature for feature, ready in schema.items() if not ready]
+            if pending:
+                logger.warning(f"Conversation writer skipping {pending} until migrations are applied "
+                               f"(python migrate.py upgrade)")
+            else:
+                logger.info("Conversation writer: all migrations applied")
+        self.schema = schema
+
+    def _write_batch(self, rows: List[Dict]):
+        """
+        One multi-row INSERT (canned replies stored as template references) plus
+        upserted chat report counters and rollups, in one transaction. Steps whose
+        migration is still pending are skipped (see SCHEMA_FEATURES).
+        """
+        self._refresh_schema()
+        db.session.execute(insert(Conversation), compact_rows(rows) if self.schema["templates"] else rows)
+
+        # Aggregate the batch per (user_id, channel) so each report is one upsert row
+        counts = {}
+        for row in rows:
+            count = counts.setdefault((row["user_id"], row["channel"]), {
+                "messages": 0, "last_interaction": row["created_at"], "intents": Counter()
+            })
+            count["messages"] += 1
+            count["last_interaction"] = max(count["last_interaction"], row["created_at"])
+            count["intents"][row["intent"]] += 1
+        # All-time unique users are the ones new to chat_reports, so look before upserting
+        all_time_users = first_seen_users(rows) if self.schema["rollups"] else None
+        upsert_chat_report_counts(counts, keyed=self.schema["report_key"])
+        if self.schema["rollups"]:
+            update_rollups(rows, all_time_users=all_time_users)
+
+        db.session.commit()
+
+    def flush_rows(self, rows: List[Dict]) -> bool:
+        """Write rows, spilling them to disk if the database write fails"""
+        if not rows:
+            return True
+        start = time.perf_counter()
+        try:
+            with self.app.app_context():
+                self._write_batch(rows)
+        except Exception as e:
+            self.stats_counters["write_failures"] += 1
+            logger.error(f"Error writing {len(rows)} conversations, spilling to disk: {e}")
+            try:
+                with self.app.app_context():
+                    db.session.rollback()
+            except Exception:
+                pass
+            self._spill(rows)
+            return False
+
+        self.stats_counters["written"] += len(rows)
+        self.stats_counters["batches"] += 1
+        self.stats_counters["last_batch_seconds"] = round(time.perf_counter() - start, 4)
+        return True
+
+    def _spill(self, rows: List[Dict]):
+        """Append rows to today's spill file"""
+        path = os.path.join(self.spill_dir, f"conversations-{datetime.now().strftime('%Y%m%d')}.jsonl")
+        try:
+            with self._spill_lock:
+                os.makedirs(self.spill_dir, exist_ok=True)
+                with open(path, "a", encoding="utf-8") as f:
+                    for row in rows:
+                        f.write(json.dumps({**row, "created_at": row["created_at"].isoformat()},
+                                           ensure_ascii=False) + "\n")
+            self.stats_counters["spilled"] += len(rows)
+        except Exception as e:
+            logger.error(f"Error spilling {len(rows)} conversations to {path}, rows lost: {e}")
+
+    def _claim_spill(self) -> List[str]:
+        """
+        Rename spill files to <file>.<pid>-<token>.replaying so only this process
+        replays them; a file another worker claimed first is skipped. Files left
+        claimed by this process or by one that no longer exists (a crash
+        mid-replay) are claimed again.
+        """
+        claimed = []
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, "conversations-*.replaying"))):
+            match = CLAIM_PATTERN.search(path)
+            pid = int(match.group(1)) if match else None
+            if pid == os.getpid():
+                claimed.append(path)
+                continue
+            if pid is not None and _process_alive(pid):
+                continue
+            target = self._claim_name(path[:match.start()] if match else path[:-len(".replaying")])
+            try:
+                os.replace(path, target)
+                claimed.append(target)
+            except FileNotFoundError:
+                pass  # Another worker reclaimed it first
+        for path in sorted(glob.glob(os.path.join(self.spill_dir, "conversations-*.jsonl"))):
+            target = self._claim_name(path)
+            try:
+                with self._spill_lock:
+                    os.replace(path, target)
+                claimed.append(target)
+            except FileNotFoundError:
+                pass  # Another worker is replaying it
+        return claimed
+
+    @staticmethod
+    def _claim_name(path: str) -> str:
+        return f"{path}.{os.getpid()}-{uuid.uuid4().hex[:8]}.replaying"
+
+    def _read_spill(self, path: str) -> List[Dict]:
+        """Rows of a claimed spill file; unreadable lines are moved to a corrupt-*.jsonl file"""
+        rows, corrupt = [], []
+        with open(path, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                    row["created_at"] = datetime.fromisoformat(row["created_at"])
+                    rows.append(row)
+                except (ValueError, TypeError, KeyError):
+                    corrupt.append(line if line.endswith("\n") else line + "\n")
+        if corrupt:
+            quarantine = os.path.join(self.spill_dir, f"corrupt-{datetime.now().strftime('%Y%m%d')}.jsonl")
+            with open(quarantine, "a", encoding="utf-8") as f:
+                f.writelines(corrupt)
+            logger.error(f"Moved {len(corrupt)} unreadable spilled lines from {path} to {quarantine}")
+        return rows
+
+    def replay_spill(self) -> int:
+        """Write spilled rows back to the database; returns how many were replayed"""
+        replayed = 0
+        for replaying in self._claim_spill():
+            rows = self._read_spill(replaying)
+
+            for i in range(0, len(rows), self.batch_size):
+                if not self.flush_rows(rows[i:i + self.batch_size]):
+                    # Failed batch was re-spilled; requeue the rest and retry later
+                    self._spill(rows[i + self.batch_size:])
+                    os.remove(replaying)
+                    return replayed
+                replayed += len(rows[i:i + self.batch_size])
+            os.remove(replaying)
+
+        if replayed:
+            self.stats_counters["replayed"] += replayed
+            logger.info(f"Replayed {replayed} spilled conversations")
+        return replayed
+
+    def _has_spill(self) -> bool:
+        return bool(glob.glob(os.path.join(self.spill_dir, "conversations-*.jsonl")) or
+                    glob.glob(os.path.join(self.spill_dir, "conversations-*.replaying")))
+
+    def _prune(self):
+        try:
+            with self.app.app_context():
+                deleted = prune_rollup_users()
+            if deleted:
+                logger.info(f"Pruned {deleted} rollup user rows from closed buckets")
+        except Exception as e:
+            logger.error(f"Error pruning rollup users: {e}")
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                rows = self._drain()
+                if rows and self.flush_rows(rows) and self._has_spill():
+                    self.replay_spill()
+                if self.schema["rollups"] and time.monotonic() - self._last_prune >= ROLLUP_PRUNE_INTERVAL:
+                    self._last_prune = time.monotonic()
+                    self._prune()
+            except Exception as e:
+                # Keep the thread alive: a claimed spill file is retried on the next replay
+                logger.error(f"Error in conversation writer loop: {e}", exc_info=True)
+                self._stop.wait(1)
+
+    def start(self):
+        """Start the writer thread, replaying anything spilled by a previous run"""
+        if self._thread is not None:
+            return
+        if self._has_spill():
+            try:
+                self.replay_spill()
+            except Exception as e:
+                logger.error(f"Error replaying spilled conversations at startup: {e}", exc_info=True)
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="conversation-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the writer and flush every queued row (to disk if the database is down)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+            self._thread = None
+        rows = []
+        while True:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        for i in range(0, len(rows), self.batch_size):
+            self.flush_rows(rows[i:i + self.batch_size])
+
+    def stats(self) -> Dict:
+        """Queue depth and write counters for monitoring"""
+        return {
+            **self.stats_counters,
+            "queue_depth": self._queue.qsize(),
+            "max_queue": self._queue.maxsize,
+            "skipped_steps": [feature for feature, ready in self.schema.items() if not ready],
+            "running": self._thread is not None and self._thread.is_alive()
+        }
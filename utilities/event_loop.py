@@ -0,0 +1,134 @@
+"""
+One long-lived asyncio event loop per process
+The loop runs in a dedicated thread and only does network I/O (OpenAI requests,
+Meta API sends): synchronous Flask routes and Socket.IO handlers build replies in
+their own thread (classifier, contexts, database) and hand the loop just those
+coroutines with run_coroutine_threadsafe, waiting a bounded time for the result.
+Nothing blocking may run on the loop, as every request in the process shares it.
+State tied to the loop, such as the shared aiohttp session (pooled keep-alive
+connections), lives as long as the process.
+"""
+import asyncio
+import concurrent.futures
+import threading
+from typing import Coroutine, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class EventLoopWorker:
+    """Asyncio loop in a background thread; coroutines run inside an app context"""
+
+    def __init__(self, app, request_timeout: float = 30, shutdown_timeout: float = 5):
+        self.app = app
+        self.request_timeout = request_timeout
+        self.shutdown_timeout = shutdown_timeout
+        self._loop = None
+        self._thread = None
+        self._session = None
+        self._lock = threading.Lock()
+        self.stats_counters = {
+            "submitted": 0, "completed": 0, "failed": 0, "timeouts": 0, "in_flight": 0
+        }
+
+    def start(self):
+        """Start the loop thread (again in a forked child, where the parent's thread does not exist)"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._loop = asyncio.new_event_loop()
+            self._session = None
+            ready = threading.Event()
+            self._thread = threading.Thread(target=self._run, args=(ready,), name="event-loop", daemon=True)
+            self._thread.start()
+            ready.wait()
+
+    def _run(self, ready: threading.Event):
+        asyncio.set_event_loop(self._loop)
+        self._loop.call_soon(ready.set)
+        self._loop.run_forever()
+
+    async def _with_app_context(self, coro: Coroutine):
+        with self.app.app_context():
+            return await coro
+
+    def _done(self, future: concurrent.futures.Future):
+        with self._lock:
+            self.stats_counters["in_flight"] -= 1
+            if future.cancelled():
+                return
+            if future.exception() is not None:
+                self.stats_counters["failed"] += 1
+            else:
+                self.stats_counters["completed"] += 1
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Schedule coro on the loop and return its future without waiting"""
+        if self._thread is None or not self._thread.is_alive():
+            self.start()
+        if threading.current_thread() is self._thread:
+            coro.close()
+            raise RuntimeError("EventLoopWorker.submit called from the loop thread; await the coroutine instead")
+        with self._lock:
+            self.stats_counters["submitted"] += 1
+            self.stats_counters["in_flight"] += 1
+        future = asyncio.run_coroutine_threadsafe(self._with_app_context(coro), self._loop)
+        future.add_done_callback(self._done)
+        return future
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None):
+        """
+        Run coro on the loop and return its result, waiting at most timeout seconds
+        (request_timeout by default); on timeout the coroutine is cancelled and
+        TimeoutError is raised
+        """
+        timeout = self.request_timeout if timeout is None else timeout
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            with self._lock:
+                self.stats_counters["timeouts"] += 1
+            raise TimeoutError(f"Coroutine did not finish within {timeout}s")
+
+    async def http_session(self):
+        """aiohttp session shared by every coroutine on the loop (created on first use)"""
+        if self._session is None or self._session.closed:
+            import aiohttp
+            self._session = aiohttp.ClientSession()
+        return self._session
+
+    def stop(self):
+        """Let in-flight coroutines finish (up to shutdown_timeout), close the session and the loop"""
+        if self._thread is None or not self._thread.is_alive():
+            return
+        loop = self._loop
+
+        async def drain():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            if tasks:
+                await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+                for task in tasks:
+                    task.cancel()
+            if self._session is not None and not self._session.closed:
+                await self._session.close()
+
+        try:
+            asyncio.run_coroutine_threadsafe(drain(), loop).result(self.shutdown_timeout + 5)
+        except Exception as e:
+            logger.error(f"Error draining event loop: {e}")
+        loop.call_soon_threadsafe(loop.stop)
+        self._thread.join(timeout=10)
+        self._thread = None
+        if not loop.is_running():
+            loop.close()
+
+    def stats(self) -> Dict:
+        """Coroutine counters for monitoring"""
+        with self._lock:
+            return {
+                **self.stats_counters,
+                "running": self._thread is not None and self._thread.is_alive()
+            }
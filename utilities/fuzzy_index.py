@@ -0,0 +1,101 @@
+"""
+Typo-tolerant vocabulary lookup for the GPS Control classifier
+Character-trigram index that proposes candidate words fast, re-ranked with a bounded edit distance
+"""
+from typing import Dict, Iterable, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tokens shorter than this are too ambiguous to correct ("de" -> "da", "gps" -> "gas")
+MIN_WORD_LENGTH = 4
+
+
+def char_trigrams(word: str) -> set:
+    """Padded character trigrams, so word starts and ends weigh in"""
+    padded = f"  {word} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def max_edits_for(word: str) -> int:
+    """Allowed edit distance for a token of this length"""
+    return 1 if len(word) < 8 else 2
+
+
+def edit_distance(a: str, b: str, max_distance: int) -> int:
+    """
+    Levenshtein distance between a and b, returning max_distance + 1 as soon as
+    the distance is known to exceed max_distance
+    """
+    if abs(len(a) - len(b)) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return min(previous[-1], max_distance + 1)
+
+
+class TrigramIndex:
+    """Maps misspelled tokens to the closest known vocabulary word"""
+
+    def __init__(self, words: Iterable[str], candidates: int = 8):
+        self.words = sorted({word for word in words if len(word) >= MIN_WORD_LENGTH and " " not in word})
+        self.known = set(self.words)
+        self.candidates = candidates
+        self.word_trigrams = [char_trigrams(word) for word in self.words]
+        self.postings = {}  # trigram -> word ids
+        for word_id, trigrams in enumerate(self.word_trigrams):
+            for trigram in trigrams:
+                self.postings.setdefault(trigram, []).append(word_id)
+
+    def __len__(self) -> int:
+        return len(self.words)
+
+    def candidates_for(self, token: str) -> List[Tuple[str, float]]:
+        """Top words sharing the most trigrams with token, scored by Dice coefficient"""
+        trigrams = char_trigrams(token)
+        shared = {}
+        for trigram in trigrams:
+            for word_id in self.postings.get(trigram, ()):
+                shared[word_id] = shared.get(word_id, 0) + 1
+
+        scored = [
+            (word_id, 2.0 * count / (len(trigrams) + len(self.word_trigrams[word_id])))
+            for word_id, count in shared.items()
+        ]
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        return [(self.words[word_id], score) for word_id, score in scored[:self.candidates]]
+
+    def correct(self, token: str) -> Optional[str]:
+        """Closest vocabulary word within the allowed edit distance, or None"""
+        if len(token) < MIN_WORD_LENGTH or token in self.known or token.isdigit():
+            return None
+
+        max_distance = max_edits_for(token)
+        best_word, best_distance = None, max_distance + 1
+        for word, _ in self.candidates_for(token):
+            distance = edit_distance(token, word, max_distance)
+            if distance < best_distance:
+                best_word, best_distance = word, distance
+        return best_word
+
+    def correct_text(self, normalized_text: str) -> Tuple[str, Dict[str, str]]:
+        """Replace unknown tokens with their closest vocabulary word"""
+        corrections = {}
+        tokens = normalized_text.split()
+        for i, token in enumerate(tokens):
+            replacement = self.correct(token)
+            if replacement is not None:
+                corrections[token] = replacement
+                tokens[i] = replacement
+        return " ".join(tokens), corrections
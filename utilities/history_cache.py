@@ -0,0 +1,327 @@
+"""
+Ring cache of each user's latest exchanges, for the OpenAI prompt
+save_conversation appends every exchange to a bounded per-(user_id, channel)
+ring, so building a prompt needs no conversations query. Rules:
+- A ring started by an append only holds exchanges saved since; it is partial
+  until the first read fills in older exchanges from the database (once)
+- Fills merge stored exchanges into the ring, so they never drop or reorder an
+  append; an exchange is in both when message and response match and the
+  timestamps are within SAME_EXCHANGE_TOLERANCE (the database may round them)
+- Rings expire after ttl seconds without an append (and the memory backend
+  evicts the least recently active past max_entries); the next read reloads
+- Shared backends (sqlite or redis, the same as CONTEXT_BACKEND, where append
+  and fill are atomic) see every worker's appends, so a filled ring stays
+  complete. A memory ring only sees this process's appends: it serves reads
+  for refresh seconds after a fill, then the next read fills it again, so an
+  exchange another worker handled reaches the prompt within refresh seconds
+  (refresh 0 merges with the database on every read)
+"""
+from abc import ABC, abstractmethod
+import json
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, List, Tuple
+import logging
+
+from utilities.context_backends import HistoryEntry, ProcessLocalSQLite
+from utilities.context_store import ContextStore
+
+logger = logging.getLogger(__name__)
+
+# Seconds a ring entry and its stored row may differ by: MySQL rounds fractional seconds
+SAME_EXCHANGE_TOLERANCE = 1.0
+
+
+def same_exchange(a: HistoryEntry, b: HistoryEntry) -> bool:
+    return (a.message == b.message and a.response == b.response
+            and abs(a.timestamp - b.timestamp) <= SAME_EXCHANGE_TOLERANCE)
+
+
+def merge_exchanges(stored: List[HistoryEntry], ring: List[HistoryEntry]) -> List[HistoryEntry]:
+    """Ring entries plus the stored exchanges not already in the ring, oldest first"""
+    missing = [entry for entry in stored if not any(same_exchange(entry, other) for other in ring)]
+    return sorted(missing + list(ring), key=lambda entry: entry.timestamp)
+
+
+class HistoryCache(ABC):
+    """Where rings live; get/append/fill are each a single call (one round trip)"""
+
+    name = "base"
+    # Whether every worker's appends reach this cache (rings can then be complete)
+    shared = True
+
+    def __init__(self, size: int = 3, ttl: float = 1800):
+        self.size = size
+        self.ttl = ttl
+        self.counters = {"hits": 0, "fills": 0, "appends": 0}
+        self._sweeper = None
+        self._sweeper_stop = threading.Event()
+
+    @abstractmethod
+    def get(self, user_id: str, channel: str) -> Tuple[List[HistoryEntry], bool]:
+        """Ring entries oldest first, and whether older exchanges are already filled in"""
+
+    @abstractmethod
+    def append(self, user_id: str, channel: str, entry: HistoryEntry):
+        """Add the newest exchange, dropping the oldest past size"""
+
+    @abstractmethod
+    def fill(self, user_id: str, channel: str, older: List[HistoryEntry]):
+        """Put stored exchanges missing from the ring (oldest first) in front of it and mark it filled"""
+
+    def sweep(self) -> int:
+        """Drop expired rings; returns how many were removed"""
+        return 0
+
+    def start_sweeper(self, interval: float = 60):
+        """Call sweep() every interval seconds in a background thread"""
+        if interval <= 0 or self._sweeper is not None:
+            return
+
+        def run():
+            while not self._sweeper_stop.wait(interval):
+                try:
+                    self.sweep()
+                except Exception as e:
+                    logger.error(f"Error sweeping history rings: {e}")
+
+        self._sweeper_stop.clear()
+        self._sweeper = threading.Thread(target=run, name="history-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def recent(self, user_id: str, channel: str, load_older: Callable) -> List[HistoryEntry]:
+        """
+        Latest exchanges oldest first. A partial ring is filled from
+        load_older(user_id, channel, before, limit), which returns database
+        exchanges at or before `before` (None: the latest), oldest first.
+        """
+        entries, complete = self.get(user_id, channel)
+        if complete:
+            self.counters["hits"] += 1
+            return entries[-self.size:]
+
+        # A memory ring misses other workers' exchanges, so it is refilled from the latest rows
+        oldest = entries[0] if entries and self.shared else None
+        stored = load_older(user_id, channel, oldest.timestamp if oldest else None, self.size + len(entries))
+        older = [entry for entry in stored if not any(same_exchange(entry, other) for other in entries)]
+        self.fill(user_id, channel, older)
+        self.counters["fills"] += 1
+        return merge_exchanges(older, entries)[-self.size:]
+
+    def stats(self) -> Dict:
+        return {"backend": self.name, "size": self.size, "ttl": self.ttl, **self.counters}
+
+
+class MemoryRing(deque):
+    """Latest exchanges of one user and channel, and when they were last filled from the database"""
+    __slots__ = ("filled_at",)
+
+    def __init__(self, size: int):
+        super().__init__(maxlen=size)
+        self.filled_at = None
+
+
+class MemoryHistoryCache(HistoryCache):
+    """
+    Rings in this process only: bounded LRU with TTL expiry. A fill is trusted
+    for refresh seconds (other workers' exchanges are not appended here).
+    """
+
+    name = "memory"
+    shared = False
+
+    def __init__(self, size: int = 3, ttl: float = 1800, max_entries: int = 10000, refresh: float = 60):
+        super().__init__(size, ttl)
+        self.refresh = refresh
+        self.store = ContextStore(max_entries=max_entries, ttl=ttl)
+
+    def get(self, user_id: str, channel: str) -> Tuple[List[HistoryEntry], bool]:
+        ring = self.store.get((user_id, channel))
+        if ring is None:
+            return [], False
+        fresh = ring.filled_at is not None and time.monotonic() - ring.filled_at < self.refresh
+        return list(ring), fresh
+
+    def _ring(self, user_id: str, channel: str) -> MemoryRing:
+        key = (user_id, channel)
+        ring = self.store.get(key)
+        if ring is None:
+            ring = MemoryRing(self.size)
+            self.store[key] = ring
+        return ring
+
+    def append(self, user_id: str, channel: str, entry: HistoryEntry):
+        self._ring(user_id, channel).append(entry)
+        self.store.touch((user_id, channel))
+        self.counters["appends"] += 1
+
+    def fill(self, user_id: str, channel: str, older: List[HistoryEntry]):
+        """Merge the latest stored exchanges into the ring (appends made meanwhile are kept)"""
+        ring = self._ring(user_id, channel)
+        merged = merge_exchanges(older, list(ring))
+        ring.clear()
+        ring.extend(merged)
+        ring.filled_at = time.monotonic()
+
+    def sweep(self) -> int:
+        return self.store.sweep()
+
+    def stats(self) -> Dict:
+        return {**super().stats(), "refresh": self.refresh, "rings": len(self.store),
+                "evictions": self.store.evictions, "expirations": self.store.expirations}
+
+
+def _encode(entries: List[HistoryEntry]) -> str:
+    return json.dumps([list(entry) for entry in entries], ensure_ascii=False)
+
+
+def _decode(raw) -> List[HistoryEntry]:
+    raw = raw.decode("utf-8") if isinstance(raw, bytes) else raw
+    return [HistoryEntry(*entry) for entry in json.loads(raw)] if raw else []
+
+
+class SQLiteHistoryCache(ProcessLocalSQLite, HistoryCache):
+    """Rings in a SQLite file shared by every worker on the host (one row per ring)"""
+
+    name = "sqlite"
+    schema = (
+        """
+        CREATE TABLE IF NOT EXISTS history_rings (
+            user_id TEXT NOT NULL,
+            channel TEXT NOT NULL,
+            entries TEXT,
+            complete INTEGER NOT NULL DEFAULT 0,
+            last_activity REAL NOT NULL,
+            PRIMARY KEY (user_id, channel)
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_history_rings_last_activity ON history_rings (last_activity)"
+    )
+
+    def __init__(self, path: str, size: int = 3, ttl: float = 1800):
+        super().__init__(size, ttl)
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _select(self, user_id: str, channel: str):
+        return self._conn.execute(
+            "SELECT entries, complete FROM history_rings WHERE user_id = ? AND channel = ? AND last_activity >= ?",
+            (user_id, channel, time.time() - self.ttl)
+        ).fetchone()
+
+    def _modify(self, user_id: str, channel: str, change, touch: bool):
+        """Read, change (entries, complete) and write one ring inside a single write transaction"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._select(user_id, channel)
+                entries, complete = change(_decode(row[0]) if row else [], bool(row[1]) if row else False)
+                if row and not touch:
+                    self._conn.execute(
+                        "UPDATE history_rings SET entries = ?, complete = ? WHERE user_id = ? AND channel = ?",
+                        (_encode(entries), int(complete), user_id, channel)
+                    )
+                else:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO history_rings (user_id, channel, entries, complete, last_activity) "
+                        "VALUES (?, ?, ?, ?, ?)", (user_id, channel, _encode(entries), int(complete), time.time())
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get(self, user_id: str, channel: str) -> Tuple[List[HistoryEntry], bool]:
+        with self._lock:
+            row = self._select(user_id, channel)
+        return (_decode(row[0]), bool(row[1])) if row else ([], False)
+
+    def append(self, user_id: str, channel: str, entry: HistoryEntry):
+        self._modify(user_id, channel, lambda entries, complete: ((entries + [entry])[-self.size:], complete), True)
+        self.counters["appends"] += 1
+
+    def fill(self, user_id: str, channel: str, older: List[HistoryEntry]):
+        def change(entries, complete):
+            return (entries, True) if complete else ((older + entries)[-self.size:], True)
+        self._modify(user_id, channel, change, False)
+
+    def sweep(self) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM history_rings WHERE last_activity < ?", (time.time() - self.ttl,)
+            ).rowcount
+
+
+class RedisHistoryCache(HistoryCache):
+    """
+    Rings as capped Redis lists (RPUSH + LTRIM) plus a filled flag, both expiring
+    via TTL. Fills are optimistic (WATCH on the flag), so two workers filling the
+    same ring cannot both prepend.
+    """
+
+    name = "redis"
+
+    def __init__(self, client, size: int = 3, ttl: float = 1800, prefix: str = "gps:hist"):
+        super().__init__(size, ttl)
+        self.client = client
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisHistoryCache":
+        import redis  # optional dependency, only needed for CONTEXT_BACKEND=redis
+        return cls(redis.Redis.from_url(url, decode_responses=True), **kwargs)
+
+    def _keys(self, user_id: str, channel: str) -> Tuple[str, str]:
+        base = f"{self.prefix}:{channel}:{user_id}"
+        return base, f"{base}:filled"
+
+    def get(self, user_id: str, channel: str) -> Tuple[List[HistoryEntry], bool]:
+        key, filled_key = self._keys(user_id, channel)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.lrange(key, 0, -1)
+        pipe.get(filled_key)
+        entries, filled = pipe.execute()
+        return [HistoryEntry(*json.loads(raw)) for raw in entries], bool(filled)
+
+    def append(self, user_id: str, channel: str, entry: HistoryEntry):
+        key, filled_key = self._keys(user_id, channel)
+        pipe = self.client.pipeline(transaction=True)
+        pipe.rpush(key, json.dumps(list(entry), ensure_ascii=False))
+        pipe.ltrim(key, -self.size, -1)
+        for name in (key, filled_key):
+            pipe.expire(name, max(1, int(self.ttl)))
+        pipe.execute()
+        self.counters["appends"] += 1
+
+    def fill(self, user_id: str, channel: str, older: List[HistoryEntry]):
+        import redis
+        key, filled_key = self._keys(user_id, channel)
+        with self.client.pipeline(transaction=True) as pipe:
+            try:
+                pipe.watch(filled_key)
+                if pipe.get(filled_key):
+                    return
+                pipe.multi()
+                if older:
+                    # LPUSH puts each value at the head, so push newest first to keep the oldest in front
+                    pipe.lpush(key, *(json.dumps(list(entry), ensure_ascii=False) for entry in reversed(older)))
+                    pipe.ltrim(key, -self.size, -1)
+                pipe.set(filled_key, 1, ex=max(1, int(self.ttl)))
+                pipe.expire(key, max(1, int(self.ttl)))
+                pipe.execute()
+            except redis.WatchError:
+                pass  # Another worker filled it first
+
+
+def create_history_cache(config: Dict) -> HistoryCache:
+    """Cache next to the contexts: CONTEXT_CONFIG['backend'] (memory, sqlite or redis)"""
+    backend = config.get('backend', 'memory')
+    common = {"size": config['history_cache_size'], "ttl": config['context_timeout']}
+
+    if backend == "sqlite":
+        return SQLiteHistoryCache(config['sqlite_path'], **common)
+    if backend == "redis":
+        return RedisHistoryCache.from_url(config['redis_url'], **common)
+    return MemoryHistoryCache(max_entries=config['max_active_contexts'], refresh=config['history_cache_refresh'],
+                              **common)
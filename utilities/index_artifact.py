@@ -0,0 +1,316 @@
+"""
+Prebuilt TF-IDF index artifact for the GPS Control classifier
+Compiles the dataset into versioned .npy buffers that workers memory-map instead of refitting
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import logging
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+logger = logging.getLogger(__name__)
+
+# Bump when the on-disk layout changes so old artifacts are ignored
+ARTIFACT_FORMAT = 2
+
+DEFAULT_INDEX_DIR = Path(
+    os.getenv("CLASSIFIER_INDEX_DIR", Path(__file__).parent / "classifier_index")
+)
+
+# Precision kept when ranking, so summation order cannot reorder tied rows
+SCORE_DECIMALS = 12
+
+# Same tokenizer TfidfVectorizer uses by default
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+
+def fit_fingerprint(input_texts: List[str], fit_config: Dict) -> str:
+    """
+    Hash of the texts the index is fit on plus the fit configuration.
+    Answer-only dataset edits keep the same fingerprint, so they never force a refit.
+    """
+    digest = hashlib.sha256()
+    digest.update(f"format={ARTIFACT_FORMAT};".encode("utf-8"))
+    digest.update(json.dumps(fit_config, sort_keys=True).encode("utf-8"))
+    for text in input_texts:
+        digest.update(text.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class InvertedIndex:
+    """
+    Term -> posting list (document rows and weights) view of the TF-IDF matrix.
+    Scoring touches only the postings of the query terms, so its cost follows the
+    message length and term rarity instead of the number of dataset rows.
+    """
+
+    def __init__(self, indptr: np.ndarray, doc_ids: np.ndarray, weights: np.ndarray,
+                 row_norms: np.ndarray):
+        self.indptr = indptr
+        self.doc_ids = doc_ids
+        self.weights = weights
+        self.row_norms = row_norms
+
+    @classmethod
+    def from_matrix(cls, matrix: csr_matrix) -> "InvertedIndex":
+        """Build posting lists (CSC layout) and row norms from a document matrix"""
+        postings = matrix.tocsc()
+        postings.sort_indices()
+        row_norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        return cls(
+            postings.indptr.astype(np.int64),
+            postings.indices.astype(np.int32),
+            postings.data.astype(np.float64),
+            row_norms.astype(np.float64)
+        )
+
+    def top_k(self, cols: np.ndarray, weights: np.ndarray, k: int) -> List[Tuple[int, float]]:
+        """Return up to k (row, cosine score) pairs, best first, ties by lowest row"""
+        if not len(cols) or k <= 0:
+            return []
+
+        starts, ends = self.indptr[cols], self.indptr[cols + 1]
+        doc_ids = np.concatenate([self.doc_ids[s:e] for s, e in zip(starts, ends)])
+        if not len(doc_ids):
+            return []
+        contributions = np.concatenate([
+            self.weights[s:e] * w for s, e, w in zip(starts, ends, weights)
+        ])
+
+        # Accumulate per candidate row; only rows sharing a term with the query appear
+        rows, inverse = np.unique(doc_ids, return_inverse=True)
+        scores = np.bincount(inverse, weights=contributions) / self.row_norms[rows]
+        # Drop float accumulation noise so equal scores tie-break by row like argmax
+        scores = np.round(scores, SCORE_DECIMALS)
+
+        if k < len(rows):
+            cutoff = np.partition(scores, len(scores) - k)[len(scores) - k]
+            keep = np.flatnonzero(scores >= cutoff)
+            rows, scores = rows[keep], scores[keep]
+        order = np.lexsort((rows, -scores))[:k]
+        return [(int(rows[i]), float(scores[i])) for i in order]
+
+
+class TfidfIndex:
+    """
+    Fitted TF-IDF vocabulary, IDF weights and L2-normalized document matrix.
+    Query vectorization mirrors TfidfVectorizer so sklearn is only needed to fit.
+    """
+
+    def __init__(self, vocabulary: List[str], idf: np.ndarray, matrix: csr_matrix,
+                 fingerprint: str, fit_config: Dict,
+                 postings: Optional[InvertedIndex] = None):
+        self.terms = vocabulary
+        self.vocabulary = {term: col for col, term in enumerate(vocabulary)}
+        self.idf = idf
+        self.matrix = matrix
+        self.postings = postings if postings is not None else InvertedIndex.from_matrix(matrix)
+        self.fingerprint = fingerprint
+        self.fit_config = fit_config
+        self.lowercase = fit_config.get("lowercase", True)
+        self.ngram_range = tuple(fit_config.get("ngram_range", (1, 1)))
+
+    @property
+    def version(self) -> str:
+        """Short dataset version identifier"""
+        return self.fingerprint[:12]
+
+    @property
+    def n_features(self) -> int:
+        return len(self.terms)
+
+    @property
+    def nbytes(self) -> int:
+        """Size of the numeric index buffers (matrix, postings, IDF)"""
+        arrays = (
+            self.idf, self.matrix.data, self.matrix.indices, self.matrix.indptr,
+            self.postings.indptr, self.postings.doc_ids, self.postings.weights,
+            self.postings.row_norms
+        )
+        return int(sum(array.nbytes for array in arrays))
+
+    def analyze(self, text: str) -> List[str]:
+        """Split text into word n-grams exactly like TfidfVectorizer"""
+        if self.lowercase:
+            text = text.lower()
+        tokens = TOKEN_PATTERN.findall(text)
+        min_n, max_n = self.ngram_range
+        if max_n == 1:
+            return tokens
+
+        terms = list(tokens) if min_n == 1 else []
+        for n in range(max(min_n, 2), min(max_n, len(tokens)) + 1):
+            for i in range(len(tokens) - n + 1):
+                terms.append(" ".join(tokens[i:i + n]))
+        return terms
+
+    def transform(self, text: str) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (columns, weights) of the L2-normalized TF-IDF query vector"""
+        counts = {}
+        for term in self.analyze(text):
+            col = self.vocabulary.get(term)
+            if col is not None:
+                counts[col] = counts.get(col, 0) + 1
+
+        if not counts:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.float64)
+
+        cols = np.fromiter(counts.keys(), dtype=np.int32, count=len(counts))
+        weights = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+        weights *= self.idf[cols]
+        weights /= np.linalg.norm(weights)
+        return cols, weights
+
+    def top_k(self, text: str, k: int = 5) -> List[Tuple[int, float]]:
+        """Ranked (row, cosine score) candidates from the inverted index"""
+        cols, weights = self.transform(text)
+        return self.postings.top_k(cols, weights, k)
+
+    def similarities(self, text: str) -> np.ndarray:
+        """Cosine similarity of text against every indexed row (linear reference scan)"""
+        cols, weights = self.transform(text)
+        if not len(cols):
+            return np.zeros(self.matrix.shape[0])
+        query = np.zeros(self.n_features)
+        query[cols] = weights
+        return self.matrix.dot(query)
+
+    def transform_batch(self, texts: List[str]) -> csr_matrix:
+        """Vectorize several texts into one CSR query matrix"""
+        data, indices, indptr = [], [], [0]
+        for text in texts:
+            cols, weights = self.transform(text)
+            indices.append(cols)
+            data.append(weights)
+            indptr.append(indptr[-1] + len(cols))
+
+        if not texts:
+            return csr_matrix((0, self.n_features))
+        return csr_matrix(
+            (np.concatenate(data), np.concatenate(indices), np.array(indptr, dtype=np.int64)),
+            shape=(len(texts), self.n_features)
+        )
+
+    def similarities_batch(self, texts: List[str]) -> csr_matrix:
+        """Cosine similarities of several texts against every row, in one sparse product"""
+        return self.transform_batch(texts).dot(self.matrix.T).tocsr()
+
+    @classmethod
+    def fit(cls, texts: List[str], fingerprint: str, fit_config: Dict) -> "TfidfIndex":
+        """Fit a new index with sklearn (imported here so loading never needs it)"""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        vectorizer = TfidfVectorizer(
+            lowercase=fit_config.get("lowercase", True),
+            stop_words=None,  # Keep Spanish stop words
+            max_features=fit_config.get("max_features"),
+            ngram_range=tuple(fit_config.get("ngram_range", (1, 1)))
+        )
+        matrix = vectorizer.fit_transform(texts).tocsr()
+        matrix.sort_indices()
+
+        terms = [None] * len(vectorizer.vocabulary_)
+        for term, col in vectorizer.vocabulary_.items():
+            terms[col] = term
+
+        return cls(terms, vectorizer.idf_.astype(np.float64), matrix, fingerprint, fit_config)
+
+    def save(self, index_dir: Path, prefix: str) -> Path:
+        """Write the artifact atomically to index_dir/<prefix>-<format>-<fingerprint>"""
+        index_dir = Path(index_dir)
+        index_dir.mkdir(parents=True, exist_ok=True)
+        target = artifact_path(index_dir, self.fingerprint, prefix)
+        if (target / "meta.json").exists():
+            return target
+
+        tmp_dir = Path(tempfile.mkdtemp(prefix=".build-", dir=index_dir))
+        try:
+            np.save(tmp_dir / "vocabulary.npy", np.array(self.terms, dtype=str))
+            np.save(tmp_dir / "idf.npy", self.idf)
+            np.save(tmp_dir / "matrix_data.npy", self.matrix.data.astype(np.float64))
+            np.save(tmp_dir / "matrix_indices.npy", self.matrix.indices.astype(np.int32))
+            np.save(tmp_dir / "matrix_indptr.npy", self.matrix.indptr.astype(np.int64))
+            np.save(tmp_dir / "postings_indptr.npy", self.postings.indptr)
+            np.save(tmp_dir / "postings_docs.npy", self.postings.doc_ids)
+            np.save(tmp_dir / "postings_weights.npy", self.postings.weights)
+            np.save(tmp_dir / "row_norms.npy", self.postings.row_norms)
+            meta = {
+                "format": ARTIFACT_FORMAT,
+                "fingerprint": self.fingerprint,
+                "fit_config": self.fit_config,
+                "shape": list(self.matrix.shape),
+                "nnz": int(self.matrix.nnz),
+                "built_at": time.time()
+            }
+            # meta.json is written last; its presence marks a complete artifact
+            with open(tmp_dir / "meta.json", "w", encoding="utf-8") as f:
+                json.dump(meta, f, indent=2)
+            os.rename(tmp_dir, target)
+        except OSError:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            if not (target / "meta.json").exists():
+                raise
+            # Another worker finished the same build first
+        _prune_stale_artifacts(index_dir, prefix, keep=target)
+        logger.info(f"Classifier index written to {target}")
+        return target
+
+    @classmethod
+    def load(cls, index_dir: Path, fingerprint: str, prefix: str) -> Optional["TfidfIndex"]:
+        """Memory-map a prebuilt artifact, or return None if missing or stale"""
+        path = artifact_path(Path(index_dir), fingerprint, prefix)
+        meta_path = path / "meta.json"
+        if not meta_path.exists():
+            return None
+
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("format") != ARTIFACT_FORMAT or meta.get("fingerprint") != fingerprint:
+                return None
+
+            vocabulary = np.load(path / "vocabulary.npy").tolist()
+            idf = np.load(path / "idf.npy", mmap_mode="r")
+            matrix = csr_matrix(
+                (
+                    np.load(path / "matrix_data.npy", mmap_mode="r"),
+                    np.load(path / "matrix_indices.npy", mmap_mode="r"),
+                    np.load(path / "matrix_indptr.npy", mmap_mode="r")
+                ),
+                shape=tuple(meta["shape"]),
+                copy=False
+            )
+            postings = InvertedIndex(
+                np.load(path / "postings_indptr.npy", mmap_mode="r"),
+                np.load(path / "postings_docs.npy", mmap_mode="r"),
+                np.load(path / "postings_weights.npy", mmap_mode="r"),
+                np.load(path / "row_norms.npy", mmap_mode="r")
+            )
+            return cls(vocabulary, idf, matrix, fingerprint, meta["fit_config"], postings)
+        except (OSError, ValueError, KeyError) as e:
+            # Removed so the refit that follows can write a readable one in its place
+            logger.warning(f"Removing unreadable classifier index at {path}: {e}")
+            shutil.rmtree(path, ignore_errors=True)
+            return None
+
+
+def artifact_path(index_dir: Path, fingerprint: str, prefix: str) -> Path:
+    """Directory holding the artifact for a given dataset fingerprint; prefix names the dataset"""
+    return Path(index_dir) / f"{prefix}-v{ARTIFACT_FORMAT}-{fingerprint[:16]}"
+
+
+def _prune_stale_artifacts(index_dir: Path, prefix: str, keep: Path):
+    """Remove artifacts built from older versions of the same dataset (other datasets' are kept)"""
+    stale = re.compile(rf"{re.escape(prefix)}-v\d+-[0-9a-f]+")
+    for path in index_dir.iterdir():
+        if path.is_dir() and path != keep and stale.fullmatch(path.name):
+            shutil.rmtree(path, ignore_errors=True)
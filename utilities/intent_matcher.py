@@ -0,0 +1,126 @@
+"""
+Single-pass intent matching for the GPS Control context manager
+One compiled trie automaton finds every keyword and every intent-pattern trigger
+in a message; only the patterns whose leading literal occurs are then counted
+"""
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Set, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Characters that end a pattern's leading literal
+REGEX_META = set(".^$*+?{}[]\\|()")
+
+
+def trie_regex(words: Iterable[str]) -> str:
+    """
+    Regex matching any of words, structured as a character trie so the regex
+    engine walks shared prefixes once; the longest word wins at each position
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def emit(node: Dict) -> str:
+        branches = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        return f"(?:{body})?" if "" in node else body
+
+    return emit(trie)
+
+
+def leading_literal(pattern: str) -> str:
+    """Literal text every match of pattern must start with ('' if none)"""
+    for pos, char in enumerate(pattern):
+        if char in REGEX_META:
+            # A quantifier makes the previous character optional
+            return pattern[:pos - 1] if char in "*?{" else pattern[:pos]
+    return pattern
+
+
+class LiteralScanner:
+    """Finds which of a fixed set of substrings occur in a text, in one regex pass"""
+
+    def __init__(self, words: Iterable[str]):
+        self.words = list(dict.fromkeys(word for word in words if word))
+        # Zero-width lookahead so overlapping occurrences are all visited
+        self.regex = re.compile("(?=(" + trie_regex(self.words) + "))") if self.words else None
+        # A longest match also proves every word that is a prefix of it
+        self.prefixes = {word: [other for other in self.words if word.startswith(other)] for word in self.words}
+
+    def scan(self, text: str) -> Set[str]:
+        found = set()
+        if self.regex is None:
+            return found
+        for match in self.regex.finditer(text):
+            found.update(self.prefixes[match.group(1)])
+        return found
+
+
+class IntentMatcher:
+    """
+    Scores INTENT_PATTERNS and GPS_CONTROL_KEYWORDS exactly like the original
+    per-intent loop (re.findall per pattern, keyword substring count), in one pass
+    """
+
+    def __init__(self, intent_patterns: Dict[str, List[str]], keywords: List[str]):
+        self.keyword_counts = Counter(keywords)  # list entries, so duplicates count twice as before
+        # (intent, number of patterns, pattern indexes into self.compiled)
+        self.intents = []
+        self.triggers = {}  # leading literal -> pattern indexes
+        self.untriggered = []  # patterns without a leading literal, always counted
+        self.compiled = []
+
+        for intent, patterns in intent_patterns.items():
+            indexes = []
+            for pattern in patterns:
+                index = len(self.compiled)
+                self.compiled.append(re.compile(pattern))
+                literal = leading_literal(pattern)
+                if literal:
+                    self.triggers.setdefault(literal, []).append(index)
+                else:
+                    self.untriggered.append(index)
+                indexes.append(index)
+            self.intents.append((intent, len(patterns), indexes))
+
+        self.scanner = LiteralScanner(list(self.keyword_counts) + list(self.triggers))
+
+    def get_intent(self, message_lower: str) -> Tuple[str, float]:
+        """Most likely intent and confidence for an already-lowercased message"""
+        found = self.scanner.scan(message_lower)
+
+        candidates = set(self.untriggered)
+        for literal in found:
+            candidates.update(self.triggers.get(literal, ()))
+        if not candidates:
+            return "general", 0.0
+
+        counts = {index: len(self.compiled[index].findall(message_lower)) for index in candidates}
+        keyword_matches = sum(self.keyword_counts.get(word, 0) for word in found)
+
+        best_intent = "general"
+        best_score = 0.0
+        for intent, n_patterns, indexes in self.intents:
+            score = 0
+            pattern_matches = 0
+            for index in indexes:
+                matches = counts.get(index, 0)
+                if matches > 0:
+                    pattern_matches += 1
+                    score += matches
+
+            if pattern_matches > 0:
+                confidence = min(0.9, (score + keyword_matches * 0.1) / n_patterns)
+                if confidence > best_score:
+                    best_score = confidence
+                    best_intent = intent
+
+        return best_intent, best_score
@@ -0,0 +1,123 @@
+"""
+Compact storage of canned bot replies
+A reply that is exactly a rendered dataset answer or a context template is stored
+as a response_templates reference (dataset entry id or template name plus the
+dataset version or template hash) instead of its text; free-form replies such as
+OpenAI answers are stored verbatim. Conversation.to_dict() rehydrates the text.
+"""
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Tuple
+import logging
+
+from sqlalchemy import func, select, text
+
+from model.models import Conversation, get_or_create_response_template
+from utilities.classifier import gps_classifier
+from utilities.context_manager import template_reference
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_response(response: Optional[str]) -> Optional[Tuple[str, str, str]]:
+    """(source, template key, version) reproducing response exactly, or None to store it verbatim"""
+    if not response:
+        return None
+    reference = gps_classifier.response_reference(response)
+    if reference is not None:
+        return ("dataset",) + reference
+    reference = template_reference(response)
+    if reference is not None:
+        return ("context",) + reference
+    return None
+
+
+def response_columns(response: Optional[str]) -> Dict:
+    """response / response_template_id values to store for a reply (needs an app context)"""
+    try:
+        reference = resolve_response(response)
+        if reference is not None:
+            return {"response": None, "response_template_id": get_or_create_response_template(*reference, response)}
+    except Exception as e:
+        logger.error(f"Error resolving response template, storing text: {e}")
+    return {"response": response, "response_template_id": None}
+
+
+def compact_rows(rows: List[Dict]) -> List[Dict]:
+    """Copies of conversation rows with canned replies replaced by template references"""
+    return [{**row, **response_columns(row["response"])} for row in rows]
+
+
+def backfill_response_templates(engine, batch_size: int = 1000, pause: float = 0.05) -> Dict:
+    """
+    Replace canned replies already stored as text with template references, in
+    short id-ordered UPDATE batches. Replies from older dataset versions no longer
+    match any template and stay verbatim. Needs an app context.
+    """
+    table = Conversation.__table__
+    counts = {"scanned": 0, "compacted": 0, "bytes_freed": 0}
+    last_id = 0
+    while True:
+        with engine.connect() as conn:
+            rows = conn.execute(select(table.c.id, table.c.response).where(
+                table.c.id > last_id, table.c.response.isnot(None)
+            ).order_by(table.c.id).limit(batch_size)).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+        counts["scanned"] += len(rows)
+
+        by_template = defaultdict(list)
+        for row in rows:
+            reference = resolve_response(row.response)
+            if reference is not None:
+                by_template[get_or_create_response_template(*reference, row.response)].append(row.id)
+                counts["bytes_freed"] += len(row.response.encode("utf-8"))
+        if by_template:
+            with engine.begin() as conn:
+                for template_id, ids in by_template.items():
+                    counts["compacted"] += conn.execute(table.update().where(table.c.id.in_(ids)).values(
+                        response=None, response_template_id=template_id
+                    )).rowcount
+            time.sleep(pause)
+    return counts
+
+
+def response_storage_report(engine) -> Dict:
+    """Rows by storage form, verbatim reply bytes (and how many are canned) and the table size"""
+    table = Conversation.__table__
+    report = {"rows": 0, "template_rows": 0, "verbatim_rows": 0, "verbatim_bytes": 0,
+              "compactable_rows": 0, "compactable_bytes": 0}
+    with engine.connect() as conn:
+        report["rows"], report["template_rows"] = conn.execute(select(
+            func.count(), func.count(table.c.response_template_id)
+        )).one()
+        # One pass over distinct reply texts; each is resolved once however many rows repeat it
+        for response, count in conn.execute(select(table.c.response, func.count()).where(
+            table.c.response.isnot(None)
+        ).group_by(table.c.response)):
+            size = len(response.encode("utf-8")) * count
+            report["verbatim_rows"] += count
+            report["verbatim_bytes"] += size
+            if resolve_response(response) is not None:
+                report["compactable_rows"] += count
+                report["compactable_bytes"] += size
+        report["table_bytes"] = _table_bytes(conn)
+    return report
+
+
+def _table_bytes(conn) -> Optional[int]:
+    """On-disk size of conversations (MySQL: data + index pages, i.e. its buffer pool footprint)"""
+    try:
+        if conn.dialect.name == "mysql":
+            return int(conn.execute(text(
+                "SELECT data_length + index_length FROM information_schema.TABLES "
+                "WHERE table_schema = DATABASE() AND table_name = 'conversations'"
+            )).scalar())
+        if conn.dialect.name == "sqlite":
+            return int(conn.execute(text(
+                "SELECT SUM(pgsize) FROM dbstat WHERE name = 'conversations'"
+            )).scalar())
+    except Exception as e:
+        logger.warning(f"Table size unavailable: {e}")
+    return None